@@ -15,6 +15,7 @@ export const historialService ={
     },
     getMovimientosInventario: async (filtros = {}) => {
         // filtros: { bodega, sucursal, producto, usuario, fecha_inicio, fecha_fin, tipo_movimiento, cantidad_min, cantidad_max, limit, offset }
+        // Scroll infinito: { paginacion: 'cursor' } en la primera página y luego { cursor: data.siguiente_cursor }
         const params = new URLSearchParams();
         Object.entries(filtros).forEach(([key, value]) => {
             if (value !== undefined && value !== null && value !== '') {
@@ -22,7 +23,7 @@ export const historialService ={
             }
         });
         const response = await api.get(`/movimientos-inventario/?${params.toString()}`);
-        return response.data; // Ahora retorna { movimientos, estadisticas, filtros_aplicados }
+        return response.data; // Ahora retorna { movimientos, estadisticas, filtros_aplicados } (+ siguiente_cursor, hay_mas en modo cursor)
     },
     getSolicitudes: async()=>{
         const response = await api.get('/solicitudes/');
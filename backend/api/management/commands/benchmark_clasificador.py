@@ -0,0 +1,62 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from api.utils.clasificador_productos import MARCAS, CATEGORIAS, ClasificadorProductos
+
+
+def clasificar_lineal(nombre, marcas, categorias):
+    """Implementación anterior (recorrido lineal con .lower() por elemento), solo como referencia."""
+    marca = ''
+    for m in marcas:
+        if m.lower() in nombre.lower():
+            marca = m
+            break
+    categoria = 'General'
+    for cat, palabras in categorias.items():
+        if any(palabra in nombre.lower() for palabra in palabras):
+            categoria = cat
+            break
+    return marca, categoria
+
+
+class Command(BaseCommand):
+    help = 'Compara el clasificador de marca/categoría compilado con el recorrido lineal anterior'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=20000, help='Cantidad de nombres a clasificar')
+        parser.add_argument('--marcas', type=int, default=500, help='Marcas sintéticas adicionales')
+        parser.add_argument('--categorias', type=int, default=200, help='Categorías sintéticas adicionales (5 palabras c/u)')
+
+    def handle(self, *args, **options):
+        aleatorio = random.Random(42)
+        marcas = MARCAS + [f'Marca{i:04d}' for i in range(options['marcas'])]
+        categorias = {categoria: list(palabras) for categoria, palabras in CATEGORIAS.items()}
+        for i in range(options['categorias']):
+            categorias[f'Categoría {i}'] = [f'pieza{i}x{j}' for j in range(5)]
+        palabras = [palabra for lista in categorias.values() for palabra in lista] + ['producto', 'repuesto', 'kit']
+        nombres = [
+            f'{aleatorio.choice(palabras).capitalize()} {aleatorio.choice(marcas + [""] * 50)} {aleatorio.randint(1, 900)}W'
+            for _ in range(options['filas'])
+        ]
+
+        inicio = time.perf_counter()
+        clasificador = ClasificadorProductos(marcas, categorias)
+        construccion = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        compilado = [clasificador.clasificar(nombre) for nombre in nombres]
+        tiempo_compilado = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        lineal = [clasificar_lineal(nombre, marcas, categorias) for nombre in nombres]
+        tiempo_lineal = time.perf_counter() - inicio
+
+        diferencias = sum(1 for a, b in zip(compilado, lineal) if a != b)
+        self.stdout.write(f'{len(nombres)} filas, {len(marcas)} marcas, {len(categorias)} categorías')
+        self.stdout.write(f'Construcción del clasificador: {construccion * 1000:.1f} ms')
+        self.stdout.write(f'Lineal:    {tiempo_lineal * 1000:.1f} ms ({tiempo_lineal / len(nombres) * 1e6:.1f} µs/fila)')
+        self.stdout.write(f'Compilado: {tiempo_compilado * 1000:.1f} ms ({tiempo_compilado / len(nombres) * 1e6:.1f} µs/fila)')
+        self.stdout.write(self.style.SUCCESS(
+            f'Aceleración: x{tiempo_lineal / tiempo_compilado:.1f}; resultados distintos: {diferencias}'
+        ))
@@ -0,0 +1,46 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from api.utils.pdf_guias import extraer_guia_pdf
+
+
+class Command(BaseCommand):
+    help = 'Mide el tiempo de extracción de guías de despacho en PDF sobre un conjunto de archivos de ejemplo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('rutas', nargs='+', help='Archivos PDF o directorios con guías de ejemplo')
+        parser.add_argument('--repeticiones', type=int, default=3, help='Veces que se procesa cada archivo')
+
+    def handle(self, *args, **options):
+        archivos = []
+        for ruta in options['rutas']:
+            ruta = Path(ruta)
+            if ruta.is_dir():
+                archivos.extend(sorted(ruta.glob('**/*.pdf')))
+            elif ruta.is_file():
+                archivos.append(ruta)
+        if not archivos:
+            raise CommandError('No se encontraron archivos PDF')
+
+        repeticiones = max(options['repeticiones'], 1)
+        total = 0.0
+        for archivo in archivos:
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                resultado = extraer_guia_pdf(str(archivo))
+                tiempos.append(time.perf_counter() - inicio)
+            mejor = min(tiempos) * 1000
+            promedio = sum(tiempos) / len(tiempos) * 1000
+            total += sum(tiempos)
+            self.stdout.write(
+                f'{archivo.name}: {resultado["resumen"]["total_productos"]} productos, '
+                f'{len(resultado["resumen"]["campos_extraidos"])} campos | '
+                f'mejor {mejor:.1f} ms, promedio {promedio:.1f} ms'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(archivos)} archivos x {repeticiones}: {total:.2f} s en total, '
+            f'{total / (len(archivos) * repeticiones) * 1000:.1f} ms por archivo'
+        ))
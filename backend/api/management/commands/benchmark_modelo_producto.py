@@ -0,0 +1,74 @@
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Productos
+from api.utils.modelo_producto import PATRONES_MODELO, extraer_modelo_desde_nombre, extraer_modelos
+
+
+def extraer_modelo_secuencial(nombre):
+    """Implementación anterior (nueve re.search sin compilar, uno tras otro), solo como referencia."""
+    for patron in PATRONES_MODELO:
+        match = re.search(patron, nombre, re.IGNORECASE)
+        if match:
+            return match.group(0).replace(' ', '').upper()
+    return 'GEN'
+
+
+def nombres_sinteticos(cantidad, aleatorio):
+    productos = ['Taladro', 'Martillo', 'Cable', 'Pintura', 'Tornillo', 'Guantes', 'Llave', 'Broca', 'Sierra', 'Manguera', 'Tubo PVC', 'Cinta']
+    marcas = ['Bosch', 'Stanley', 'Makita', 'Truper', 'Dewalt', '3M', '']
+    variantes = ['10m', '500 ml', '2L', '500W', '220V', '1HP', '1/2"', '16mm', "10''", '5 kg', '3 panel', '2 ton', '8 cc', '12x30',
+                 'rojo', 'Acero', 'industrial', 'Pequeño', 'N° 3', '', '', '']
+    return [
+        ' '.join(filter(None, [aleatorio.choice(productos), aleatorio.choice(marcas), aleatorio.choice(variantes), aleatorio.choice(variantes)]))
+        for _ in range(cantidad)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Compara el extractor de modelo precompilado con los nueve patrones secuenciales anteriores'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=300000, help='Cantidad de nombres a procesar')
+        parser.add_argument('--archivo', help='Archivo de texto con un nombre de producto por línea')
+        parser.add_argument('--desde-bd', action='store_true', help='Usar los nombres de productos de la base de datos')
+
+    def handle(self, *args, **options):
+        aleatorio = random.Random(42)
+        if options['archivo']:
+            with open(options['archivo'], encoding='utf-8') as archivo:
+                base = [linea.strip() for linea in archivo if linea.strip()]
+        elif options['desde_bd']:
+            base = list(Productos.objects.values_list('nombre_prodc', flat=True))
+        else:
+            base = nombres_sinteticos(options['filas'], aleatorio)
+        if not base:
+            raise CommandError('No hay nombres de productos para el benchmark')
+        # Nombres reales repetidos hasta completar las filas (como las líneas de varias guías)
+        nombres = [base[i % len(base)] for i in range(options['filas'])]
+
+        inicio = time.perf_counter()
+        secuencial = [extraer_modelo_secuencial(nombre) for nombre in nombres]
+        tiempo_secuencial = time.perf_counter() - inicio
+
+        extraer_modelo_desde_nombre.cache_clear()
+        inicio = time.perf_counter()
+        compilado = [extraer_modelo_desde_nombre.__wrapped__(nombre) for nombre in nombres]
+        tiempo_compilado = time.perf_counter() - inicio
+
+        extraer_modelo_desde_nombre.cache_clear()
+        inicio = time.perf_counter()
+        por_lotes = extraer_modelos(nombres)
+        tiempo_lotes = time.perf_counter() - inicio
+
+        diferencias = sum(1 for a, b, c in zip(secuencial, compilado, por_lotes) if not a == b == c)
+        self.stdout.write(f'{len(nombres)} filas ({len(set(nombres))} nombres distintos)')
+        self.stdout.write(f'Secuencial: {tiempo_secuencial * 1000:.1f} ms ({tiempo_secuencial / len(nombres) * 1e6:.2f} µs/fila)')
+        self.stdout.write(f'Compilado:  {tiempo_compilado * 1000:.1f} ms ({tiempo_compilado / len(nombres) * 1e6:.2f} µs/fila, sin cache)')
+        self.stdout.write(f'Por lotes:  {tiempo_lotes * 1000:.1f} ms ({tiempo_lotes / len(nombres) * 1e6:.2f} µs/fila)')
+        self.stdout.write(self.style.SUCCESS(
+            f'Aceleración: x{tiempo_secuencial / tiempo_compilado:.1f} (compilado), '
+            f'x{tiempo_secuencial / tiempo_lotes:.1f} (por lotes); resultados distintos: {diferencias}'
+        ))
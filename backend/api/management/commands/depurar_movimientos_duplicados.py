@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min
+from api.models import MovInventario
+
+
+class Command(BaseCommand):
+    help = (
+        'Elimina los movimientos de inventario duplicados (mismo producto, cantidad, fecha, usuario y motivo), '
+        'conservando el más antiguo de cada grupo. Se ejecuta una sola vez: los movimientos nuevos usan clave_idempotencia.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Cantidad de movimientos eliminados por lote')
+        parser.add_argument('--dry-run', action='store_true', help='Solo informa cuántos duplicados hay, sin eliminarlos')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        grupos = MovInventario.objects.values(
+            'productos_fk', 'cantidad', 'fecha', 'usuario_fk', 'motivo'
+        ).annotate(
+            min_id=Min('id_mvin'), total=Count('id_mvin')
+        ).filter(total__gt=1).order_by()
+
+        ids_a_eliminar = []
+        for grupo in grupos.iterator():
+            duplicados = MovInventario.objects.filter(
+                productos_fk=grupo['productos_fk'],
+                cantidad=grupo['cantidad'],
+                fecha=grupo['fecha'],
+                usuario_fk=grupo['usuario_fk'],
+                motivo=grupo['motivo'],
+                id_mvin__gt=grupo['min_id'],
+            ).values_list('id_mvin', flat=True)
+            ids_a_eliminar.extend(duplicados)
+
+        if options['dry_run']:
+            self.stdout.write(f'Movimientos duplicados encontrados: {len(ids_a_eliminar)}')
+            return
+
+        eliminados = 0
+        for inicio in range(0, len(ids_a_eliminar), batch_size):
+            lote = ids_a_eliminar[inicio:inicio + batch_size]
+            with transaction.atomic():
+                eliminados += MovInventario.objects.filter(id_mvin__in=lote).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f'Movimientos duplicados eliminados: {eliminados}'))
+        if eliminados:
+            self.stdout.write('Ejecute recalcular_saldos_movimientos --todos para recalcular los saldos del historial.')
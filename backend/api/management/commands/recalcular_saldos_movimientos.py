@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from api.models import MovInventario
+
+
+class Command(BaseCommand):
+    help = 'Calcula y guarda stock_antes/stock_despues de los movimientos de inventario existentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Cantidad de movimientos por actualización')
+        parser.add_argument('--todos', action='store_true', help='Recalcula también los movimientos que ya tienen saldo')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        solo_pendientes = not options['todos']
+
+        # Se recorre cada ubicación (stock_fk) desde el movimiento más reciente hacia atrás,
+        # partiendo del stock actual, igual que el cálculo que hacía el serializer.
+        movimientos = (
+            MovInventario.objects.filter(stock_fk__isnull=False)
+            .select_related('stock_fk')
+            .order_by('stock_fk', '-fecha', '-id_mvin')
+            .only('id_mvin', 'cantidad', 'stock_antes', 'stock_despues', 'stock_fk__stock')
+        )
+
+        pendientes = []
+        actualizados = 0
+        stock_actual_id = None
+        stock_acumulado = 0
+        for mov in movimientos.iterator(chunk_size=batch_size):
+            if mov.stock_fk_id != stock_actual_id:
+                stock_actual_id = mov.stock_fk_id
+                stock_acumulado = mov.stock_fk.stock or 0
+            stock_despues = stock_acumulado
+            stock_antes = stock_despues - mov.cantidad
+            stock_acumulado = stock_antes
+
+            if solo_pendientes and mov.stock_antes is not None and mov.stock_despues is not None:
+                continue
+            mov.stock_antes = stock_antes
+            mov.stock_despues = stock_despues
+            pendientes.append(mov)
+            if len(pendientes) >= batch_size:
+                MovInventario.objects.bulk_update(pendientes, ['stock_antes', 'stock_despues'])
+                actualizados += len(pendientes)
+                pendientes = []
+
+        if pendientes:
+            MovInventario.objects.bulk_update(pendientes, ['stock_antes', 'stock_despues'])
+            actualizados += len(pendientes)
+
+        self.stdout.write(self.style.SUCCESS(f'Saldos calculados para {actualizados} movimientos'))
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_alter_pedidos_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movinventario',
+            name='stock_antes',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='movinventario',
+            name='stock_despues',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        # mov_inventario no es administrada por Django: las columnas se agregan explícitamente
+        migrations.RunSQL(
+            sql=(
+                "ALTER TABLE mov_inventario "
+                "ADD COLUMN IF NOT EXISTS stock_antes numeric(10, 2) NULL, "
+                "ADD COLUMN IF NOT EXISTS stock_despues numeric(10, 2) NULL;"
+            ),
+            reverse_sql=(
+                "ALTER TABLE mov_inventario "
+                "DROP COLUMN IF EXISTS stock_antes, "
+                "DROP COLUMN IF EXISTS stock_despues;"
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_movinventario_saldos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movinventario',
+            name='clave_idempotencia',
+            field=models.CharField(blank=True, max_length=150, null=True, unique=True),
+        ),
+        # mov_inventario no es administrada por Django: columna e índice único se crean explícitamente.
+        # Los movimientos antiguos quedan con NULL, que no participa de la restricción.
+        migrations.RunSQL(
+            sql=[
+                "ALTER TABLE mov_inventario ADD COLUMN IF NOT EXISTS clave_idempotencia varchar(150) NULL;",
+                "CREATE UNIQUE INDEX IF NOT EXISTS mov_inventario_clave_idempotencia_uniq "
+                "ON mov_inventario (clave_idempotencia) WHERE clave_idempotencia IS NOT NULL;",
+            ],
+            reverse_sql=[
+                "DROP INDEX IF EXISTS mov_inventario_clave_idempotencia_uniq;",
+                "ALTER TABLE mov_inventario DROP COLUMN IF EXISTS clave_idempotencia;",
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_movinventario_clave_idempotencia'),
+    ]
+
+    # pedidos no es administrada por Django: índice de expresión sobre la guía normalizada
+    # (mismo criterio que crear_ingreso_bodega: NULLIF(UPPER(TRIM(num_guia_despacho)), '')) por bodega.
+    # Las guías vacías quedan en NULL, por lo que no chocan entre sí.
+    # Si ya existen guías duplicadas la migración falla con el detalle de las guías: se deben
+    # depurar y volver a ejecutarla (un índice sin UNIQUE no evitaría nuevos duplicados).
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                DO $$
+                DECLARE
+                    duplicadas text;
+                BEGIN
+                    SELECT string_agg(format('bodega %s: %s (%s pedidos)', bodega_fk_id, guia, cantidad), '; ')
+                    INTO duplicadas
+                    FROM (
+                        SELECT bodega_fk_id, upper(btrim(num_guia_despacho)) AS guia, count(*) AS cantidad
+                        FROM pedidos
+                        WHERE nullif(upper(btrim(num_guia_despacho)), '') IS NOT NULL
+                        GROUP BY bodega_fk_id, upper(btrim(num_guia_despacho))
+                        HAVING count(*) > 1
+                    ) AS repetidas;
+                    IF duplicadas IS NOT NULL THEN
+                        RAISE EXCEPTION 'No se puede crear idx_pedidos_guia_bodega_norm: hay guías de despacho duplicadas'
+                            USING DETAIL = duplicadas,
+                                  HINT = 'Corrija num_guia_despacho de los pedidos repetidos y vuelva a ejecutar migrate.';
+                    END IF;
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_pedidos_guia_bodega_norm
+                        ON pedidos (bodega_fk_id, nullif(upper(btrim(num_guia_despacho)), ''));
+                END
+                $$;
+            """,
+            reverse_sql="DROP INDEX IF EXISTS idx_pedidos_guia_bodega_norm;",
+        ),
+    ]
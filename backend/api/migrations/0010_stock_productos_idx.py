@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_pedidos_guia_normalizada_idx'),
+    ]
+
+    # stock no es administrada por Django: el escaneo (producto_por_codigo) une productos con
+    # todas sus filas de stock, por lo que la FK necesita su índice (Postgres no lo crea solo).
+    operations = [
+        migrations.RunSQL(
+            sql="CREATE INDEX IF NOT EXISTS idx_stock_productos_fk ON stock (productos_fk);",
+            reverse_sql="DROP INDEX IF EXISTS idx_stock_productos_fk;",
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_stock_productos_idx'),
+    ]
+
+    # productos no es administrada por Django: índices de trigramas (pg_trgm) para la búsqueda
+    # aproximada de api/utils/busqueda_productos.py (operador % sobre nombre y código).
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+                "CREATE INDEX IF NOT EXISTS idx_productos_nombre_trgm ON productos USING gin (nombre_prodc gin_trgm_ops);",
+                "CREATE INDEX IF NOT EXISTS idx_productos_codigo_trgm ON productos USING gin (codigo_interno gin_trgm_ops);",
+            ],
+            reverse_sql=[
+                "DROP INDEX IF EXISTS idx_productos_codigo_trgm;",
+                "DROP INDEX IF EXISTS idx_productos_nombre_trgm;",
+            ],
+        ),
+    ]
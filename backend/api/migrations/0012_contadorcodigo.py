@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_productos_trigramas'),
+    ]
+
+    # Correlativos de los códigos únicos por prefijo y mes (api/utils/codigos.py), comunes a todas las
+    # ubicaciones porque codigo_interno es único en toda la tabla de productos.
+    # Los contadores se crean al primer uso, partiendo del último correlativo ya existente en productos.
+    operations = [
+        migrations.CreateModel(
+            name='ContadorCodigo',
+            fields=[
+                ('id_contador', models.BigAutoField(primary_key=True, serialize=False)),
+                ('prefijo', models.CharField(max_length=255)),
+                ('periodo', models.CharField(max_length=6)),
+                ('ultimo', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'contador_codigo',
+                'managed': True,
+                'constraints': [models.UniqueConstraint(fields=('prefijo', 'periodo'), name='contador_codigo_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_contadorcodigo'),
+    ]
+
+    # Estados de las extracciones asíncronas de PDF (api/utils/trabajos_pdf.py). Antes se guardaban
+    # en el cache de Django, que sin CACHES configurado es memoria local de cada worker.
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoExtraccionPDF',
+            fields=[
+                ('id_trabajo', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('estado', models.CharField(max_length=20)),
+                ('archivo', models.CharField(blank=True, default='', max_length=255)),
+                ('inicio', models.DateTimeField(db_index=True)),
+                ('en_proceso_desde', models.DateTimeField(null=True)),
+                ('fin', models.DateTimeField(null=True)),
+                ('resultado', models.JSONField(null=True)),
+                ('error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'db_table': 'trabajo_extraccion_pdf',
+                'managed': True,
+            },
+        ),
+    ]
@@ -1,3 +1,4 @@
+from decimal import Decimal
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 
@@ -158,6 +159,25 @@ class Productos(models.Model):
     def __str__(self):
         return self.nombre_prodc
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Código leído de la BD: permite invalidar el QR guardado si el código cambia
+        instancia._codigo_original = instancia.codigo_interno if 'codigo_interno' in field_names else None
+        return instancia
+
+    def save(self, *args, **kwargs):
+        from api.utils.qr import eliminar_qr  # Importación local para evitar circularidad
+        from api.utils.cache_escaneo import cache_escaneo
+        from api.utils.indice_catalogo import indice_catalogo
+        codigo_anterior = getattr(self, '_codigo_original', None)
+        super().save(*args, **kwargs)
+        self._codigo_original = self.codigo_interno
+        cache_escaneo.invalidar(codigos=(codigo_anterior, self.codigo_interno))
+        indice_catalogo.registrar(self)
+        if codigo_anterior and codigo_anterior != self.codigo_interno:
+            eliminar_qr(codigo_anterior)
+
 class Proveedor(models.Model):
     id_provd = models.BigAutoField(primary_key=True)
     nombres_provd = models.CharField(max_length=255)
@@ -287,65 +307,22 @@ class Stock(models.Model):
     def id(self):
         return self.id_stock
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Valor leído de la BD: permite detectar cruces de umbral sin volver a consultar
+        instancia._stock_original = float(instancia.stock) if 'stock' in field_names and instancia.stock is not None else None
+        return instancia
+
     def save(self, *args, **kwargs):
-        from api.utils.notificaciones import crear_notificacion  # Importación local para evitar circularidad
-        from api.models import Usuario, BodegaCentral, Sucursal, Productos, Notificacion
-        # Obtener valores anteriores
-        if self.pk:
-            try:
-                prev = Stock.objects.get(pk=self.pk)
-                prev_stock = float(prev.stock)
-            except Stock.DoesNotExist:
-                prev_stock = None
-        else:
-            prev_stock = None
-        stock_actual = float(self.stock)
-        stock_min = float(self.stock_minimo) if self.stock_minimo is not None else 0
-        stock_max = float(self.stock_maximo) if self.stock_maximo is not None else None
-        producto = self.productos_fk
+        from api.utils.alertas_stock import detectar_alertas_stock, encolar_alertas_stock  # Importación local para evitar circularidad
+        from api.utils.cache_escaneo import cache_escaneo
+        prev_stock = getattr(self, '_stock_original', None) if self.pk else None
         super().save(*args, **kwargs)
-        # Notificar si stock cruza el mínimo (de normal a crítico)
-        if prev_stock is not None and prev_stock > stock_min and stock_actual <= stock_min:
-            if self.bodega_fk:
-                usuarios = Usuario.objects.filter(bodeg_fk=self.bodega_fk)
-                ubicacion = BodegaCentral.objects.filter(id_bdg=self.bodega_fk).first()
-                ubicacion_nombre = ubicacion.nombre_bdg if ubicacion else 'Bodega'
-            elif self.sucursal_fk:
-                usuarios = Usuario.objects.filter(sucursal_fk=self.sucursal_fk)
-                ubicacion = Sucursal.objects.filter(id=self.sucursal_fk).first()
-                ubicacion_nombre = ubicacion.nombre_sucursal if ubicacion else 'Sucursal'
-            else:
-                usuarios = []
-                ubicacion_nombre = 'Ubicación desconocida'
-            for usuario in usuarios:
-                crear_notificacion(
-                    usuario=usuario,
-                    nombre=f"Stock crítico: {producto.nombre_prodc}",
-                    descripcion=f"El stock del producto '{producto.nombre_prodc}' en {ubicacion_nombre} está en {stock_actual} (mínimo: {stock_min})",
-                    tipo="error",
-                    producto=producto
-                )
-        # Notificar si stock cruza el máximo (de normal a máximo)
-        if stock_max is not None and prev_stock is not None and prev_stock < stock_max and stock_actual >= stock_max:
-            if self.bodega_fk:
-                usuarios = Usuario.objects.filter(bodeg_fk=self.bodega_fk)
-                ubicacion = BodegaCentral.objects.filter(id_bdg=self.bodega_fk).first()
-                ubicacion_nombre = ubicacion.nombre_bdg if ubicacion else 'Bodega'
-            elif self.sucursal_fk:
-                usuarios = Usuario.objects.filter(sucursal_fk=self.sucursal_fk)
-                ubicacion = Sucursal.objects.filter(id=self.sucursal_fk).first()
-                ubicacion_nombre = ubicacion.nombre_sucursal if ubicacion else 'Sucursal'
-            else:
-                usuarios = []
-                ubicacion_nombre = 'Ubicación desconocida'
-            for usuario in usuarios:
-                crear_notificacion(
-                    usuario=usuario,
-                    nombre=f"Stock máximo superado: {producto.nombre_prodc}",
-                    descripcion=f"El stock del producto '{producto.nombre_prodc}' en {ubicacion_nombre} está en {stock_actual} (máximo: {stock_max})",
-                    tipo="warning",
-                    producto=producto
-                )
+        self._stock_original = float(self.stock)
+        cache_escaneo.invalidar(productos_ids=(self.productos_fk_id,))
+        # Las notificaciones de stock crítico/máximo se generan por lotes fuera de la petición
+        encolar_alertas_stock(detectar_alertas_stock(self, prev_stock))
 
 class MovInventario(models.Model):
     id_mvin = models.BigAutoField(primary_key=True)
@@ -355,6 +332,11 @@ class MovInventario(models.Model):
     usuario_fk = models.ForeignKey(Usuario, on_delete=models.CASCADE, db_column='usuario_fk')
     motivo = models.TextField(null=True, blank=True)
     stock_fk = models.ForeignKey(Stock, null=True, blank=True, on_delete=models.SET_NULL, db_column='stock_fk')
+    # Saldo de la ubicación (stock_fk) antes y después del movimiento, persistido al crear el registro
+    stock_antes = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    stock_despues = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Identifica la operación que originó el movimiento (ej. 'recepcion:<pedido>:<detalle>') para no registrarla dos veces
+    clave_idempotencia = models.CharField(max_length=150, unique=True, null=True, blank=True)
 
     class Meta:
         db_table = 'mov_inventario'
@@ -364,6 +346,22 @@ class MovInventario(models.Model):
     def id(self):
         return self.id_mvin
 
+    def calcular_saldos(self):
+        """
+        Completa stock_antes/stock_despues si no fueron indicados.
+        Se asume que stock_fk ya tiene aplicado el movimiento (mismo criterio que el
+        recálculo del historial: saldo después = stock de la ubicación).
+        """
+        if self.stock_despues is None and self.stock_fk is not None and self.stock_fk.stock is not None:
+            self.stock_despues = Decimal(str(self.stock_fk.stock))
+        if self.stock_antes is None and self.stock_despues is not None:
+            self.stock_antes = Decimal(str(self.stock_despues)) - Decimal(int(self.cantidad))
+
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            self.calcular_saldos()
+        super().save(*args, **kwargs)
+
     @property
     def ubicacion_nombre(self):
         if self.stock_fk:
@@ -503,4 +501,40 @@ class HistorialEstadoPedido(models.Model):
         managed = True
 
     def __str__(self):
-        return f"Pedido {self.pedido_fk.id_p}: {self.estado_anterior} → {self.estado_nuevo} por {self.usuario_fk} en {self.fecha}"
\ No newline at end of file
+        return f"Pedido {self.pedido_fk.id_p}: {self.estado_anterior} → {self.estado_nuevo} por {self.usuario_fk} en {self.fecha}"
+
+class ContadorCodigo(models.Model):
+    """Último correlativo asignado a un prefijo de código único en un mes, común a todas las ubicaciones (api/utils/codigos.py)"""
+    id_contador = models.BigAutoField(primary_key=True)
+    prefijo = models.CharField(max_length=255)  # {CAT}-{MARCA}-{MODELO}
+    periodo = models.CharField(max_length=6)  # YYYYMM
+    ultimo = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'contador_codigo'
+        managed = True
+        constraints = [
+            models.UniqueConstraint(fields=['prefijo', 'periodo'], name='contador_codigo_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.prefijo}-{self.periodo}: {self.ultimo}"
+
+
+class TrabajoExtraccionPDF(models.Model):
+    """Estado de una extracción asíncrona de guía en PDF (api/utils/trabajos_pdf.py), visible desde cualquier worker"""
+    id_trabajo = models.CharField(max_length=32, primary_key=True)
+    estado = models.CharField(max_length=20)  # pendiente, completado o error
+    archivo = models.CharField(max_length=255, blank=True, default='')
+    inicio = models.DateTimeField(db_index=True)  # Al encolarse
+    en_proceso_desde = models.DateTimeField(null=True)  # Cuando un proceso del pool lo toma
+    fin = models.DateTimeField(null=True)
+    resultado = models.JSONField(null=True)
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        db_table = 'trabajo_extraccion_pdf'
+        managed = True
+
+    def __str__(self):
+        return f"{self.id_trabajo} ({self.estado})"
@@ -7,6 +7,8 @@ from .models import (
     PersonalEntrega, Productos, Proveedor, Rol, Solicitudes, Stock, Sucursal, Usuario, Stock, SolicitudProductos, UsuarioNotificacion,
     HistorialEstadoPedido
 )
+from django.db import models
+from api.utils.stock import obtener_stocks_por_producto
 import random
 import re
 
@@ -167,47 +169,41 @@ class MovInventarioSerializer(serializers.ModelSerializer):
 
     def get_stock_antes(self, obj):
         """
-        Calcula el stock antes del movimiento SOLO considerando la ubicación (stock_fk).
+        Stock de la ubicación (stock_fk) antes del movimiento.
+        Usa el saldo persistido; solo recalcula desde el historial si el registro aún no fue migrado.
         """
-        try:
-            from api.models import MovInventario
-            movimientos = MovInventario.objects.filter(
-                productos_fk=obj.productos_fk,
-                stock_fk=obj.stock_fk
-            ).order_by('-fecha', '-id_mvin')
-            stock_actual = float(obj.stock_fk.stock) if obj.stock_fk and hasattr(obj.stock_fk, 'stock') else 0
-            stock_acumulado = stock_actual
-            for mov in movimientos:
-                if mov.id_mvin == obj.id_mvin:
-                    stock_despues = stock_acumulado
-                    stock_antes = stock_despues - mov.cantidad
-                    return stock_antes
-                stock_acumulado -= mov.cantidad
-            return 0
-        except Exception as e:
-            print(f"Error calculando stock antes (ubicación): {e}")
-            return 0
+        if obj.stock_antes is not None:
+            return float(obj.stock_antes)
+        saldo = self._saldo_desde_historial(obj)
+        return saldo - obj.cantidad if saldo is not None else 0
 
     def get_stock_despues(self, obj):
         """
-        Calcula el stock después del movimiento SOLO considerando la ubicación (stock_fk).
+        Stock de la ubicación (stock_fk) después del movimiento.
+        Usa el saldo persistido; solo recalcula desde el historial si el registro aún no fue migrado.
         """
+        if obj.stock_despues is not None:
+            return float(obj.stock_despues)
+        saldo = self._saldo_desde_historial(obj)
+        return saldo if saldo is not None else 0
+
+    def _saldo_desde_historial(self, obj):
+        """Recalcula el stock después del movimiento recorriendo el historial de la ubicación"""
         try:
             from api.models import MovInventario
             movimientos = MovInventario.objects.filter(
                 productos_fk=obj.productos_fk,
                 stock_fk=obj.stock_fk
-            ).order_by('-fecha', '-id_mvin')
-            stock_actual = float(obj.stock_fk.stock) if obj.stock_fk and hasattr(obj.stock_fk, 'stock') else 0
-            stock_acumulado = stock_actual
-            for mov in movimientos:
-                if mov.id_mvin == obj.id_mvin:
+            ).order_by('-fecha', '-id_mvin').values_list('id_mvin', 'cantidad')
+            stock_acumulado = float(obj.stock_fk.stock) if obj.stock_fk and hasattr(obj.stock_fk, 'stock') else 0
+            for id_mvin, cantidad in movimientos:
+                if id_mvin == obj.id_mvin:
                     return stock_acumulado
-                stock_acumulado -= mov.cantidad
-            return 0
+                stock_acumulado -= cantidad
+            return None
         except Exception as e:
-            print(f"Error calculando stock despues (ubicación): {e}")
-            return 0
+            print(f"Error calculando saldo del movimiento (ubicación): {e}")
+            return None
 
     def get_ubicacion(self, obj):
         """Obtiene la ubicación (bodega o sucursal) REAL del movimiento usando stock_fk"""
@@ -572,6 +568,19 @@ class PersonalEntregaSerializer(serializers.ModelSerializer):
         model = PersonalEntrega
         fields = '__all__'
 
+class ProductoListSerializer(serializers.ListSerializer):
+    """
+    Precarga en una sola consulta el stock de todos los productos de la respuesta,
+    evitando tres consultas a Stock por cada producto serializado.
+    """
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        productos = list(iterable)
+        if self.context.get('request'):
+            bodega_id, sucursal_id = self.child.ubicacion_solicitada()
+            self.child._stocks_precargados = obtener_stocks_por_producto(productos, bodega_id, sucursal_id)
+        return super().to_representation(productos)
+
 class ProductoSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(source='id_prodc', read_only=True)
     marca_nombre = serializers.CharField(source='marca_fk.nombre_mprod', read_only=True)
@@ -589,41 +598,41 @@ class ProductoSerializer(serializers.ModelSerializer):
     # Hacer la descripción opcional
     descripcion_prodc = serializers.CharField(required=False, allow_blank=True)
 
+    def ubicacion_solicitada(self):
+        """Retorna (bodega_id, sucursal_id) indicados en query params o en el body del request"""
+        request = self.context.get('request')
+        if not request:
+            return None, None
+        sucursal_id = request.query_params.get('sucursal_id') if hasattr(request, 'query_params') else None
+        bodega_id = request.query_params.get('bodega_id') if hasattr(request, 'query_params') else None
+        if (not sucursal_id or sucursal_id == '') and hasattr(request, 'data'):
+            sucursal_id = request.data.get('sucursal_id')
+        if (not bodega_id or bodega_id == '') and hasattr(request, 'data'):
+            bodega_id = request.data.get('bodega_id')
+        return bodega_id or None, sucursal_id or None
+
+    def _obtener_stock_obj(self, obj):
+        """
+        Obtiene el registro de Stock del producto para la ubicación solicitada.
+        En listados usa el stock precargado por ProductoListSerializer (una sola consulta
+        para toda la página); en objetos individuales consulta una vez y reutiliza el
+        resultado para stock, stock_minimo y stock_maximo.
+        """
+        precargados = getattr(self, '_stocks_precargados', None)
+        if precargados is not None:
+            return precargados.get(obj.id_prodc)
+        if not hasattr(self, '_stock_cache'):
+            self._stock_cache = {}
+        if obj.id_prodc not in self._stock_cache:
+            bodega_id, sucursal_id = self.ubicacion_solicitada()
+            self._stock_cache[obj.id_prodc] = obtener_stocks_por_producto([obj], bodega_id, sucursal_id).get(obj.id_prodc)
+        return self._stock_cache[obj.id_prodc]
+
     def get_stock(self, obj):
         try:
-            request = self.context.get('request')
-            if not request:
+            if not self.context.get('request'):
                 return 0
-            # Buscar sucursal_id y bodega_id en query params o en el body del request
-            sucursal_id = request.query_params.get('sucursal_id') if hasattr(request, 'query_params') else None
-            bodega_id = request.query_params.get('bodega_id') if hasattr(request, 'query_params') else None
-            if (not sucursal_id or sucursal_id == '') and hasattr(request, 'data'):
-                sucursal_id = request.data.get('sucursal_id')
-            if (not bodega_id or bodega_id == '') and hasattr(request, 'data'):
-                bodega_id = request.data.get('bodega_id')
-            if sucursal_id:
-                stock_obj = Stock.objects.filter(
-                    productos_fk=obj,
-                    sucursal_fk=sucursal_id
-                ).first()
-            elif bodega_id:
-                stock_obj = Stock.objects.filter(
-                    productos_fk=obj,
-                    bodega_fk=bodega_id
-                ).first()
-            else:
-                if obj.bodega_fk:
-                    stock_obj = Stock.objects.filter(
-                        productos_fk=obj,
-                        bodega_fk=obj.bodega_fk.id_bdg
-                    ).first()
-                elif obj.sucursal_fk:
-                    stock_obj = Stock.objects.filter(
-                        productos_fk=obj,
-                        sucursal_fk=obj.sucursal_fk.id
-                    ).first()
-                else:
-                    return 0
+            stock_obj = self._obtener_stock_obj(obj)
             return float(stock_obj.stock) if stock_obj else 0
         except Exception as e:
             print(f"Error en get_stock para producto {obj.id_prodc}: {str(e)}")
@@ -632,34 +641,9 @@ class ProductoSerializer(serializers.ModelSerializer):
     def get_stock_minimo(self, obj):
         """Obtiene el stock mínimo desde la tabla Stock"""
         try:
-            request = self.context.get('request')
-            if not request:
+            if not self.context.get('request'):
                 return 0
-            sucursal_id = request.query_params.get('sucursal_id')
-            bodega_id = request.query_params.get('bodega_id')
-            if sucursal_id:
-                stock_obj = Stock.objects.filter(
-                    productos_fk=obj,
-                    sucursal_fk=sucursal_id
-                ).first()
-            elif bodega_id:
-                stock_obj = Stock.objects.filter(
-                    productos_fk=obj,
-                    bodega_fk=bodega_id
-                ).first()
-            else:
-                if obj.bodega_fk:
-                    stock_obj = Stock.objects.filter(
-                        productos_fk=obj,
-                        bodega_fk=obj.bodega_fk.id_bdg
-                    ).first()
-                elif obj.sucursal_fk:
-                    stock_obj = Stock.objects.filter(
-                        productos_fk=obj,
-                        sucursal_fk=obj.sucursal_fk.id
-                    ).first()
-                else:
-                    return 0
+            stock_obj = self._obtener_stock_obj(obj)
             return float(stock_obj.stock_minimo) if stock_obj and stock_obj.stock_minimo is not None else 0
         except Exception as e:
             print(f"Error en get_stock_minimo para producto {obj.id_prodc}: {str(e)}")
@@ -668,34 +652,9 @@ class ProductoSerializer(serializers.ModelSerializer):
     def get_stock_maximo(self, obj):
         """Obtiene el stock máximo desde la tabla Stock"""
         try:
-            request = self.context.get('request')
-            if not request:
+            if not self.context.get('request'):
                 return 0
-            sucursal_id = request.query_params.get('sucursal_id')
-            bodega_id = request.query_params.get('bodega_id')
-            if sucursal_id:
-                stock_obj = Stock.objects.filter(
-                    productos_fk=obj,
-                    sucursal_fk=sucursal_id
-                ).first()
-            elif bodega_id:
-                stock_obj = Stock.objects.filter(
-                    productos_fk=obj,
-                    bodega_fk=bodega_id
-                ).first()
-            else:
-                if obj.bodega_fk:
-                    stock_obj = Stock.objects.filter(
-                        productos_fk=obj,
-                        bodega_fk=obj.bodega_fk.id_bdg
-                    ).first()
-                elif obj.sucursal_fk:
-                    stock_obj = Stock.objects.filter(
-                        productos_fk=obj,
-                        sucursal_fk=obj.sucursal_fk.id
-                    ).first()
-                else:
-                    return 0
+            stock_obj = self._obtener_stock_obj(obj)
             return float(stock_obj.stock_maximo) if stock_obj and stock_obj.stock_maximo is not None else 0
         except Exception as e:
             print(f"Error en get_stock_maximo para producto {obj.id_prodc}: {str(e)}")
@@ -711,6 +670,7 @@ class ProductoSerializer(serializers.ModelSerializer):
             'motivo'
         ]
         read_only_fields = ['id_prodc', 'fecha_creacion']
+        list_serializer_class = ProductoListSerializer
 
     def create(self, validated_data):
         # Validar unicidad de nombre y código (solo productos activos)
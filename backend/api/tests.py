@@ -1,11 +1,13 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.urls import reverse
-from .models import Pedidos, Proveedor, EstadoPedido, PersonalEntrega, Sucursal, BodegaCentral, Usuario, Productos, DetallePedido
+from .models import Pedidos, Proveedor, EstadoPedido, PersonalEntrega, Sucursal, BodegaCentral, Usuario, Productos, DetallePedido, Marca, Categoria, Stock, Rol, MovInventario, Notificacion, UsuarioNotificacion, Solicitudes, Historial
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.utils import timezone
 import datetime
+from io import StringIO
 
 class PedidosAPITestCase(TestCase):
     def setUp(self):
@@ -110,3 +112,1070 @@ class PedidosAPITestCase(TestCase):
         }
         response = self.client.post(url, data, format='json')
         self.assertIn(response.status_code, [status.HTTP_201_CREATED, status.HTTP_400_BAD_REQUEST])
+
+
+class ProductoStockPrefetchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.bodega = BodegaCentral.objects.create(id_bdg=1, nombre_bdg="Bodega Central", direccion="Calle Falsa 123", rut="12345678-9")
+        self.marca = Marca.objects.create(nombre_mprod="Bosch", descripcion_mprod="Marca Bosch")
+        self.categoria = Categoria.objects.create(nombre="Herramientas", descripcion="Herramientas eléctricas")
+        for i in range(5):
+            producto = Productos.objects.create(nombre_prodc=f"Taladro {i}", descripcion_prodc="Desc", codigo_interno=f"TAL-{i:03d}", fecha_creacion=timezone.now(), activo=True, marca_fk=self.marca, categoria_fk=self.categoria, bodega_fk=self.bodega)
+            Stock.objects.create(productos_fk=producto, bodega_fk=self.bodega.id_bdg, stock=10 + i, stock_minimo=2, stock_maximo=50)
+
+    def test_listar_productos_bodega_consultas_constantes(self):
+        url = reverse('producto-list')
+        # 1 consulta de productos (con marca/categoría/bodega/sucursal) + 1 consulta de stock para toda la página
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'bodega_id': self.bodega.id_bdg})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 5)
+        por_codigo = {p['codigo_interno']: p for p in response.data}
+        self.assertEqual(por_codigo['TAL-003']['stock'], 13.0)
+        self.assertEqual(por_codigo['TAL-003']['stock_minimo'], 2.0)
+        self.assertEqual(por_codigo['TAL-003']['stock_maximo'], 50.0)
+        self.assertEqual(por_codigo['TAL-003']['marca_nombre'], "Bosch")
+
+
+class MovInventarioSaldosTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.bodega = BodegaCentral.objects.create(id_bdg=1, nombre_bdg="Bodega Central", direccion="Calle Falsa 123", rut="12345678-9")
+        self.rol = Rol.objects.create(nombre_rol="bodega")
+        self.usuario = get_user_model().objects.create_user(correo="usuario@correo.com", contrasena="test1234", nombre="Usuario Test", rol_fk=self.rol, bodeg_fk=self.bodega)
+        self.marca = Marca.objects.create(nombre_mprod="Bosch", descripcion_mprod="Marca Bosch")
+        self.categoria = Categoria.objects.create(nombre="Herramientas", descripcion="Herramientas eléctricas")
+        self.producto = Productos.objects.create(nombre_prodc="Taladro", descripcion_prodc="Desc", codigo_interno="TAL-001", fecha_creacion=timezone.now(), activo=True, marca_fk=self.marca, categoria_fk=self.categoria, bodega_fk=self.bodega)
+        self.stock = Stock.objects.create(productos_fk=self.producto, bodega_fk=self.bodega.id_bdg, stock=10, stock_minimo=0, stock_maximo=100)
+        self.client.force_authenticate(user=self.usuario)
+
+    def test_actualizar_stock_guarda_saldos(self):
+        url = reverse('actualizar_stock_con_movimiento', args=[self.producto.id_prodc])
+        response = self.client.post(url, {'stock_write': 15, 'motivo': 'Ajuste'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mov = MovInventario.objects.get(productos_fk=self.producto)
+        self.assertEqual(mov.stock_antes, 10)
+        self.assertEqual(mov.stock_despues, 15)
+
+    def test_recalcular_saldos_movimientos_existentes(self):
+        ahora = timezone.now()
+        # bulk_create no pasa por save(), simulando movimientos previos sin saldo guardado
+        MovInventario.objects.bulk_create([
+            MovInventario(cantidad=4, fecha=ahora - datetime.timedelta(days=2), productos_fk=self.producto, usuario_fk=self.usuario, stock_fk=self.stock),
+            MovInventario(cantidad=-2, fecha=ahora - datetime.timedelta(days=1), productos_fk=self.producto, usuario_fk=self.usuario, stock_fk=self.stock),
+        ])
+        call_command('recalcular_saldos_movimientos', stdout=StringIO())
+        entrada, salida = MovInventario.objects.order_by('fecha')
+        self.assertEqual((entrada.stock_antes, entrada.stock_despues), (8, 12))
+        self.assertEqual((salida.stock_antes, salida.stock_despues), (12, 10))
+
+
+class MovimientosInventarioTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.bodega = BodegaCentral.objects.create(id_bdg=1, nombre_bdg="Bodega Central", direccion="Calle Falsa 123", rut="12345678-9")
+        self.rol = Rol.objects.create(nombre_rol="bodega")
+        self.usuario = get_user_model().objects.create_user(correo="usuario@correo.com", contrasena="test1234", nombre="Usuario Test", rol_fk=self.rol, bodeg_fk=self.bodega)
+        self.marca = Marca.objects.create(nombre_mprod="Bosch", descripcion_mprod="Marca Bosch")
+        self.categoria = Categoria.objects.create(nombre="Herramientas", descripcion="Herramientas eléctricas")
+        self.producto = Productos.objects.create(nombre_prodc="Taladro", descripcion_prodc="Desc", codigo_interno="TAL-001", fecha_creacion=timezone.now(), activo=True, marca_fk=self.marca, categoria_fk=self.categoria, bodega_fk=self.bodega)
+        self.stock = Stock.objects.create(productos_fk=self.producto, bodega_fk=self.bodega.id_bdg, stock=100, stock_minimo=0, stock_maximo=1000)
+        ahora = timezone.now()
+        for i, cantidad in enumerate([10, 5, -3, 0, -7, 20]):
+            MovInventario.objects.create(cantidad=cantidad, fecha=ahora - datetime.timedelta(minutes=i), productos_fk=self.producto, usuario_fk=self.usuario, stock_fk=self.stock, motivo=f"Movimiento {i}")
+        self.client.force_authenticate(user=self.usuario)
+
+    def test_estadisticas_en_una_consulta(self):
+        from .utils.movimientos import calcular_estadisticas_movimientos
+        with self.assertNumQueries(1):
+            estadisticas = calcular_estadisticas_movimientos(MovInventario.objects.all())
+        self.assertEqual(estadisticas['total_movimientos'], 6)
+        self.assertEqual(estadisticas['entradas'], 3)
+        self.assertEqual(estadisticas['salidas'], 2)
+        self.assertEqual(estadisticas['ajustes'], 1)
+        self.assertEqual(estadisticas['suma_entradas'], 35)
+        self.assertEqual(estadisticas['suma_salidas'], 10)
+
+    def test_listar_movimientos_con_estadisticas(self):
+        response = self.client.get(reverse('movimientos-inventario'), {'bodega': self.bodega.id_bdg})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['movimientos']), 6)
+        self.assertEqual(response.data['estadisticas']['total_movimientos'], 6)
+        self.assertEqual(response.data['estadisticas']['balance'], 25)
+
+    def test_paginacion_por_cursor(self):
+        url = reverse('movimientos-inventario')
+        response = self.client.get(url, {'bodega': self.bodega.id_bdg, 'paginacion': 'cursor', 'limit': 4})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['movimientos']), 4)
+        self.assertTrue(response.data['hay_mas'])
+        primeros = [m['id_mvin'] for m in response.data['movimientos']]
+
+        # Un movimiento nuevo no debe desplazar la segunda página
+        MovInventario.objects.create(cantidad=1, fecha=timezone.now(), productos_fk=self.producto, usuario_fk=self.usuario, stock_fk=self.stock, motivo="Nuevo")
+        response = self.client.get(url, {'bodega': self.bodega.id_bdg, 'cursor': response.data['siguiente_cursor'], 'limit': 4})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['movimientos']), 2)
+        self.assertFalse(response.data['hay_mas'])
+        self.assertIsNone(response.data['siguiente_cursor'])
+        self.assertFalse(set(primeros) & {m['id_mvin'] for m in response.data['movimientos']})
+
+    def test_registrar_movimiento_idempotente(self):
+        from .utils.movimientos import registrar_movimiento
+        campos = dict(cantidad=3, fecha=timezone.now(), productos_fk=self.producto, usuario_fk=self.usuario, stock_fk=self.stock, motivo="Reintento")
+        primero, creado = registrar_movimiento(clave_idempotencia='prueba:1', **campos)
+        self.assertTrue(creado)
+        repetido, creado = registrar_movimiento(clave_idempotencia='prueba:1', **campos)
+        self.assertFalse(creado)
+        self.assertEqual(primero.id_mvin, repetido.id_mvin)
+        self.assertEqual(MovInventario.objects.filter(motivo="Reintento").count(), 1)
+
+    def test_depurar_movimientos_duplicados(self):
+        original = MovInventario.objects.get(motivo="Movimiento 1")
+        MovInventario.objects.create(cantidad=original.cantidad, fecha=original.fecha, productos_fk=self.producto, usuario_fk=self.usuario, stock_fk=self.stock, motivo=original.motivo)
+        call_command('depurar_movimientos_duplicados', stdout=StringIO())
+        self.assertEqual(list(MovInventario.objects.filter(motivo="Movimiento 1").values_list('id_mvin', flat=True)), [original.id_mvin])
+        self.assertEqual(MovInventario.objects.count(), 6)
+
+    def test_cursor_invalido(self):
+        response = self.client.get(reverse('movimientos-inventario'), {'cursor': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_limit_invalido(self):
+        url = reverse('movimientos-inventario')
+        for parametros in ({'limit': 0}, {'limit': -1}, {'limit': 'diez'}, {'offset': -5}):
+            response = self.client.get(url, {'bodega': self.bodega.id_bdg, 'paginacion': 'cursor', **parametros})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, parametros)
+
+
+@override_settings(NOTIFICACIONES_STOCK_ASINCRONO=False)
+class AlertasStockTestCase(TestCase):
+    def setUp(self):
+        from .utils.alertas_stock import despachador_alertas_stock
+        self.despachador = despachador_alertas_stock
+        self.despachador.procesar_pendientes()
+        self.bodega = BodegaCentral.objects.create(id_bdg=1, nombre_bdg="Bodega Central", direccion="Calle Falsa 123", rut="12345678-9")
+        self.rol = Rol.objects.create(nombre_rol="bodega")
+        for i in range(2):
+            get_user_model().objects.create_user(correo=f"usuario{i}@correo.com", contrasena="test1234", nombre=f"Usuario {i}", rol_fk=self.rol, bodeg_fk=self.bodega)
+        self.marca = Marca.objects.create(nombre_mprod="Bosch", descripcion_mprod="Marca Bosch")
+        self.categoria = Categoria.objects.create(nombre="Herramientas", descripcion="Herramientas eléctricas")
+        self.producto = Productos.objects.create(nombre_prodc="Taladro", descripcion_prodc="Desc", codigo_interno="TAL-001", fecha_creacion=timezone.now(), activo=True, marca_fk=self.marca, categoria_fk=self.categoria, bodega_fk=self.bodega)
+        Stock.objects.create(productos_fk=self.producto, bodega_fk=self.bodega.id_bdg, stock=10, stock_minimo=5, stock_maximo=20)
+        self.stock = Stock.objects.get(productos_fk=self.producto)
+
+    def test_cruce_minimo_se_encola_sin_consultar_valor_anterior(self):
+        self.stock.stock = 4
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):
+                self.stock.save()
+        self.assertEqual(self.despachador.cola.qsize(), 1)
+        self.assertEqual(Notificacion.objects.count(), 0)
+
+        self.assertEqual(self.despachador.procesar_pendientes(), 2)
+        self.assertEqual(Notificacion.objects.filter(tipo="error").count(), 2)
+        self.assertEqual(UsuarioNotificacion.objects.count(), 2)
+
+    def test_sin_cruce_no_encola(self):
+        self.stock.stock = 12
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stock.save()
+        self.assertEqual(self.despachador.cola.qsize(), 0)
+
+    def test_crear_notificaciones_masivas_en_dos_inserts(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .utils.notificaciones import crear_notificaciones
+        usuarios = list(get_user_model().objects.all())
+        with CaptureQueriesContext(connection) as consultas:
+            crear_notificaciones(usuarios, nombre="Aviso", descripcion="Aviso masivo", tipo="info", producto=self.producto)
+        inserts = [q for q in consultas.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(UsuarioNotificacion.objects.filter(notificacion__nombre_ntf="Aviso").count(), len(usuarios))
+
+
+@override_settings(NOTIFICACIONES_STOCK_ASINCRONO=False)
+class ConfirmarRecepcionTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.bodega = BodegaCentral.objects.create(id_bdg=1, nombre_bdg="Bodega Central", direccion="Calle Falsa 123", rut="12345678-9")
+        self.sucursal = Sucursal.objects.create(id=1, nombre_sucursal="Sucursal Centro", direccion="Calle Real 456", descripcion="Sucursal principal", bodega_fk=self.bodega, rut="98765432-1")
+        self.rol = Rol.objects.create(nombre_rol="sucursal")
+        self.usuario = get_user_model().objects.create_user(correo="usuario@correo.com", contrasena="test1234", nombre="Usuario Test", rol_fk=self.rol, sucursal_fk=self.sucursal)
+        self.marca = Marca.objects.create(nombre_mprod="Bosch", descripcion_mprod="Marca Bosch")
+        self.categoria = Categoria.objects.create(nombre="Herramientas", descripcion="Herramientas eléctricas")
+        self.taladro = Productos.objects.create(nombre_prodc="Taladro", descripcion_prodc="Desc", codigo_interno="TAL-001", fecha_creacion=timezone.now(), activo=True, marca_fk=self.marca, categoria_fk=self.categoria, sucursal_fk=self.sucursal)
+        self.sierra = Productos.objects.create(nombre_prodc="Sierra", descripcion_prodc="Desc", codigo_interno="SIE-001", fecha_creacion=timezone.now(), activo=True, marca_fk=self.marca, categoria_fk=self.categoria, sucursal_fk=self.sucursal)
+        Stock.objects.create(productos_fk=self.taladro, sucursal_fk=self.sucursal.id, stock=10, stock_minimo=0, stock_maximo=1000)
+        en_camino = EstadoPedido.objects.create(nombre="En camino", descripcion="Pedido en tránsito")
+        personal = PersonalEntrega.objects.create(usuario_fk=self.usuario, nombre_psn="Juan Chofer", descripcion_psn="Transportista", patente="ABCD12")
+        solicitud = Solicitudes.objects.create(fecha_creacion=timezone.now(), fk_sucursal=self.sucursal, fk_bodega=self.bodega, usuarios_fk=self.usuario)
+        self.pedido = Pedidos.objects.create(descripcion="Pedido", fecha_entrega=timezone.now(), estado_pedido_fk=en_camino, sucursal_fk=self.sucursal, personal_entrega_fk=personal, usuario_fk=self.usuario, solicitud_fk=solicitud, bodega_fk=self.bodega)
+        for producto, cantidad in [(self.taladro, 5), (self.sierra, 3), (self.taladro, 2)]:
+            DetallePedido.objects.create(cantidad=cantidad, descripcion="Detalle", productos_pedido_fk=producto, pedidos_fk=self.pedido)
+        self.client.force_authenticate(user=self.usuario)
+
+    def test_recepcion_en_bloque(self):
+        response = self.client.post(reverse('pedido-confirmar-recepcion', args=[self.pedido.id_p]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('tiempo_procesamiento_ms', response.data)
+        self.assertEqual(Stock.objects.get(productos_fk=self.taladro, sucursal_fk=self.sucursal.id).stock, 17)
+        self.assertEqual(Stock.objects.get(productos_fk=self.sierra, sucursal_fk=self.sucursal.id).stock, 3)
+        saldos = list(MovInventario.objects.filter(productos_fk=self.taladro).order_by('id_mvin').values_list('stock_antes', 'stock_despues'))
+        self.assertEqual(saldos, [(10, 15), (15, 17)])
+        self.assertEqual(Historial.objects.filter(pedidos_fk=self.pedido).count(), 3)
+
+    def test_motor_no_repite_lineas_registradas(self):
+        from .utils.stock import aplicar_ingresos_stock
+        lineas = [{'producto': self.sierra, 'cantidad': 4, 'clave': 'recepcion:prueba:1'}]
+        aplicar_ingresos_stock(lineas, usuario=self.usuario, motivo="Ingreso", sucursal_id=self.sucursal.id)
+        self.assertEqual(aplicar_ingresos_stock(lineas, usuario=self.usuario, motivo="Ingreso", sucursal_id=self.sucursal.id), [])
+        self.assertEqual(Stock.objects.get(productos_fk=self.sierra).stock, 4)
+
+
+@override_settings(NOTIFICACIONES_STOCK_ASINCRONO=False)
+class IngresoBodegaEnBloqueTestCase(TestCase):
+    def setUp(self):
+        self.bodega = BodegaCentral.objects.create(id_bdg=1, nombre_bdg="Bodega Central", direccion="Calle Falsa 123", rut="12345678-9")
+        self.sucursal = Sucursal.objects.create(id=1, nombre_sucursal="Sucursal Centro", direccion="Calle Real 456", descripcion="Sucursal principal", bodega_fk=self.bodega, rut="98765432-1")
+        self.rol = Rol.objects.create(nombre_rol="bodega")
+        self.usuario = get_user_model().objects.create_user(correo="usuario@correo.com", contrasena="test1234", nombre="Usuario Test", rol_fk=self.rol, bodeg_fk=self.bodega)
+        self.proveedor = Proveedor.objects.create(nombres_provd="Proveedor Uno", direccion_provd="Av. Proveedor 100", correo="proveedor@correo.com", razon_social="Proveedor S.A.", rut_empresa=123456789)
+        self.marca = Marca.objects.create(nombre_mprod="Bosch", descripcion_mprod="Marca Bosch")
+        self.categoria = Categoria.objects.create(nombre="Herramientas", descripcion="Herramientas eléctricas")
+        self.taladro = Productos.objects.create(nombre_prodc="Taladro", descripcion_prodc="Desc", codigo_interno="TAL-001", fecha_creacion=timezone.now(), activo=True, marca_fk=self.marca, categoria_fk=self.categoria, bodega_fk=self.bodega)
+        Stock.objects.create(productos_fk=self.taladro, bodega_fk=self.bodega.id_bdg, stock=10, stock_minimo=0, stock_maximo=1000)
+        completado = EstadoPedido.objects.create(nombre="Completado", descripcion="Pedido recibido y completado")
+        self.personal = PersonalEntrega.objects.create(usuario_fk=self.usuario, nombre_psn="Juan Chofer", descripcion_psn="Transportista", patente="ABCD12")
+        self.solicitud = Solicitudes.objects.create(fecha_creacion=timezone.now(), fk_sucursal=self.sucursal, fk_bodega=self.bodega, usuarios_fk=self.usuario)
+        self.pedido = Pedidos.objects.create(descripcion="Ingreso", fecha_entrega=timezone.now(), estado_pedido_fk=completado, personal_entrega_fk=self.personal, usuario_fk=self.usuario, solicitud_fk=self.solicitud, bodega_fk=self.bodega, proveedor_fk=self.proveedor)
+        from .utils.indice_catalogo import indice_catalogo
+        indice_catalogo.limpiar()
+        self.addCleanup(indice_catalogo.limpiar)
+        indice_catalogo.precargar(bodega_id=self.bodega.id_bdg)
+
+    def _guia(self, cantidad_lineas, sufijo=''):
+        return [{'es_producto_existente': True, 'id': self.taladro.id_prodc, 'nombre': 'Taladro', 'cantidad': 2}] + [
+            {'nombre': f'Martillo {i}', 'marca': f'Stanley{sufijo}' if i % 2 else 'Bosch', 'categoria': f'{sufijo}Manuales', 'modelo': '', 'cantidad': 3}
+            for i in range(cantidad_lineas)
+        ]
+
+    def _contar_consultas(self, productos_data, pedido):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .views import procesar_ingreso_en_bloque
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = procesar_ingreso_en_bloque(productos_data, self.bodega, self.proveedor, self.usuario, pedido)
+        return resultado, len(consultas)
+
+    def test_ingreso_en_bloque(self):
+        guia = self._guia(4) + [{'nombre': 'Sin marca', 'marca': '', 'categoria': 'Manuales', 'cantidad': 1}]
+        resultado, _ = self._contar_consultas(guia, self.pedido)
+        self.assertEqual(len(resultado), 5)
+        self.assertEqual(resultado[0]['stock_actual'], 12)
+        self.assertFalse(resultado[0]['es_nuevo'])
+        codigos = [r['codigo_interno'] for r in resultado[1:]]
+        self.assertEqual(len(set(codigos)), 4)
+        self.assertTrue(Marca.objects.filter(nombre_mprod="Stanley").exists())
+        self.assertEqual(Marca.objects.filter(nombre_mprod="Bosch").count(), 1)
+        self.assertEqual(DetallePedido.objects.filter(pedidos_fk=self.pedido).count(), 5)
+        self.assertEqual(Historial.objects.filter(pedidos_fk=self.pedido).count(), 5)
+        self.assertEqual(MovInventario.objects.filter(clave_idempotencia__startswith=f'ingreso:{self.pedido.id_p}:').count(), 5)
+
+    def test_cantidades_no_numericas(self):
+        guia = [
+            {'es_producto_existente': True, 'id': self.taladro.id_prodc, 'nombre': 'Taladro', 'cantidad': "5"},
+            {'nombre': 'Martillo', 'marca': 'Stanley', 'categoria': 'Manuales', 'modelo': '', 'cantidad': "2.5"},
+            {'nombre': 'Serrucho', 'marca': 'Stanley', 'categoria': 'Manuales', 'modelo': '', 'cantidad': "tres"},
+            {'nombre': 'Alicate', 'marca': 'Stanley', 'categoria': 'Manuales', 'modelo': '', 'cantidad': None},
+        ]
+        resultado, _ = self._contar_consultas(guia, self.pedido)
+        # Las líneas con cantidad inválida se omiten sin abortar la guía
+        self.assertEqual([r['producto'] for r in resultado], ['Taladro', 'Martillo'])
+        self.assertEqual((resultado[0]['stock_actual'], resultado[1]['cantidad']), (15, 2.5))
+
+    def test_falla_a_mitad_del_ingreso_no_deja_nada(self):
+        from unittest import mock
+        from .models import ContadorCodigo
+        client = APIClient()
+        client.force_authenticate(user=self.usuario)
+        datos = {'fecha': '2026-10-18', 'bodega_id': self.bodega.id_bdg, 'num_guia_despacho': 'GD-900', 'productos': self._guia(2)}
+        pedidos = Pedidos.objects.count()
+
+        def crear_pedido(serializer):
+            # El esquema de pruebas exige personal y solicitud, que el ingreso de proveedor no informa
+            return Pedidos.objects.create(personal_entrega_fk=self.personal, solicitud_fk=self.solicitud, fecha_entrega=timezone.now(), **{
+                campo: serializer.validated_data[campo] for campo in ('descripcion', 'estado_pedido_fk', 'usuario_fk', 'bodega_fk', 'num_guia_despacho')
+            })
+
+        with mock.patch('api.views.PedidosCreateSerializer.save', crear_pedido), \
+                mock.patch.object(DetallePedido.objects, 'bulk_create', side_effect=RuntimeError("sin conexión")):
+            response = client.post(reverse('pedido-crear-ingreso-bodega'), datos, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Pedidos.objects.count(), pedidos)
+        self.assertFalse(Productos.objects.filter(nombre_prodc__startswith='Martillo').exists())
+        self.assertFalse(ContadorCodigo.objects.exists())
+        self.assertEqual(float(Stock.objects.get(productos_fk=self.taladro).stock), 10.0)
+
+    def test_consultas_no_crecen_con_las_lineas(self):
+        _, pocas = self._contar_consultas(self._guia(3, 'A'), self.pedido)
+        otro_pedido = Pedidos.objects.create(descripcion="Ingreso 2", fecha_entrega=timezone.now(), estado_pedido_fk=self.pedido.estado_pedido_fk, personal_entrega_fk=self.pedido.personal_entrega_fk, usuario_fk=self.usuario, solicitud_fk=self.pedido.solicitud_fk, bodega_fk=self.bodega, proveedor_fk=self.proveedor)
+        _, muchas = self._contar_consultas(self._guia(60, 'B'), otro_pedido)
+        self.assertEqual(pocas, muchas)
+
+    def test_guia_duplicada_normalizada(self):
+        self.pedido.num_guia_despacho = ' gd-100 '
+        self.pedido.save()
+        client = APIClient()
+        client.force_authenticate(user=self.usuario)
+        datos = {'fecha': '2026-10-18', 'bodega_id': self.bodega.id_bdg, 'num_guia_despacho': 'GD-100', 'productos': self._guia(1)}
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as consultas:
+            response = client.post(reverse('pedido-crear-ingreso-bodega'), datos, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # Solo la verificación indexada de la guía, sin cargar las guías existentes
+        self.assertEqual(len([q for q in consultas.captured_queries if q['sql'].startswith('SELECT')]), 1)
+        self.assertIn('guía de despacho', response.data['error'])
+
+    def test_guia_normalizada_igual_que_el_indice(self):
+        # TRIM de SQL no quita tabulaciones: la validación debe compararlas igual que el índice
+        self.pedido.num_guia_despacho = 'gd-200\t'
+        self.pedido.save()
+        client = APIClient()
+        client.force_authenticate(user=self.usuario)
+        datos = {'fecha': '2026-10-18', 'bodega_id': self.bodega.id_bdg, 'num_guia_despacho': ' GD-200\t', 'productos': self._guia(1)}
+        response = client.post(reverse('pedido-crear-ingreso-bodega'), datos, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('guía de despacho', response.data['error'])
+
+
+class ExtraccionGuiaPDFTestCase(SimpleTestCase):
+    def test_datos_cabecera(self):
+        from .utils.pdf_guias import datos_vacios, extraer_datos_cabecera
+        datos = datos_vacios()
+        lineas = ["GUÍA DE DESPACHO", "Proveedor: Ferretería Sur SpA", "R.U.T: 76.123.456-7", "Fecha de emisión: 12/10/2026", "Guía Nº: GD-5521", "Proveedor: Otro"]
+        self.assertFalse(extraer_datos_cabecera(lineas, datos))
+        self.assertEqual(datos['proveedor'], "Ferretería Sur SpA")
+        self.assertEqual(datos['rut'], "76123456-7")
+        self.assertEqual(datos['fecha'], "12/10/2026")
+        self.assertEqual(datos['num_guia'], "GD-5521")
+
+    def test_productos_desde_tabla(self):
+        from .utils.pdf_guias import productos_desde_tabla
+        tabla = [["Descripción", "Código", "Cantidad"], ["Taladro Bosch 500W", "T-1", "3"], [None, None, None], ["Guantes de cuero", "G-2", "x"]]
+        productos = productos_desde_tabla(tabla)
+        self.assertEqual(len(productos), 2)
+        self.assertEqual((productos[0]['marca'], productos[0]['categoria'], productos[0]['cantidad']), ("Bosch", "Herramientas eléctricas", 3))
+        self.assertEqual((productos[1]['marca'], productos[1]['categoria'], productos[1]['cantidad']), ("", "Seguridad industrial", 1))
+
+
+class ExtraccionPDFAsincronaTestCase(TransactionTestCase):
+    # TransactionTestCase: el resultado lo registra un hilo del pool con otra conexión a la BD
+    def setUp(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        self.client = APIClient()
+        self.rol = Rol.objects.create(nombre_rol="bodega")
+        self.usuario = get_user_model().objects.create_user(correo="usuario@correo.com", contrasena="test1234", nombre="Usuario Test", rol_fk=self.rol)
+        self.client.force_authenticate(user=self.usuario)
+        self.archivo = SimpleUploadedFile("guia.pdf", b"no es un pdf", content_type="application/pdf")
+
+    def test_trabajo_asincrono_informa_estado(self):
+        import time
+        response = self.client.post(reverse('extraer_productos_pdf'), {'archivo': self.archivo, 'modo': 'async'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        url_estado = response.data['url_estado']
+        for _ in range(300):
+            estado = self.client.get(url_estado)
+            if estado.data['estado'] != 'pendiente':
+                break
+            time.sleep(0.1)
+        self.assertEqual(estado.data['estado'], 'error')
+        self.assertEqual(estado.data['productos'], [])
+        # El proceso del pool avisó cuándo tomó el trabajo
+        from .models import TrabajoExtraccionPDF
+        for _ in range(50):
+            if TrabajoExtraccionPDF.objects.get(id_trabajo=response.data['trabajo_id']).en_proceso_desde:
+                break
+            time.sleep(0.1)
+        self.assertIsNotNone(TrabajoExtraccionPDF.objects.get(id_trabajo=response.data['trabajo_id']).en_proceso_desde)
+
+    def test_trabajo_inexistente(self):
+        response = self.client.get(reverse('estado_extraccion_pdf', args=['no-existe']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_estado_se_guarda_en_la_bd(self):
+        # Otro worker no comparte la memoria del proceso: el estado debe poder leerse desde la tabla
+        from .models import TrabajoExtraccionPDF
+        from .utils.trabajos_pdf import crear_trabajo_completado, obtener_trabajo
+        resultado = {'productos': [], 'datos': {}, 'resumen': {'total_productos': 0}}
+        trabajo_id = crear_trabajo_completado(resultado, 'guia.pdf')
+        trabajo = TrabajoExtraccionPDF.objects.get(id_trabajo=trabajo_id)
+        self.assertEqual((trabajo.estado, trabajo.resultado), ('completado', resultado))
+        self.assertEqual(obtener_trabajo(trabajo_id)['resultado'], resultado)
+
+    @override_settings(PDF_EXTRACCION_TIMEOUT_SEGUNDOS=1)
+    def test_timeout_se_mide_desde_que_el_proceso_toma_el_trabajo(self):
+        import datetime
+        from .models import TrabajoExtraccionPDF
+        from .utils.trabajos_pdf import _nuevo_trabajo, obtener_trabajo
+        trabajo_id = _nuevo_trabajo(estado='pendiente', archivo='guia.pdf')
+        hace_un_rato = timezone.now() - datetime.timedelta(minutes=5)
+        # Encolado hace rato detrás de otros PDFs: sigue pendiente
+        TrabajoExtraccionPDF.objects.filter(id_trabajo=trabajo_id).update(inicio=hace_un_rato)
+        self.assertEqual(obtener_trabajo(trabajo_id)['estado'], 'pendiente')
+        TrabajoExtraccionPDF.objects.filter(id_trabajo=trabajo_id).update(en_proceso_desde=timezone.now())
+        self.assertEqual(obtener_trabajo(trabajo_id)['estado'], 'pendiente')
+        TrabajoExtraccionPDF.objects.filter(id_trabajo=trabajo_id).update(en_proceso_desde=hace_un_rato)
+        self.assertEqual(obtener_trabajo(trabajo_id)['estado'], 'error')
+
+
+class CachePDFTestCase(TestCase):
+    def setUp(self):
+        import tempfile
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+
+    def test_guia_repetida_se_responde_desde_cache(self):
+        import hashlib
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .utils.cache_pdf import guardar_resultado
+        contenido = b"contenido de la guia"
+        resultado = {'productos': [{'nombre': 'Taladro'}], 'datos': {'proveedor': 'Sur'}, 'resumen': {'total_productos': 1}}
+        client = APIClient()
+        client.force_authenticate(user=get_user_model().objects.create_user(correo="usuario@correo.com", contrasena="test1234", nombre="Usuario Test", rol_fk=Rol.objects.create(nombre_rol="bodega")))
+        with override_settings(PDF_CACHE_DIR=self.directorio.name, PDF_CACHE_MAX_BYTES=1024 * 1024):
+            guardar_resultado(hashlib.sha256(contenido).hexdigest(), resultado)
+            response = client.post(reverse('extraer_productos_pdf'), {'archivo': SimpleUploadedFile("guia.pdf", contenido)}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, resultado)
+
+    def test_desalojo_por_tamano(self):
+        import os
+        from .utils.cache_pdf import guardar_resultado, obtener_resultado_cacheado
+        with override_settings(PDF_CACHE_DIR=self.directorio.name, PDF_CACHE_MAX_BYTES=250):
+            for i, clave in enumerate(['a', 'b', 'c']):
+                guardar_resultado(clave, {'productos': ['x' * 80]})
+                # Tiempos de uso distintos y crecientes
+                for nombre in os.listdir(self.directorio.name):
+                    if nombre.startswith(clave):
+                        os.utime(os.path.join(self.directorio.name, nombre), (1000 + i, 1000 + i))
+            guardar_resultado('d', {'productos': ['x' * 80]})
+            self.assertIsNone(obtener_resultado_cacheado('a'))
+            self.assertIsNotNone(obtener_resultado_cacheado('d'))
+
+    def test_clasificador_desde_bd_no_reutiliza_resultados_de_otras_listas(self):
+        from .utils import clasificador_productos
+        from .utils.cache_pdf import guardar_resultado, obtener_resultado_cacheado
+        resultado = {'productos': [{'nombre': 'Taladro Tramontina', 'marca': ''}]}
+        with override_settings(PDF_CACHE_DIR=self.directorio.name, PDF_CACHE_MAX_BYTES=1024 * 1024, PDF_CLASIFICADOR_DESDE_BD=True):
+            guardar_resultado('guia', resultado, clasificador_productos.CLASIFICADOR)
+            self.assertEqual(obtener_resultado_cacheado('guia', clasificador_productos.CLASIFICADOR), resultado)
+            # Una marca nueva cambia la clasificación: el resultado anterior ya no sirve
+            Marca.objects.create(nombre_mprod="Tramontina", descripcion_mprod="Marca Tramontina")
+            clasificador = clasificador_productos.clasificador_desde_bd()
+            self.assertIsNone(obtener_resultado_cacheado('guia', clasificador))
+            guardar_resultado('guia', {'productos': [{'nombre': 'Taladro Tramontina', 'marca': 'Tramontina'}]}, clasificador)
+            self.assertEqual(obtener_resultado_cacheado('guia', clasificador_productos.clasificador_desde_bd())['productos'][0]['marca'], 'Tramontina')
+            self.assertEqual(obtener_resultado_cacheado('guia', clasificador_productos.CLASIFICADOR), resultado)
+
+
+class ClasificadorProductosTestCase(TestCase):
+    def test_respeta_prioridad_de_las_listas(self):
+        from .utils.clasificador_productos import CLASIFICADOR
+        self.assertEqual(CLASIFICADOR.clasificar("Set Makita + Stanley martillo y taladro"), ("Stanley", "Herramientas manuales"))
+        self.assertEqual(CLASIFICADOR.clasificar("Hoja de sierra 24T"), ("", "Accesorios"))
+        self.assertEqual(CLASIFICADOR.clasificar("Producto sin clasificar"), ("", "General"))
+
+    def test_palabras_solapadas(self):
+        from .utils.clasificador_productos import CLASIFICADOR, ClasificadorProductos
+        # 'hoja de sierra' empieza antes pero 'sierracircular' (que se solapa con ella) tiene más prioridad
+        self.assertEqual(CLASIFICADOR.clasificar("Hoja de sierracircular 24T"), ("", "Herramientas eléctricas"))
+        clasificador = ClasificadorProductos(['Falco', 'Black', 'Alfa', 'Black+Decker'], {'Otros': ['otro']})
+        self.assertEqual(clasificador.clasificar("Sierra Alfalco"), ("Falco", "General"))
+        # Una palabra contenida al inicio de otra más larga también cuenta
+        self.assertEqual(clasificador.clasificar("Taladro Black+Decker"), ("Black", "General"))
+
+    def test_clasificador_desde_bd(self):
+        from .utils.clasificador_productos import clasificador_desde_bd
+        Marca.objects.create(nombre_mprod="Ubermann", descripcion_mprod="Marca Ubermann")
+        Categoria.objects.create(nombre="Jardinería", descripcion="Jardín")
+        self.assertEqual(clasificador_desde_bd().clasificar("UBERMANN set de jardinería"), ("Ubermann", "Jardinería"))
+
+
+class QRProductosTestCase(TestCase):
+    def setUp(self):
+        import tempfile
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        ajustes = override_settings(QR_CACHE_DIR=self.directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client = APIClient()
+        self.marca = Marca.objects.create(nombre_mprod="Bosch", descripcion_mprod="Marca Bosch")
+        self.categoria = Categoria.objects.create(nombre="Herramientas", descripcion="Herramientas eléctricas")
+        self.producto = Productos.objects.create(nombre_prodc="Taladro", descripcion_prodc="Desc", codigo_interno="TAL-001", fecha_creacion=timezone.now(), activo=True, marca_fk=self.marca, categoria_fk=self.categoria)
+
+    def test_imagen_binaria_con_etag(self):
+        import os
+        url = reverse('qr_producto_imagen', args=[self.producto.id_prodc])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+        self.assertEqual(len(os.listdir(self.directorio.name)), 1)
+
+        response_304 = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response_304.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response_304['ETag'], response['ETag'])
+
+    def test_cambio_de_codigo_invalida_el_qr(self):
+        import os
+        from .utils.qr import obtener_qr_png, etag_qr
+        obtener_qr_png("TAL-001")
+        etag_anterior = etag_qr("TAL-001")
+        producto = Productos.objects.get(id_prodc=self.producto.id_prodc)
+        producto.codigo_interno = "TAL-002"
+        producto.save()
+        self.assertEqual(os.listdir(self.directorio.name), [])
+        response = self.client.get(reverse('qr_producto_imagen', args=[producto.id_prodc]), HTTP_IF_NONE_MATCH=f'"{etag_anterior}"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_lista_entrega_urls_en_lugar_de_base64(self):
+        response = self.client.get(reverse('lista_productos_qr'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        item = response.data['productos'][0]
+        self.assertEqual(item['qr_url'], reverse('qr_producto_imagen', args=[self.producto.id_prodc]))
+        self.assertNotIn('qr_code', item)
+        response = self.client.get(reverse('lista_productos_qr'), {'incluir_base64': 'true'})
+        self.assertIn('qr_code', response.data['productos'][0])
+
+    def test_imagen_svg(self):
+        url = reverse('qr_producto_imagen', args=[self.producto.id_prodc])
+        response = self.client.get(url, {'formato': 'svg'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertTrue(response.content.startswith(b'<svg'))
+        self.assertNotEqual(response['ETag'], self.client.get(url)['ETag'])
+        self.assertEqual(self.client.get(url, {'formato': 'bmp'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_lote_en_una_consulta(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        otro = Productos.objects.create(nombre_prodc="Sierra", descripcion_prodc="Desc", codigo_interno="SIE-001", fecha_creacion=timezone.now(), activo=True, marca_fk=self.marca, categoria_fk=self.categoria)
+        response = self.client.post(reverse('qr_productos_lote'), {'ids': [otro.id_prodc]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        usuario = get_user_model().objects.create_user(correo="bodega@correo.com", contrasena="test1234", nombre="Usuario Bodega", rol_fk=Rol.objects.create(nombre_rol="bodega"))
+        self.client.force_authenticate(user=usuario)
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.post(reverse('qr_productos_lote'), {'ids': [otro.id_prodc, self.producto.id_prodc, 999], 'formato': 'svg'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual([p['codigo_interno'] for p in response.data['productos']], ["SIE-001", "TAL-001"])
+        self.assertTrue(response.data['productos'][0]['qr_code'].startswith('<svg'))
+        self.assertEqual(response.data['no_encontrados'], [999])
+        response = self.client.post(reverse('qr_productos_lote'), {'ids': 'TAL-001'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ExportarEtiquetasQRTestCase(TestCase):
+    def setUp(self):
+        import tempfile
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        ajustes = override_settings(QR_CACHE_DIR=self.directorio.name, QR_EXPORTACION_HILOS=2)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client = APIClient()
+        self.bodega = BodegaCentral.objects.create(id_bdg=1, nombre_bdg="Bodega Central", direccion="Calle Falsa 123", rut="12345678-9")
+        usuario = get_user_model().objects.create_user(correo="bodega@correo.com", contrasena="test1234", nombre="Usuario Bodega", rol_fk=Rol.objects.create(nombre_rol="bodega"), bodeg_fk=self.bodega)
+        self.client.force_authenticate(user=usuario)
+        marca = Marca.objects.create(nombre_mprod="Bosch", descripcion_mprod="Marca Bosch")
+        categoria = Categoria.objects.create(nombre="Herramientas", descripcion="Herramientas eléctricas")
+        for i in range(25):
+            producto = Productos.objects.create(nombre_prodc=f"Taladro (modelo {i})", descripcion_prodc="Desc", codigo_interno=f"TAL-{i:03d}", fecha_creacion=timezone.now(), activo=True, marca_fk=marca, categoria_fk=categoria, bodega_fk=self.bodega)
+            if i < 4:
+                Stock.objects.create(productos_fk=producto, bodega_fk=self.bodega.id_bdg, stock=5, stock_minimo=1)
+
+    def test_pdf_de_varias_hojas(self):
+        import io
+        import pdfplumber
+        response = self.client.get(reverse('exportar_etiquetas_qr'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        contenido = b''.join(response.streaming_content)
+        with pdfplumber.open(io.BytesIO(contenido)) as pdf:
+            self.assertEqual(len(pdf.pages), 2)
+            self.assertEqual(len(pdf.pages[0].images), 21)
+            self.assertEqual(len(pdf.pages[1].images), 4)
+            self.assertIn("TAL-000", pdf.pages[0].extract_text())
+            self.assertIn("Taladro (modelo 24)", pdf.pages[1].extract_text())
+
+    def test_zip_filtrado_por_bodega_y_paginado(self):
+        import io
+        import zipfile
+        response = self.client.get(reverse('exportar_etiquetas_qr'), {'formato': 'zip', 'bodega_id': self.bodega.id_bdg, 'tamano_pagina': 3, 'pagina': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        archivo = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archivo.namelist(), ['TAL-003.png'])
+        self.assertTrue(archivo.read('TAL-003.png').startswith(b'\x89PNG'))
+
+    def test_formato_invalido(self):
+        response = self.client.get(reverse('exportar_etiquetas_qr'), {'formato': 'docx'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_requiere_autenticacion(self):
+        response = APIClient().get(reverse('exportar_etiquetas_qr'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class EscaneoProductoTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.bodega = BodegaCentral.objects.create(id_bdg=1, nombre_bdg="Bodega Central", direccion="Calle Falsa 123", rut="12345678-9")
+        self.sucursal = Sucursal.objects.create(nombre_sucursal="Sucursal Norte", direccion="Av. Norte 1", descripcion="Norte", bodega_fk=self.bodega, rut="98765432-1")
+        marca = Marca.objects.create(nombre_mprod="Bosch", descripcion_mprod="Marca Bosch")
+        categoria = Categoria.objects.create(nombre="Herramientas", descripcion="Herramientas eléctricas")
+        self.producto = Productos.objects.create(nombre_prodc="Taladro", descripcion_prodc="Desc", codigo_interno="TAL-001", fecha_creacion=timezone.now(), activo=True, marca_fk=marca, categoria_fk=categoria, bodega_fk=self.bodega)
+        Stock.objects.create(productos_fk=self.producto, bodega_fk=self.bodega.id_bdg, stock=40, stock_minimo=5, stock_maximo=30)
+        Stock.objects.create(productos_fk=self.producto, sucursal_fk=self.sucursal.id, stock=3, stock_minimo=5)
+
+    def test_una_consulta_con_stock_por_ubicacion(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('producto_por_codigo', args=[" tal-001 "]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        producto = response.data['producto']
+        self.assertEqual(producto['marca'], "Bosch")
+        self.assertEqual(producto['stock_total'], 43.0)
+        self.assertEqual({s['ubicacion'] for s in producto['stocks']}, {"Bodega: Bodega Central", "Sucursal: Sucursal Norte"})
+        self.assertEqual(producto['ubicacion'], "Bodega: Bodega Central")
+
+    def test_respeta_la_ubicacion_del_usuario(self):
+        usuario = get_user_model().objects.create_user(correo="sucursal@correo.com", contrasena="test1234", nombre="Usuario Sucursal", rol_fk=Rol.objects.create(nombre_rol="sucursal"), sucursal_fk=self.sucursal)
+        self.client.force_authenticate(user=usuario)
+        producto = self.client.get(reverse('producto_por_codigo', args=["TAL-001"])).data['producto']
+        self.assertEqual(producto['ubicacion'], "Sucursal: Sucursal Norte")
+        self.assertEqual(producto['stock_actual'], 3.0)
+        self.assertEqual(producto['estado_stock'], 'CRÍTICO')
+
+        producto = self.client.get(reverse('producto_por_codigo_unico', args=["TAL-001"]), {'bodega_id': self.bodega.id_bdg}).data['producto']
+        self.assertEqual(producto['stock_maximo'], 30.0)
+        self.assertEqual(producto['estado_stock'], 'SOBRE_STOCK')
+
+    def test_producto_inexistente(self):
+        response = self.client.get(reverse('producto_por_codigo_unico', args=["NO-EXISTE"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CacheEscaneoTestCase(TestCase):
+    def setUp(self):
+        from .utils.cache_escaneo import cache_escaneo
+        self.cache = cache_escaneo
+        self.cache.limpiar()
+        self.addCleanup(self.cache.limpiar)
+        self.client = APIClient()
+        self.bodega = BodegaCentral.objects.create(id_bdg=1, nombre_bdg="Bodega Central", direccion="Calle Falsa 123", rut="12345678-9")
+        marca = Marca.objects.create(nombre_mprod="Bosch", descripcion_mprod="Marca Bosch")
+        categoria = Categoria.objects.create(nombre="Herramientas", descripcion="Herramientas eléctricas")
+        self.producto = Productos.objects.create(nombre_prodc="Taladro", descripcion_prodc="Desc", codigo_interno="TAL-001", fecha_creacion=timezone.now(), activo=True, marca_fk=marca, categoria_fk=categoria, bodega_fk=self.bodega)
+        self.stock = Stock.objects.create(productos_fk=self.producto, bodega_fk=self.bodega.id_bdg, stock=10, stock_minimo=2)
+
+    def test_codigo_repetido_sin_consultas(self):
+        self.client.get(reverse('producto_por_codigo', args=["TAL-001"]))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('validar_codigo_producto', args=["TAL-001"])).data['producto']['marca'], "Bosch")
+            self.assertEqual(self.client.get(reverse('producto_por_codigo_unico', args=["TAL-001"])).data['producto']['stock_actual'], 10.0)
+        estadisticas = self.cache.estadisticas()
+        self.assertEqual((estadisticas['aciertos'], estadisticas['fallos']), (2, 1))
+
+    def test_guardar_stock_o_producto_invalida(self):
+        url = reverse('producto_por_codigo', args=["TAL-001"])
+        self.client.get(url)
+        self.stock.stock = 4
+        self.stock.save()
+        self.assertEqual(self.client.get(url).data['producto']['stock_actual'], 4.0)
+
+        producto = Productos.objects.get(id_prodc=self.producto.id_prodc)
+        producto.activo = False
+        producto.save()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_backend_compartido(self):
+        from django.core.cache import cache
+        cache.clear()
+        with override_settings(ESCANEO_CACHE_BACKEND='default'):
+            url = reverse('producto_por_codigo', args=["TAL-001"])
+            self.client.get(url)
+            self.cache.limpiar()  # Otro worker: memoria local vacía
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+            self.assertEqual(self.cache.estadisticas()['aciertos_compartidos'], 1)
+            self.stock.stock = 1
+            self.stock.save()
+            self.cache.limpiar()
+            self.assertEqual(self.client.get(url).data['producto']['stock_actual'], 1.0)
+
+    def test_carga_invalidada_durante_la_lectura_no_se_guarda(self):
+        cargas = []
+
+        def cargar(codigo):
+            cargas.append(codigo)
+            filas = [{'id_prodc': self.producto.id_prodc, 'stock': 10}]
+            if len(cargas) == 1:
+                # Otra petición guarda el producto mientras esta lectura sigue en curso
+                self.cache.invalidar(codigos=[codigo])
+            return filas
+
+        self.assertEqual(self.cache.obtener("TAL-001", cargar)[0]['stock'], 10)
+        self.assertEqual(self.cache.estadisticas()['entradas'], 0)
+        self.cache.obtener("TAL-001", cargar)
+        self.cache.obtener("TAL-001", cargar)
+        self.assertEqual(len(cargas), 2)
+
+    def test_escritura_de_stock_durante_la_primera_carga_no_se_guarda(self):
+        # Las escrituras de stock invalidan por id de producto, que aún no está asociado al código
+        cargas = []
+
+        def cargar(codigo):
+            cargas.append(codigo)
+            filas = [{'id_prodc': self.producto.id_prodc, 'stock': 10}]
+            if len(cargas) == 1:
+                self.cache.invalidar(productos_ids=[self.producto.id_prodc])
+            return filas
+
+        self.cache.obtener("TAL-001", cargar)
+        self.assertEqual(self.cache.estadisticas()['entradas'], 0)
+        self.cache.obtener("TAL-001", cargar)
+        self.cache.obtener("TAL-001", cargar)
+        self.assertEqual(len(cargas), 2)
+        # Sin cargas en curso no quedan invalidaciones anotadas
+        self.assertEqual(self.cache._invalidaciones, [])
+
+
+class ConteoInventarioTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.bodega = BodegaCentral.objects.create(id_bdg=1, nombre_bdg="Bodega Central", direccion="Calle Falsa 123", rut="12345678-9")
+        self.user = get_user_model().objects.create_user(correo="bodega@correo.com", contrasena="test1234", nombre="Usuario Bodega", rol_fk=Rol.objects.create(nombre_rol="bodega"), bodeg_fk=self.bodega)
+        self.client.force_authenticate(user=self.user)
+        marca = Marca.objects.create(nombre_mprod="Bosch", descripcion_mprod="Marca Bosch")
+        categoria = Categoria.objects.create(nombre="Herramientas", descripcion="Herramientas eléctricas")
+        self.productos = {}
+        for codigo, stock in (("TAL-001", 10), ("SIE-001", 5), ("LIJ-001", None)):
+            producto = Productos.objects.create(nombre_prodc=codigo, descripcion_prodc="Desc", codigo_interno=codigo, fecha_creacion=timezone.now(), activo=True, marca_fk=marca, categoria_fk=categoria, bodega_fk=self.bodega)
+            if stock is not None:
+                Stock.objects.create(productos_fk=producto, bodega_fk=self.bodega.id_bdg, stock=stock, stock_minimo=1)
+            self.productos[codigo] = producto
+
+    def test_conteo_en_bloque(self):
+        lineas = [
+            {'codigo_interno': 'tal-001', 'cantidad_contada': 8},
+            {'codigo_interno': 'SIE-001', 'cantidad_contada': 5},
+            {'codigo_interno': 'LIJ-001', 'cantidad_contada': 3},
+            {'codigo_interno': 'NO-EXISTE', 'cantidad_contada': 1},
+            {'codigo_interno': 'TAL-001', 'cantidad_contada': 9},
+            {'codigo_interno': 'SIE-001', 'cantidad_contada': -2},
+        ]
+        response = self.client.post(reverse('conteo_inventario'), {'lineas': lineas, 'clave_idempotencia': 'conteo-1'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        estados = [r['estado'] for r in response.data['resultados']]
+        self.assertEqual(estados, ['ajustado', 'sin_cambios', 'ajustado', 'no_encontrado', 'repetido', 'invalido'])
+        self.assertEqual(response.data['resultados'][0]['diferencia'], -2.0)
+        self.assertEqual(response.data['resumen']['ajustado'], 2)
+
+        self.assertEqual(float(Stock.objects.get(productos_fk=self.productos['TAL-001']).stock), 8.0)
+        self.assertEqual(float(Stock.objects.get(productos_fk=self.productos['LIJ-001'], bodega_fk=self.bodega.id_bdg).stock), 3.0)
+        movimiento = MovInventario.objects.get(productos_fk=self.productos['TAL-001'])
+        self.assertEqual((movimiento.cantidad, float(movimiento.stock_antes), float(movimiento.stock_despues)), (-2, 10.0, 8.0))
+        self.assertEqual(MovInventario.objects.count(), 2)
+
+        # Reenvío del mismo conteo: no se vuelve a ajustar
+        response = self.client.post(reverse('conteo_inventario'), {'lineas': lineas[:3], 'clave_idempotencia': 'conteo-1'}, format='json')
+        self.assertEqual([r['estado'] for r in response.data['resultados']], ['ya_registrado', 'sin_cambios', 'ya_registrado'])
+        self.assertEqual(MovInventario.objects.count(), 2)
+
+    def test_consultas_constantes(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def contar(lineas):
+            with CaptureQueriesContext(connection) as consultas:
+                self.client.post(reverse('conteo_inventario'), {'lineas': lineas}, format='json')
+            return len([q for q in consultas.captured_queries if not q['sql'].upper().startswith(('SAVEPOINT', 'RELEASE'))])
+
+        una = contar([{'codigo_interno': 'TAL-001', 'cantidad_contada': 7}])
+        tres = contar([{'codigo_interno': c, 'cantidad_contada': 2} for c in ('TAL-001', 'SIE-001', 'LIJ-001')])
+        self.assertEqual(una + 1, tres)  # Solo se agrega el bulk_create del Stock faltante
+
+    def test_cantidad_fraccionaria_es_invalida(self):
+        lineas = [{'codigo_interno': 'TAL-001', 'cantidad_contada': 2.5}, {'codigo_interno': 'SIE-001', 'cantidad_contada': '4.0'}]
+        response = self.client.post(reverse('conteo_inventario'), {'lineas': lineas}, format='json')
+        self.assertEqual([r['estado'] for r in response.data['resultados']], ['invalido', 'ajustado'])
+        self.assertEqual(float(Stock.objects.get(productos_fk=self.productos['TAL-001']).stock), 10.0)
+        self.assertEqual(list(MovInventario.objects.values_list('cantidad', flat=True)), [-1])
+
+
+class BusquedaProductosSimilaresTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.bodega = BodegaCentral.objects.create(id_bdg=1, nombre_bdg="Bodega Central", direccion="Calle Falsa 123", rut="12345678-9")
+        self.sucursal = Sucursal.objects.create(nombre_sucursal="Sucursal Norte", direccion="Av. Norte 1", descripcion="Norte", bodega_fk=self.bodega, rut="98765432-1")
+        bosch = Marca.objects.create(nombre_mprod="Bosch", descripcion_mprod="Marca Bosch")
+        makita = Marca.objects.create(nombre_mprod="Makita", descripcion_mprod="Marca Makita")
+        herramientas = Categoria.objects.create(nombre="Herramientas eléctricas", descripcion="Eléctricas")
+        for nombre, codigo, marca in (("Taladro Bosch 500W", "TAL-001", bosch), ("Taladro percutor 800W", "TAL-002", makita), ("Sierra circular", "SIE-001", makita)):
+            producto = Productos.objects.create(nombre_prodc=nombre, descripcion_prodc="Desc", codigo_interno=codigo, fecha_creacion=timezone.now(), activo=True, marca_fk=marca, categoria_fk=herramientas, bodega_fk=self.bodega)
+            Stock.objects.create(productos_fk=producto, bodega_fk=self.bodega.id_bdg, stock=4, stock_minimo=1)
+            Stock.objects.create(productos_fk=producto, sucursal_fk=self.sucursal.id, stock=2, stock_minimo=1)
+
+    def test_similitud_como_pg_trgm(self):
+        from .utils.busqueda_productos import similitud
+        self.assertAlmostEqual(similitud("word", "words"), 4 / 7)
+        self.assertEqual(similitud("Taladro", "TALADRO"), 1.0)
+
+    def test_ranking_en_una_consulta(self):
+        from .utils.busqueda_productos import buscar_productos_rankeados
+        with self.assertNumQueries(1):
+            candidatos = buscar_productos_rankeados(Productos.objects.filter(bodega_fk=self.bodega), "taladro 500w", marca="bosch")
+        self.assertEqual([c['codigo_interno'] for c in candidatos], ["TAL-001", "TAL-002"])
+        self.assertGreater(candidatos[0]['similitud'], candidatos[1]['similitud'])
+        self.assertEqual(buscar_productos_rankeados(Productos.objects.all(), "taladro", limite=1)[0]['codigo_interno'], "TAL-001")
+
+    def test_sucursal_retorna_casi_duplicados(self):
+        response = self.client.post(reverse('buscar_productos_similares_sucursal'), {'nombre': "taladro bosch 500 w", 'sucursal_id': self.sucursal.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        similares = response.data['productos_similares']
+        self.assertEqual(similares[0]['codigo_interno'], "TAL-001")
+        self.assertEqual(similares[0]['stock'], 2.0)
+        self.assertNotIn("SIE-001", [p['codigo_interno'] for p in similares])
+
+    def test_sucursal_sin_consulta_por_candidato(self):
+        # Nombre exacto sin resultados + búsqueda aproximada con el stock de la sucursal incluido
+        with self.assertNumQueries(2):
+            response = self.client.post(reverse('buscar_productos_similares_sucursal'), {'nombre': "taladro", 'sucursal_id': self.sucursal.id}, format='json')
+        similares = response.data['productos_similares']
+        self.assertEqual([p['codigo_interno'] for p in similares], ["TAL-001", "TAL-002"])
+        self.assertEqual((similares[0]['marca_nombre'], similares[0]['sucursal_fk'], similares[0]['stock']), ("Bosch", None, 2.0))
+        self.assertIn('similitud', similares[0])
+
+    def test_respeta_similitud_minima(self):
+        from .utils.busqueda_productos import buscar_productos_rankeados
+        # similitud de "taladro": 0.42 con TAL-001 y 0.36 con TAL-002
+        self.assertEqual([c['codigo_interno'] for c in buscar_productos_rankeados(Productos.objects.all(), "taladro")], ["TAL-001", "TAL-002"])
+        with override_settings(BUSQUEDA_SIMILITUD_MINIMA=0.4):
+            self.assertEqual([c['codigo_interno'] for c in buscar_productos_rankeados(Productos.objects.all(), "taladro")], ["TAL-001"])
+
+    def _buscar_en_bodega(self, consultas, **datos):
+        if not hasattr(self, 'usuario'):
+            self.usuario = get_user_model().objects.create_user(correo="usuario@correo.com", contrasena="test1234", nombre="Usuario Test", rol_fk=Rol.objects.create(nombre_rol="bodega"), bodeg_fk=self.bodega)
+            self.client.force_authenticate(user=self.usuario)
+        with self.assertNumQueries(consultas):
+            response = self.client.post(reverse('buscar_productos_similares_endpoint'), dict(datos, bodega_id=self.bodega.id_bdg), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['productos_similares']
+
+    def test_bodega_en_una_pasada(self):
+        # Bodega + búsqueda exacta sin resultados + búsqueda aproximada con stock incluido
+        similares = self._buscar_en_bodega(3, nombre="taladro 500w", marca="bosch")
+        self.assertEqual([p['codigo_interno'] for p in similares], ["TAL-001", "TAL-002"])
+        self.assertEqual((similares[0]['marca_nombre'], similares[0]['stock']), ("Bosch", 4.0))
+        self.assertIn('similitud', similares[0])
+
+    def test_bodega_codigo_exacto_primero(self):
+        similares = self._buscar_en_bodega(2, nombre="Taladro percutor 800W", codigo_interno="SIE-001")
+        self.assertEqual([p['codigo_interno'] for p in similares], ["SIE-001"])
+        self.assertEqual(similares[0]['categoria_nombre'], "Herramientas eléctricas")
+        por_nombre = self._buscar_en_bodega(2, nombre=" taladro percutor 800w ")
+        self.assertEqual([p['codigo_interno'] for p in por_nombre], ["TAL-002"])
+
+
+class IndiceCatalogoTestCase(TestCase):
+    def setUp(self):
+        from .utils.indice_catalogo import indice_catalogo
+        self.indice = indice_catalogo
+        self.indice.limpiar()
+        self.addCleanup(self.indice.limpiar)
+        self.client = APIClient()
+        self.bodega = BodegaCentral.objects.create(id_bdg=1, nombre_bdg="Bodega Central", direccion="Calle Falsa 123", rut="12345678-9")
+        self.usuario = get_user_model().objects.create_user(correo="usuario@correo.com", contrasena="test1234", nombre="Usuario Test", rol_fk=Rol.objects.create(nombre_rol="bodega"), bodeg_fk=self.bodega)
+        self.client.force_authenticate(user=self.usuario)
+        marca = Marca.objects.create(nombre_mprod="Bosch", descripcion_mprod="Marca Bosch")
+        categoria = Categoria.objects.create(nombre="Herramientas", descripcion="Herramientas eléctricas")
+        self.taladro = Productos.objects.create(nombre_prodc="Taladro", descripcion_prodc="Desc", codigo_interno="TAL-001", fecha_creacion=timezone.now(), activo=True, marca_fk=marca, categoria_fk=categoria, bodega_fk=self.bodega)
+        Stock.objects.create(productos_fk=self.taladro, bodega_fk=self.bodega.id_bdg, stock=10, stock_minimo=2, stock_maximo=50)
+
+    def _verificar(self, nombre):
+        datos = {'nombre': nombre, 'marca': "BOSCH", 'categoria': "herramientas", 'bodega_id': self.bodega.id_bdg}
+        return self.client.post(reverse('verificar_producto_existente'), datos, format='json')
+
+    def test_verificar_producto_existente(self):
+        self._verificar("Taladro")  # Carga el índice de la bodega
+        with self.assertNumQueries(2):
+            response = self._verificar("  taladro ")
+        self.assertTrue(response.data['existe'])
+        self.assertEqual(response.data['producto']['stock_actual'], 10.0)
+        with self.assertNumQueries(0):
+            self.assertFalse(self._verificar("Sierra").data['existe'])
+
+    def _pedido(self):
+        if not hasattr(self, 'solicitud'):
+            self.estado = EstadoPedido.objects.create(nombre="Completado", descripcion="Completado")
+            self.personal = PersonalEntrega.objects.create(usuario_fk=self.usuario, nombre_psn="Juan Chofer", descripcion_psn="Transportista", patente="ABCD12")
+            sucursal = Sucursal.objects.create(nombre_sucursal="Sucursal Centro", direccion="Calle Real 456", descripcion="Sucursal principal", bodega_fk=self.bodega, rut="98765432-1")
+            self.solicitud = Solicitudes.objects.create(fecha_creacion=timezone.now(), fk_sucursal=sucursal, fk_bodega=self.bodega, usuarios_fk=self.usuario)
+        return Pedidos.objects.create(descripcion="Ingreso", fecha_entrega=timezone.now(), estado_pedido_fk=self.estado, personal_entrega_fk=self.personal, usuario_fk=self.usuario, solicitud_fk=self.solicitud, bodega_fk=self.bodega)
+
+    def test_ingreso_reutiliza_producto_registrado(self):
+        from .views import procesar_ingreso_en_bloque
+
+        def ingresar(linea):
+            # Cada línea llega en una guía distinta
+            return procesar_ingreso_en_bloque([linea], self.bodega, None, self.usuario, self._pedido())[0]
+
+        linea = {'nombre': "Martillo 500g", 'marca': "Stanley", 'categoria': "Manuales", 'modelo': '', 'cantidad': 3}
+        primero = ingresar(dict(linea))
+        segundo = ingresar(dict(linea, nombre="MARTILLO 500g"))
+        self.assertTrue(primero['es_nuevo'])
+        self.assertFalse(segundo['es_nuevo'])
+        self.assertEqual(segundo['codigo_interno'], primero['codigo_interno'])
+        self.assertEqual(segundo['stock_actual'], 6.0)
+        otro_modelo = ingresar(dict(linea, modelo="XL"))
+        self.assertTrue(otro_modelo['es_nuevo'])
+        # Un código manual no tiene modelo conocido: cualquier modelo lo reutiliza
+        sin_modelo = ingresar({'nombre': "Taladro", 'marca': "Bosch", 'categoria': "Herramientas", 'modelo': "X1", 'cantidad': 1})
+        self.assertEqual(sin_modelo['codigo_interno'], "TAL-001")
+
+    def test_ingreso_en_bloque_sin_duplicados(self):
+        from .views import procesar_ingreso_en_bloque
+        pedido = self._pedido()
+        guia = [
+            {'nombre': "taladro", 'marca': "Bosch", 'categoria': "Herramientas", 'modelo': '', 'cantidad': 2},
+            {'nombre': "Sierra", 'marca': "Makita", 'categoria': "Herramientas", 'modelo': '', 'cantidad': 1},
+            {'nombre': "sierra ", 'marca': "makita", 'categoria': "Herramientas", 'modelo': '', 'cantidad': 4},
+        ]
+        resultado = procesar_ingreso_en_bloque(guia, self.bodega, None, self.usuario, pedido)
+        self.assertEqual(resultado[0]['codigo_interno'], "TAL-001")
+        self.assertFalse(resultado[0]['es_nuevo'])
+        self.assertEqual(resultado[1]['codigo_interno'], resultado[2]['codigo_interno'])
+        self.assertEqual(resultado[2]['stock_actual'], 5.0)
+        self.assertEqual(Productos.objects.filter(nombre_prodc__iexact="sierra").count(), 1)
+        # Los productos creados con bulk_create quedan en el índice
+        with self.assertNumQueries(0):
+            self.assertIsNotNone(self.indice.buscar("Sierra", "Makita", "Herramientas", bodega_id=self.bodega.id_bdg))
+
+    def test_registro_durante_la_carga_no_se_pierde(self):
+        from unittest import mock
+        cargar = self.indice._cargar
+        marca = Marca.objects.get(nombre_mprod="Bosch")
+        categoria = Categoria.objects.get(nombre="Herramientas")
+        creados = []
+
+        def cargar_con_escritura_concurrente(ubicacion):
+            indice = cargar(ubicacion)
+            # Otra petición crea un producto después de la consulta y antes de instalar el índice
+            creados.append(Productos.objects.create(nombre_prodc="Sierra", descripcion_prodc="Desc", codigo_interno="SIE-001", fecha_creacion=timezone.now(), activo=True, marca_fk=marca, categoria_fk=categoria, bodega_fk=self.bodega))
+            self.taladro.activo = False
+            self.taladro.save()
+            return indice
+
+        self.indice.precargar(bodega_id=self.bodega.id_bdg)
+        with mock.patch.object(self.indice, '_cargar', side_effect=cargar_con_escritura_concurrente):
+            self.indice.precargar(bodega_id=self.bodega.id_bdg)
+        self.assertEqual(self.indice.buscar("Sierra", "Bosch", "Herramientas", bodega_id=self.bodega.id_bdg), creados[0].id_prodc)
+        self.assertIsNone(self.indice.buscar("Taladro", "Bosch", "Herramientas", bodega_id=self.bodega.id_bdg))
+
+    def test_desactivar_o_modificar_fuera_del_indice(self):
+        from .views import buscar_producto_en_catalogo
+        self.assertEqual(self.indice.buscar("Taladro", "Bosch", "Herramientas", bodega_id=self.bodega.id_bdg), self.taladro.id_prodc)
+        self.taladro.activo = False
+        self.taladro.save()
+        self.assertIsNone(self.indice.buscar("Taladro", "Bosch", "Herramientas", bodega_id=self.bodega.id_bdg))
+        self.taladro.activo = True
+        self.taladro.save()
+        # update() no pasa por save(): el índice queda desactualizado hasta que la búsqueda lo detecta
+        Productos.objects.filter(id_prodc=self.taladro.id_prodc).update(nombre_prodc="Taladro percutor")
+        self.assertIsNone(buscar_producto_en_catalogo("Taladro", "Bosch", "Herramientas", bodega_id=self.bodega.id_bdg))
+        self.assertIsNone(self.indice.buscar("Taladro", "Bosch", "Herramientas", bodega_id=self.bodega.id_bdg))
+
+
+class CodigosUnicosTestCase(TestCase):
+    def setUp(self):
+        self.bodega = BodegaCentral.objects.create(id_bdg=1, nombre_bdg="Bodega Central", direccion="Calle Falsa 123", rut="12345678-9")
+        self.periodo = timezone.now().strftime('%Y%m')
+        marca = Marca.objects.create(nombre_mprod="Bosch", descripcion_mprod="Marca Bosch")
+        categoria = Categoria.objects.create(nombre="Herramientas", descripcion="Herramientas eléctricas")
+        Productos.objects.create(nombre_prodc="Taladro 500W", descripcion_prodc="Desc", codigo_interno=f"HERR-BOSC-500W-{self.periodo}-007", fecha_creacion=timezone.now(), activo=True, marca_fk=marca, categoria_fk=categoria, bodega_fk=self.bodega)
+
+    def test_contador_parte_del_ultimo_codigo(self):
+        from .views import generate_codigo_unico
+        self.assertEqual(generate_codigo_unico("Taladro 500W", "Bosch", "Herramientas", "", self.bodega), f"HERR-BOSC-500W-{self.periodo}-008")
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(generate_codigo_unico("Taladro 500W", "Bosch", "Herramientas", "", self.bodega), f"HERR-BOSC-500W-{self.periodo}-009")
+        # Con el contador ya creado: bloqueo y avance, sin buscar el último código en productos
+        self.assertEqual(len([q for q in consultas.captured_queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]), 2)
+        # codigo_interno es único en toda la tabla: otra ubicación sigue el mismo correlativo
+        self.assertEqual(generate_codigo_unico("Taladro 500W", "Bosch", "Herramientas", "", bodega=None, sucursal=3), f"HERR-BOSC-500W-{self.periodo}-010")
+
+    def test_contador_nuevo_considera_todas_las_ubicaciones(self):
+        from .utils.codigos import reservar_codigos
+        otra = BodegaCentral.objects.create(id_bdg=2, nombre_bdg="Bodega Sur", direccion="Calle Sur 1", rut="11111111-1")
+        producto = Productos.objects.get(codigo_interno=f"HERR-BOSC-500W-{self.periodo}-007")
+        Productos.objects.create(nombre_prodc="Taladro 500W", descripcion_prodc="Desc", codigo_interno=f"HERR-BOSC-500W-{self.periodo}-012", fecha_creacion=timezone.now(), activo=True, marca_fk=producto.marca_fk, categoria_fk=producto.categoria_fk, bodega_fk=otra)
+        self.assertEqual(reservar_codigos([f"HERR-BOSC-500W-{self.periodo}"]), [f"HERR-BOSC-500W-{self.periodo}-013"])
+
+    def test_reserva_en_bloque(self):
+        from .utils.codigos import reservar_codigos
+        taladro, sierra = f"HERR-BOSC-500W-{self.periodo}", f"HERR-MAKI-GEN-{self.periodo}"
+        codigos = reservar_codigos([taladro, sierra, taladro, taladro])
+        self.assertEqual(codigos, [f"{taladro}-008", f"{sierra}-001", f"{taladro}-009", f"{taladro}-010"])
+        self.assertEqual(reservar_codigos([sierra]), [f"{sierra}-002"])
+
+    def test_reserva_revertida_libera_correlativos(self):
+        from django.db import transaction
+        from .models import ContadorCodigo
+        from .utils.codigos import reservar_codigos
+        patron = f"HERR-BOSC-500W-{self.periodo}"
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                reservar_codigos([patron, patron])
+                raise RuntimeError("ingreso fallido")
+        self.assertFalse(ContadorCodigo.objects.exists())
+        self.assertEqual(reservar_codigos([patron]), [f"{patron}-008"])
+
+    def test_generar_codigo_automatico(self):
+        client = APIClient()
+        usuario = get_user_model().objects.create_user(correo="usuario@correo.com", contrasena="test1234", nombre="Usuario Test", rol_fk=Rol.objects.create(nombre_rol="bodega"), bodeg_fk=self.bodega)
+        client.force_authenticate(user=usuario)
+        datos = {'nombre': "Taladro 500W", 'marca': "Bosch", 'categoria': "Herramientas", 'es_bodega': True, 'ubicacion_id': self.bodega.id_bdg}
+        primero = client.post(reverse('generar_codigo_automatico'), datos, format='json').data['codigo']
+        segundo = client.post(reverse('generar_codigo_automatico'), datos, format='json').data['codigo']
+        self.assertEqual((primero, segundo), (f"HERR-BOSC-500W-{self.periodo}-008", f"HERR-BOSC-500W-{self.periodo}-009"))
+
+
+class ModeloProductoTestCase(SimpleTestCase):
+    def test_prioridad_de_patrones(self):
+        from .utils.modelo_producto import extraer_modelo_desde_nombre
+        casos = {
+            "Taladro Bosch 500 W": "500W",
+            "Cable rojo 10m": "10M",  # La medida tiene prioridad sobre el color aunque aparezca después
+            "Guantes industrial rojo": "ROJO",
+            "Tubo PVC 1/2\"": '1/2"',
+            "Saco cemento 2 ton": "2TON",
+            "Lija pequeño N° 3": "PEQUEÑO",
+            "Martillo": "GEN",
+        }
+        for nombre, modelo in casos.items():
+            self.assertEqual(extraer_modelo_desde_nombre(nombre), modelo, nombre)
+
+    def test_igual_a_patrones_secuenciales(self):
+        import random
+        from .management.commands.benchmark_modelo_producto import extraer_modelo_secuencial, nombres_sinteticos
+        from .utils.modelo_producto import extraer_modelos
+        nombres = nombres_sinteticos(3000, random.Random(7))
+        # Palabras solapadas: la de más prioridad puede empezar dentro de otra
+        nombres += ['Llave mininox', 'Repisa medianogalvanizado', 'Tubo grisacero', 'Perfil zincobre 2 panel']
+        self.assertEqual(extraer_modelos(nombres), [extraer_modelo_secuencial(nombre) for nombre in nombres])
+        self.assertEqual(extraer_modelos(['Llave mininox', 'medianogalvanizado']), ['INOX', 'NOGAL'])
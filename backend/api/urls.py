@@ -4,7 +4,7 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import ( 
     login, register, ProductoViewSet, MarcaViewSet, CategoriaViewSet, 
     SolicitudesViewSet, UsuarioViewSet, InformeViewSet, PedidosViewSet, 
-    PersonalEntregaViewSet, ProveedorViewSet, ExtraerProductosPDF,generar_qr_producto_view, producto_por_codigo, actualizar_stock_con_movimiento, lista_productos_qr, validar_codigo_producto, verificar_producto_existente, producto_por_codigo_unico, buscar_productos_similares_endpoint, movimientos_inventario, 
+    PersonalEntregaViewSet, ProveedorViewSet, ExtraerProductosPDF, EstadoExtraccionPDF,generar_qr_producto_view, producto_por_codigo, estadisticas_cache_escaneo, actualizar_stock_con_movimiento, conteo_inventario, lista_productos_qr, qr_producto_imagen, qr_productos_lote, exportar_etiquetas_qr, validar_codigo_producto, verificar_producto_existente, producto_por_codigo_unico, buscar_productos_similares_endpoint, movimientos_inventario,
     pedidos_recientes, NotificacionViewSet,BodegaCentralViewSet, BuscarProductosSimilaresSucursalView, UsuarioNotificacionListView, UsuarioNotificacionDetailView, historial_producto, productos_con_movimientos_recientes, generar_codigo_automatico, productos_desactivados, reactivar_productos, reactivar_producto_individual, HistorialEstadoPedidoView, HistorialPedidosViewSet
 )
 
@@ -36,17 +36,27 @@ urlpatterns = [
     path('productos/agregar-marca/', MarcaViewSet.as_view({'post': 'agregar_marca'}), name='agregar_marca'),
     path('productos/agregar-categoria/', CategoriaViewSet.as_view({'post': 'agregar_categoria'}), name='agregar_categoria'),
     path('extraer-productos-pdf/', ExtraerProductosPDF.as_view(), name='extraer_productos_pdf'),
+    path('extraer-productos-pdf/trabajos/<str:trabajo_id>/', EstadoExtraccionPDF.as_view(), name='estado_extraccion_pdf'),
     path('pedidos/', PedidosViewSet.as_view({'get':'pedidos'}),name='pedidos'),
     
     path('pedidos/<int:pedido_id>/historial-estado/', HistorialEstadoPedidoView.as_view(), name='historial-estado-pedido'),
     # URL eliminada: actualizar_stock_por_codigo (causaba duplicación de movimientos)
     path('verificar-producto/', verificar_producto_existente, name='verificar_producto_existente'),
+    path('producto-codigo/<str:codigo_interno>/', producto_por_codigo, name='producto_por_codigo'),
+    path('validar-codigo/<str:codigo_interno>/', validar_codigo_producto, name='validar_codigo_producto'),
+    path('escaneo/cache-estadisticas/', estadisticas_cache_escaneo, name='estadisticas_cache_escaneo'),
     path('producto-codigo-unico/<str:codigo_interno>/', producto_por_codigo_unico, name='producto_por_codigo_unico'),
     path('buscar-productos-similares/', buscar_productos_similares_endpoint, name='buscar_productos_similares_endpoint'),
     path('pedidos_recientes/', pedidos_recientes, name='pedidos_recientes'),
     path('movimientos-inventario/', movimientos_inventario, name='movimientos-inventario'),
     path('productos/<int:producto_id>/historial/', historial_producto, name='historial_producto'),
+    path('productos/<int:producto_id>/qr/', generar_qr_producto_view, name='generar_qr_producto'),
+    path('productos/<int:producto_id>/qr/imagen/', qr_producto_imagen, name='qr_producto_imagen'),
+    path('productos-qr/', lista_productos_qr, name='lista_productos_qr'),
+    path('productos-qr/lote/', qr_productos_lote, name='qr_productos_lote'),
+    path('productos-qr/etiquetas/', exportar_etiquetas_qr, name='exportar_etiquetas_qr'),
     path('productos/<int:producto_id>/actualizar-stock/', actualizar_stock_con_movimiento, name='actualizar_stock_con_movimiento'),
+    path('inventario/conteo/', conteo_inventario, name='conteo_inventario'),
     path('productos-con-movimientos-recientes/', productos_con_movimientos_recientes, name='productos_con_movimientos_recientes'),
     path('buscar-productos-similares-sucursal/', BuscarProductosSimilaresSucursalView.as_view(), name='buscar_productos_similares_sucursal'),
     path('usuario-notificaciones/', UsuarioNotificacionListView.as_view(), name='usuario-notificaciones-list'),
@@ -0,0 +1,174 @@
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+
+def detectar_alertas_stock(stock_obj, stock_anterior):
+    """
+    Compara el valor anterior (en memoria) con el actual y retorna las alertas de
+    umbral que corresponden: cruce hacia el mínimo (crítico) o hacia el máximo.
+    """
+    if stock_anterior is None:
+        return []
+    stock_actual = float(stock_obj.stock)
+    stock_min = float(stock_obj.stock_minimo) if stock_obj.stock_minimo is not None else 0
+    stock_max = float(stock_obj.stock_maximo) if stock_obj.stock_maximo is not None else None
+
+    base = {
+        'producto_id': stock_obj.productos_fk_id,
+        'bodega_id': stock_obj.bodega_fk,
+        'sucursal_id': stock_obj.sucursal_fk,
+        'stock_actual': stock_actual,
+    }
+    alertas = []
+    # De normal a crítico
+    if stock_anterior > stock_min and stock_actual <= stock_min:
+        alertas.append({**base, 'tipo': 'minimo', 'limite': stock_min})
+    # De normal a máximo
+    if stock_max is not None and stock_anterior < stock_max and stock_actual >= stock_max:
+        alertas.append({**base, 'tipo': 'maximo', 'limite': stock_max})
+    return alertas
+
+
+def procesar_alertas_stock(alertas):
+    """
+    Genera las notificaciones de un lote de alertas con un número fijo de consultas:
+    productos, nombres de ubicación y usuarios se resuelven por conjunto y las filas de
+    Notificacion/UsuarioNotificacion se insertan con insertar_notificaciones (bulk_create).
+    Retorna la cantidad de notificaciones creadas.
+    """
+    from api.models import Usuario, BodegaCentral, Sucursal, Productos, Notificacion
+    from api.utils.notificaciones import insertar_notificaciones
+
+    if not alertas:
+        return 0
+
+    productos = Productos.objects.in_bulk({a['producto_id'] for a in alertas})
+    bodegas_ids = {a['bodega_id'] for a in alertas if a['bodega_id']}
+    sucursales_ids = {a['sucursal_id'] for a in alertas if not a['bodega_id'] and a['sucursal_id']}
+    nombres_bodega = dict(BodegaCentral.objects.filter(id_bdg__in=bodegas_ids).values_list('id_bdg', 'nombre_bdg'))
+    nombres_sucursal = dict(Sucursal.objects.filter(id__in=sucursales_ids).values_list('id', 'nombre_sucursal'))
+
+    usuarios_bodega, usuarios_sucursal = {}, {}
+    if bodegas_ids or sucursales_ids:
+        for usuario in Usuario.objects.filter(Q(bodeg_fk__in=bodegas_ids) | Q(sucursal_fk__in=sucursales_ids)):
+            if usuario.bodeg_fk_id in bodegas_ids:
+                usuarios_bodega.setdefault(usuario.bodeg_fk_id, []).append(usuario)
+            if usuario.sucursal_fk_id in sucursales_ids:
+                usuarios_sucursal.setdefault(usuario.sucursal_fk_id, []).append(usuario)
+
+    notificaciones = []
+    for alerta in alertas:
+        producto = productos.get(alerta['producto_id'])
+        if producto is None:
+            continue
+        if alerta['bodega_id']:
+            usuarios = usuarios_bodega.get(alerta['bodega_id'], [])
+            ubicacion_nombre = nombres_bodega.get(alerta['bodega_id'], 'Bodega')
+        elif alerta['sucursal_id']:
+            usuarios = usuarios_sucursal.get(alerta['sucursal_id'], [])
+            ubicacion_nombre = nombres_sucursal.get(alerta['sucursal_id'], 'Sucursal')
+        else:
+            continue
+
+        if alerta['tipo'] == 'minimo':
+            nombre = f"Stock crítico: {producto.nombre_prodc}"
+            descripcion = f"El stock del producto '{producto.nombre_prodc}' en {ubicacion_nombre} está en {alerta['stock_actual']} (mínimo: {alerta['limite']})"
+            tipo = "error"
+        else:
+            nombre = f"Stock máximo superado: {producto.nombre_prodc}"
+            descripcion = f"El stock del producto '{producto.nombre_prodc}' en {ubicacion_nombre} está en {alerta['stock_actual']} (máximo: {alerta['limite']})"
+            tipo = "warning"
+
+        for usuario in usuarios:
+            notificaciones.append(Notificacion(
+                usuario_fk=usuario,
+                nombre_ntf=nombre,
+                descripcion=descripcion,
+                tipo=tipo,
+                producto_fk=producto,
+            ))
+
+    return len(insertar_notificaciones(notificaciones))
+
+
+class DespachadorAlertasStock:
+    """
+    Cola en proceso para las alertas de stock.
+
+    En modo asíncrono (NOTIFICACIONES_STOCK_ASINCRONO) un hilo en segundo plano vacía
+    la cola por lotes; en modo local las alertas quedan en la cola hasta llamar a
+    procesar_pendientes(), lo que permite usarlo de forma determinista en los tests.
+    """
+
+    def __init__(self):
+        self.cola = queue.Queue()
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    def encolar(self, alertas):
+        for alerta in alertas:
+            self.cola.put(alerta)
+        if getattr(settings, 'NOTIFICACIONES_STOCK_ASINCRONO', True):
+            self._iniciar_hilo()
+
+    def _tomar_lote(self, bloquear):
+        tamano = getattr(settings, 'NOTIFICACIONES_STOCK_TAMANO_LOTE', 200)
+        espera = getattr(settings, 'NOTIFICACIONES_STOCK_ESPERA_SEGUNDOS', 0.5)
+        lote = []
+        try:
+            lote.append(self.cola.get(block=bloquear))
+        except queue.Empty:
+            return lote
+        # Esperar un poco para agrupar las alertas de una misma operación masiva
+        limite = time.monotonic() + (espera if bloquear else 0)
+        while len(lote) < tamano:
+            restante = limite - time.monotonic()
+            try:
+                lote.append(self.cola.get(timeout=restante) if restante > 0 else self.cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def procesar_pendientes(self):
+        """Procesa en el hilo actual todas las alertas encoladas. Retorna las notificaciones creadas."""
+        total = 0
+        while True:
+            lote = self._tomar_lote(bloquear=False)
+            if not lote:
+                return total
+            total += procesar_alertas_stock(lote)
+
+    def _iniciar_hilo(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._ejecutar, name='despachador-alertas-stock', daemon=True)
+                self._hilo.start()
+
+    def _ejecutar(self):
+        while True:
+            lote = self._tomar_lote(bloquear=True)
+            try:
+                close_old_connections()
+                creadas = procesar_alertas_stock(lote)
+                logger.info(f"[ALERTAS STOCK] {creadas} notificaciones creadas para {len(lote)} alertas")
+            except Exception as e:
+                logger.error(f"[ALERTAS STOCK] Error procesando lote de alertas: {str(e)}")
+            finally:
+                close_old_connections()
+
+
+despachador_alertas_stock = DespachadorAlertasStock()
+
+
+def encolar_alertas_stock(alertas):
+    """Encola las alertas cuando la transacción actual se confirma (no se notifican cambios revertidos)."""
+    if alertas:
+        transaction.on_commit(lambda: despachador_alertas_stock.encolar(alertas))
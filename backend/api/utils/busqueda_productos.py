@@ -0,0 +1,134 @@
+import heapq
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, ExpressionWrapper, F, FloatField, Func, OuterRef, Subquery, Value
+from django.db.models.lookups import GreaterThanOrEqual
+
+from api.models import Stock
+
+# Peso de cada criterio en el puntaje; se reparten solo entre los criterios informados
+PESOS = {'nombre': 0.6, 'codigo': 0.15, 'marca': 0.15, 'categoria': 0.1}
+
+CAMPOS = {
+    'nombre': 'nombre_prodc',
+    'codigo': 'codigo_interno',
+    'marca': 'marca_fk__nombre_mprod',
+    'categoria': 'categoria_fk__nombre',
+}
+
+COLUMNAS = (
+    'id_prodc', 'nombre_prodc', 'codigo_interno', 'descripcion_prodc', 'fecha_creacion',
+    'marca_fk__nombre_mprod', 'categoria_fk__nombre',
+)
+
+_PALABRA = re.compile(r'[^\W_]+')
+
+
+def trigramas(texto):
+    """Trigramas de un texto con las mismas reglas que pg_trgm (minúsculas, palabra con relleno '  w ')."""
+    resultado = set()
+    for palabra in _PALABRA.findall((texto or '').lower()):
+        relleno = f'  {palabra} '
+        resultado.update(relleno[i:i + 3] for i in range(len(relleno) - 2))
+    return resultado
+
+
+def similitud(a, b):
+    """Equivalente en Python de similarity() de pg_trgm."""
+    trigramas_a, trigramas_b = trigramas(a), trigramas(b)
+    if not trigramas_a or not trigramas_b:
+        return 0.0
+    return len(trigramas_a & trigramas_b) / len(trigramas_a | trigramas_b)
+
+
+class Similar(Func):
+    """Operador % de pg_trgm: usa los índices GIN gin_trgm_ops de la migración 0011."""
+    arg_joiner = ' %% '
+    template = '(%(expressions)s)'
+    output_field = BooleanField()
+
+
+class Similitud(Func):
+    function = 'similarity'
+    output_field = FloatField()
+
+
+def anotar_stock(queryset, bodega_id=None, sucursal_id=None):
+    """
+    Agrega a un queryset de productos stock_actual, stock_minimo y stock_maximo del registro de
+    Stock de la ubicación (el primero por id_stock, como .first()) en la misma consulta.
+    Los productos sin stock en la ubicación quedan con None.
+    """
+    filtro = {'sucursal_fk': sucursal_id} if sucursal_id else {'bodega_fk': bodega_id}
+    registro = Stock.objects.filter(productos_fk=OuterRef('pk'), **filtro).order_by('id_stock')
+    return queryset.annotate(
+        stock_actual=Subquery(registro.values('stock')[:1]),
+        stock_minimo=Subquery(registro.values('stock_minimo')[:1]),
+        stock_maximo=Subquery(registro.values('stock_maximo')[:1]),
+    )
+
+
+def _usar_pg_trgm():
+    return connection.vendor == 'postgresql' and getattr(settings, 'BUSQUEDA_PG_TRGM', True)
+
+
+def buscar_productos_rankeados(queryset, nombre, marca=None, categoria=None, codigo_interno=None, limite=None, columnas=COLUMNAS):
+    """
+    Búsqueda aproximada de productos dentro de `queryset` (ya filtrado por ubicación).
+
+    Son candidatos los productos cuyo nombre (o código, si se indica) tiene una similitud de
+    trigramas de al menos BUSQUEDA_SIMILITUD_MINIMA; se ordenan por un puntaje ponderado de
+    nombre, código, marca y categoría y se retornan los `limite` mejores como dicts con `columnas`
+    (deben incluir las de COLUMNAS) y 'similitud'.
+    En PostgreSQL se resuelve en una consulta con pg_trgm: el operador % (que usa los índices GIN)
+    descarta con pg_trgm.similarity_threshold, fijado en BUSQUEDA_SIMILITUD_MINIMA solo dentro de la
+    transacción de la búsqueda, y el mínimo se exige además con similarity() para no depender de
+    ese ajuste. En otros motores (tests con SQLite) se leen los productos del queryset en una
+    consulta y se puntúan en memoria con las mismas reglas.
+    """
+    criterios = {
+        criterio: str(valor).strip()
+        for criterio, valor in (('nombre', nombre), ('codigo', codigo_interno), ('marca', marca), ('categoria', categoria))
+        if valor and str(valor).strip()
+    }
+    if 'nombre' not in criterios and 'codigo' not in criterios:
+        return []
+    limite = limite or getattr(settings, 'BUSQUEDA_SIMILARES_LIMITE', 10)
+    minimo = getattr(settings, 'BUSQUEDA_SIMILITUD_MINIMA', 0.3)
+    total_pesos = sum(PESOS[criterio] for criterio in criterios)
+
+    if _usar_pg_trgm():
+        filtro = None
+        for criterio in ('nombre', 'codigo'):
+            if criterio in criterios:
+                campo, valor = F(CAMPOS[criterio]), Value(criterios[criterio])
+                condicion = Similar(campo, valor) & GreaterThanOrEqual(Similitud(campo, valor), Value(minimo))
+                filtro = condicion if filtro is None else filtro | condicion
+        puntaje = ExpressionWrapper(
+            sum(
+                Value(PESOS[criterio] / total_pesos) * Similitud(F(CAMPOS[criterio]), Value(valor))
+                for criterio, valor in criterios.items()
+            ),
+            output_field=FloatField(),
+        )
+        # El umbral se fija solo para esta transacción (is_local): no queda en la conexión reutilizada
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true)", [str(minimo)])
+            filas = list(
+                queryset.filter(filtro).annotate(similitud=puntaje).order_by('-similitud', 'id_prodc').values(*columnas, 'similitud')[:limite]
+            )
+        for fila in filas:
+            fila['similitud'] = round(fila['similitud'], 4)
+        return filas
+
+    candidatos = []
+    for fila in queryset.values(*columnas):
+        similitudes = {criterio: similitud(fila[CAMPOS[criterio]], valor) for criterio, valor in criterios.items()}
+        if similitudes.get('nombre', 0) < minimo and similitudes.get('codigo', 0) < minimo:
+            continue
+        fila['similitud'] = round(sum(PESOS[c] * s for c, s in similitudes.items()) / total_pesos, 4)
+        candidatos.append(fila)
+    return heapq.nsmallest(limite, candidatos, key=lambda fila: (-fila['similitud'], fila['id_prodc']))
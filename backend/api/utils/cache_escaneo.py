@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+class CacheEscaneo:
+    """
+    LRU en proceso de códigos escaneados: codigo_interno -> filas de consultar_producto_escaneo
+    (producto y stock de todas sus ubicaciones; el payload por ubicación se arma en cada petición).
+
+    - ESCANEO_CACHE_TAMANO: máximo de códigos en memoria (0 desactiva el cache).
+    - ESCANEO_CACHE_SEGUNDOS: vigencia de cada entrada. Las escrituras de este proceso invalidan
+      al instante; la vigencia acota lo que tarda en verse un cambio hecho por otro worker.
+    - ESCANEO_CACHE_BACKEND: alias opcional de settings.CACHES compartido entre workers, que se
+      consulta cuando el código no está en memoria.
+    """
+
+    PREFIJO = 'escaneo:codigo:'
+
+    def __init__(self):
+        self._entradas = OrderedDict()
+        self._codigo_por_producto = {}
+        # Cada invalidación avanza la generación. Mientras hay cargas en curso se anotan los códigos e
+        # ids invalidados: una carga que coincide con una invalidación posterior a su inicio no se
+        # guarda (podría traer las filas anteriores a la escritura). Sin cargas en curso no se anota nada.
+        self._generacion = 0
+        self._cargas_en_curso = Counter()  # generación al iniciar -> cargas
+        self._invalidaciones = []  # [(generación, códigos, ids de productos)]
+        self._lock = threading.Lock()
+        self.aciertos_locales = 0
+        self.aciertos_compartidos = 0
+        self.fallos = 0
+
+    def _backend(self):
+        alias = getattr(settings, 'ESCANEO_CACHE_BACKEND', None)
+        return caches[alias] if alias else None
+
+    def obtener(self, codigo_interno, cargar):
+        """Retorna las filas del código desde el cache o llamando a cargar(codigo_interno)."""
+        tamano = getattr(settings, 'ESCANEO_CACHE_TAMANO', 0)
+        if not tamano:
+            return cargar(codigo_interno)
+
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(codigo_interno)
+            if entrada is not None and entrada[0] > ahora:
+                self._entradas.move_to_end(codigo_interno)
+                self.aciertos_locales += 1
+                return entrada[1]
+            inicio = self._generacion
+            self._cargas_en_curso[inicio] += 1
+
+        try:
+            backend = self._backend()
+            filas = backend.get(self.PREFIJO + codigo_interno) if backend else None
+            compartida = filas is not None
+            if compartida:
+                with self._lock:
+                    self.aciertos_compartidos += 1
+            else:
+                filas = cargar(codigo_interno)
+                with self._lock:
+                    self.fallos += 1
+                if not filas:
+                    # Los códigos inexistentes no se guardan: el producto puede crearse en cualquier momento
+                    return filas
+
+            with self._lock:
+                if self._invalidada(codigo_interno, filas[0]['id_prodc'], inicio):
+                    # Se invalidó durante la carga: se responde con lo leído pero no se guarda
+                    return filas
+                self._entradas[codigo_interno] = (ahora + getattr(settings, 'ESCANEO_CACHE_SEGUNDOS', 60), filas)
+                self._entradas.move_to_end(codigo_interno)
+                self._codigo_por_producto[filas[0]['id_prodc']] = codigo_interno
+                while len(self._entradas) > tamano:
+                    _, (_, filas_antiguas) = self._entradas.popitem(last=False)
+                    self._codigo_por_producto.pop(filas_antiguas[0]['id_prodc'], None)
+            if backend and not compartida:
+                backend.set(self.PREFIJO + codigo_interno, filas, getattr(settings, 'ESCANEO_CACHE_SEGUNDOS', 60))
+            return filas
+        finally:
+            with self._lock:
+                self._terminar_carga(inicio)
+
+    def _invalidada(self, codigo_interno, producto_id, inicio):
+        # Con el lock tomado
+        return any(
+            generacion > inicio and (codigo_interno in codigos or producto_id in productos_ids)
+            for generacion, codigos, productos_ids in self._invalidaciones
+        )
+
+    def _terminar_carga(self, inicio):
+        # Con el lock tomado: las anotaciones solo se conservan mientras alguna carga pueda necesitarlas
+        self._cargas_en_curso[inicio] -= 1
+        if not self._cargas_en_curso[inicio]:
+            del self._cargas_en_curso[inicio]
+        if not self._cargas_en_curso:
+            self._invalidaciones.clear()
+        else:
+            primera = min(self._cargas_en_curso)
+            self._invalidaciones = [anotacion for anotacion in self._invalidaciones if anotacion[0] > primera]
+
+    def _eliminar(self, codigos, productos_ids=()):
+        with self._lock:
+            self._generacion += 1
+            if self._cargas_en_curso:
+                self._invalidaciones.append((self._generacion, frozenset(codigos), frozenset(productos_ids)))
+            # Los ids se resuelven al eliminar: el código puede haberse guardado después de la escritura
+            codigos = set(codigos)
+            codigos.update(self._codigo_por_producto[p] for p in productos_ids if p in self._codigo_por_producto)
+            for codigo in codigos:
+                entrada = self._entradas.pop(codigo, None)
+                if entrada is not None:
+                    self._codigo_por_producto.pop(entrada[1][0]['id_prodc'], None)
+        backend = self._backend()
+        if backend and codigos:
+            backend.delete_many([self.PREFIJO + codigo for codigo in codigos])
+
+    def invalidar(self, codigos=(), productos_ids=()):
+        """
+        Elimina los códigos indicados y los de los productos indicados. Se aplica al instante y otra
+        vez al confirmar la transacción, para que una lectura concurrente no deje datos anteriores.
+        """
+        codigos = {codigo for codigo in codigos if codigo}
+        productos_ids = set(productos_ids)
+        if productos_ids and self._backend():
+            # El backend compartido puede tener códigos que este proceso nunca cargó
+            from api.models import Productos  # Importación local para evitar circularidad
+            codigos.update(Productos.objects.filter(id_prodc__in=productos_ids).values_list('codigo_interno', flat=True))
+        if not codigos and not productos_ids:
+            return
+        self._eliminar(codigos, productos_ids)
+        transaction.on_commit(lambda: self._eliminar(codigos, productos_ids))
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._codigo_por_producto.clear()
+            self.aciertos_locales = self.aciertos_compartidos = self.fallos = 0
+
+    def estadisticas(self):
+        with self._lock:
+            aciertos = self.aciertos_locales + self.aciertos_compartidos
+            total = aciertos + self.fallos
+            return {
+                'entradas': len(self._entradas),
+                'tamano_maximo': getattr(settings, 'ESCANEO_CACHE_TAMANO', 0),
+                'aciertos': aciertos,
+                'aciertos_locales': self.aciertos_locales,
+                'aciertos_compartidos': self.aciertos_compartidos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(aciertos / total, 4) if total else 0.0,
+                'backend_compartido': getattr(settings, 'ESCANEO_CACHE_BACKEND', None),
+            }
+
+
+cache_escaneo = CacheEscaneo()
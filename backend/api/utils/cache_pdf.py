@@ -0,0 +1,87 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from api.utils.clasificador_productos import CLASIFICADOR
+from api.utils.pdf_guias import VERSION_EXTRACTOR
+
+logger = logging.getLogger(__name__)
+
+
+def hash_archivo(archivo):
+    """SHA-256 del archivo subido, leído por bloques (deja el archivo al inicio)."""
+    sha = hashlib.sha256()
+    archivo.seek(0)
+    for bloque in archivo.chunks():
+        sha.update(bloque)
+    archivo.seek(0)
+    return sha.hexdigest()
+
+
+def _directorio():
+    return Path(getattr(settings, 'PDF_CACHE_DIR', Path(settings.BASE_DIR) / 'cache' / 'pdf_guias'))
+
+
+def _ruta(hash_contenido, clasificador=None):
+    # La versión del extractor invalida el cache cuando cambia la forma de extraer, y la huella
+    # del clasificador cuando cambian las marcas/categorías (PDF_CLASIFICADOR_DESDE_BD)
+    nombre = f'{hash_contenido}-v{VERSION_EXTRACTOR}'
+    if clasificador is not None and clasificador.huella != CLASIFICADOR.huella:
+        nombre += f'-c{clasificador.huella}'
+    return _directorio() / f'{nombre}.json'
+
+
+def obtener_resultado_cacheado(hash_contenido, clasificador=None):
+    """Retorna el resultado guardado para ese contenido (y ese clasificador) o None."""
+    if not getattr(settings, 'PDF_CACHE_MAX_BYTES', 0):
+        return None
+    ruta = _ruta(hash_contenido, clasificador)
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            resultado = json.load(f)
+        os.utime(ruta)  # Marca de uso reciente para la política de desalojo
+        return resultado
+    except (OSError, ValueError):
+        return None
+
+
+def guardar_resultado(hash_contenido, resultado, clasificador=None):
+    """Guarda el resultado y desaloja los archivos usados hace más tiempo si se supera el tamaño máximo."""
+    maximo = getattr(settings, 'PDF_CACHE_MAX_BYTES', 0)
+    if not maximo:
+        return
+    try:
+        ruta = _ruta(hash_contenido, clasificador)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        # Escritura atómica: otro worker nunca lee un JSON a medio escribir
+        descriptor, temporal = tempfile.mkstemp(dir=ruta.parent, suffix='.tmp')
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, ensure_ascii=False)
+        os.replace(temporal, ruta)
+        _desalojar(ruta.parent, maximo)
+    except OSError as e:
+        logger.warning(f"[PDF] No se pudo guardar el resultado en cache: {str(e)}")
+
+
+def _desalojar(directorio, maximo):
+    archivos = []
+    for ruta in directorio.glob('*.json'):
+        try:
+            info = ruta.stat()
+        except OSError:
+            continue
+        archivos.append((info.st_mtime, info.st_size, ruta))
+    total = sum(tamano for _, tamano, _ in archivos)
+    for _, tamano, ruta in sorted(archivos):
+        if total <= maximo:
+            break
+        try:
+            ruta.unlink()
+            total -= tamano
+        except OSError:
+            continue
@@ -0,0 +1,144 @@
+import hashlib
+import re
+import time
+
+MARCAS = [
+    'Stanley', 'Bosch', 'Makita', 'Dewalt', 'Black+Decker', 'Einhell', 'Truper', 'Irwin', 'Hilti', '3M'
+]
+
+CATEGORIAS = {
+    'Herramientas manuales': ['martillo', 'destornillador', 'llave inglesa', 'alicate'],
+    'Herramientas eléctricas': ['taladro', 'atornillador', 'amoladora', 'sierracircular'],
+    'Materiales de fijación': ['clavo', 'tornillo', 'perno', 'tarugo'],
+    'Medición y nivelación': ['cinta métrica', 'nivel', 'escuadra'],
+    'Seguridad industrial': ['guantes', 'gafas', 'casco', 'mascarilla'],
+    'Accesorios': ['broca', 'disco de corte', 'hoja de sierra']
+}
+
+
+def _trie_a_regex(nodo):
+    # Cada nodo es {caracter: hijo}; la clave '' marca fin de palabra
+    fin = '' in nodo
+    ramas = [re.escape(caracter) + _trie_a_regex(hijo) for caracter, hijo in sorted(nodo.items()) if caracter]
+    if not ramas:
+        return ''
+    cuerpo = ramas[0] if len(ramas) == 1 else '(?:' + '|'.join(ramas) + ')'
+    if fin:
+        # La continuación es opcional; el cuantificador codicioso prefiere la palabra más larga
+        return '(?:' + cuerpo + ')?' if len(ramas) == 1 else cuerpo + '?'
+    return cuerpo
+
+
+def _trie(palabras):
+    raiz = {}
+    for palabra in palabras:
+        if not palabra:
+            continue
+        nodo = raiz
+        for caracter in palabra:
+            nodo = nodo.setdefault(caracter, {})
+        nodo[''] = {}
+    return _trie_a_regex(raiz)
+
+
+def _alternancia_solapada(palabras):
+    """
+    Una sola expresión para todas las palabras, construida como trie (prefijos comunes
+    compartidos) para que el motor no pruebe cada alternativa desde cero en cada posición.
+    Va dentro de un lookahead para que finditer pruebe todas las posiciones aunque las palabras
+    se solapen; en cada posición el grupo 1 es la más larga. Usar con _palabras_en.
+    """
+    return re.compile('(?=(' + _trie(palabras) + '))')
+
+
+def _palabras_en(patron, indice, texto):
+    """
+    Todas las palabras de `indice` que aparecen en `texto`, también las solapadas o contenidas en
+    otra (ej. 'sierra' y 'sierracircular'): lo mismo que probar `palabra in texto` para cada una.
+    """
+    for coincidencia in patron.finditer(texto):
+        palabra = coincidencia.group(1)
+        # En una posición el trie da la palabra más larga; las más cortas son prefijos suyos
+        for largo in range(1, len(palabra)):
+            if palabra[:largo] in indice:
+                yield palabra[:largo]
+        yield palabra
+
+
+class ClasificadorProductos:
+    """
+    Infiere marca y categoría de un nombre de producto con UNA expresión precompilada
+    para las marcas y otra para todas las palabras clave de categorías, en lugar de
+    recorrer cada lista con .lower() por fila.
+
+    Conserva la prioridad de las listas: si el nombre contiene varias marcas (o palabras
+    de varias categorías) gana la que aparece primero en MARCAS/CATEGORIAS.
+    """
+
+    def __init__(self, marcas=MARCAS, categorias=CATEGORIAS):
+        self._marcas = {}
+        for prioridad, marca in enumerate(marcas):
+            self._marcas.setdefault(marca.lower(), (prioridad, marca))
+        self._palabras = {}
+        for prioridad, (categoria, palabras) in enumerate(categorias.items()):
+            for palabra in palabras:
+                self._palabras.setdefault(palabra.lower(), (prioridad, categoria))
+        self._patron_marcas = _alternancia_solapada(self._marcas) if self._marcas else None
+        self._patron_categorias = _alternancia_solapada(self._palabras) if self._palabras else None
+        # Identifica las listas usadas: dos clasificadores con la misma huella clasifican igual
+        self.huella = hashlib.sha256(repr((sorted(self._marcas.items()), sorted(self._palabras.items()))).encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def _mejor(patron, indice, texto):
+        mejor = None
+        if patron is None:
+            return None
+        for palabra in _palabras_en(patron, indice, texto):
+            candidato = indice[palabra]
+            if mejor is None or candidato[0] < mejor[0]:
+                mejor = candidato
+                if mejor[0] == 0:
+                    break
+        return mejor[1] if mejor else None
+
+    def clasificar(self, nombre):
+        """Retorna (marca, categoria); marca '' y categoría 'General' si no hay coincidencias."""
+        nombre_min = nombre.lower()
+        marca = self._mejor(self._patron_marcas, self._marcas, nombre_min) or ''
+        categoria = self._mejor(self._patron_categorias, self._palabras, nombre_min) or 'General'
+        return marca, categoria
+
+
+CLASIFICADOR = ClasificadorProductos()
+
+_clasificador_bd = None
+_clasificador_bd_hasta = 0
+
+
+def clasificador_desde_bd():
+    """
+    Clasificador con las listas base más las marcas y categorías registradas en las tablas
+    Marca/Categoria (el nombre de cada categoría se usa como palabra clave).
+    """
+    from api.models import Marca, Categoria
+    marcas = MARCAS + [nombre for nombre in Marca.objects.values_list('nombre_mprod', flat=True) if nombre]
+    categorias = {categoria: list(palabras) for categoria, palabras in CATEGORIAS.items()}
+    for nombre in Categoria.objects.values_list('nombre', flat=True):
+        if nombre and nombre not in categorias:
+            categorias[nombre] = [nombre.lower()]
+    return ClasificadorProductos(marcas, categorias)
+
+
+def obtener_clasificador():
+    """
+    Clasificador a usar en la extracción: el fijo o, con PDF_CLASIFICADOR_DESDE_BD, uno
+    construido desde la BD y reutilizado durante PDF_CLASIFICADOR_SEGUNDOS.
+    """
+    global _clasificador_bd, _clasificador_bd_hasta
+    from django.conf import settings
+    if not getattr(settings, 'PDF_CLASIFICADOR_DESDE_BD', False):
+        return CLASIFICADOR
+    if _clasificador_bd is None or time.monotonic() > _clasificador_bd_hasta:
+        _clasificador_bd = clasificador_desde_bd()
+        _clasificador_bd_hasta = time.monotonic() + getattr(settings, 'PDF_CLASIFICADOR_SEGUNDOS', 300)
+    return _clasificador_bd
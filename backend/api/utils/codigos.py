@@ -0,0 +1,83 @@
+from collections import Counter
+
+from django.db import IntegrityError, models, transaction
+
+from api.models import ContadorCodigo, Productos
+
+
+def _ultimos_existentes(patrones):
+    """
+    Último correlativo ya usado en productos (de cualquier bodega o sucursal) para cada patrón
+    {CAT}-{MARCA}-{MODELO}-{YYYYMM}, en una consulta. Solo se usa al crear un contador: los códigos
+    generados antes de existir la tabla se respetan.
+    """
+    filtro = models.Q()
+    for patron in patrones:
+        filtro |= models.Q(codigo_interno__startswith=f'{patron}-')
+    ultimos = {}
+    for codigo in Productos.objects.filter(filtro).values_list('codigo_interno', flat=True):
+        patron, _, correlativo = codigo.rpartition('-')
+        if patron not in patrones:
+            continue
+        try:
+            ultimos[patron] = max(ultimos.get(patron, 0), int(correlativo))
+        except ValueError:
+            continue
+    return ultimos
+
+
+def reservar_codigos(patrones):
+    """
+    Reserva un código {patron}-{NNN} por cada elemento de `patrones` (lista de patrones de
+    patron_codigo_unico, con repeticiones) y los retorna en el mismo orden.
+
+    Hay un contador por patrón y mes, compartido por todas las bodegas y sucursales: codigo_interno
+    es único en toda la tabla de productos, por lo que dos ubicaciones no pueden repetir correlativo.
+
+    Todos los contadores involucrados se bloquean con un solo SELECT ... FOR UPDATE y se avanzan
+    con un solo UPDATE, dentro de la transacción de quien llama: dos ingresos concurrentes nunca
+    reciben el mismo correlativo, y si la transacción se revierte los correlativos vuelven a quedar
+    libres. Los contadores que no existen se crean partiendo del último código ya registrado.
+    """
+    cantidades = Counter(patrones)
+    if not cantidades:
+        return []
+    claves = {patron: tuple(patron.rsplit('-', 1)) for patron in cantidades}  # (prefijo, periodo)
+
+    with transaction.atomic():
+        filtro = models.Q()
+        for prefijo, periodo in claves.values():
+            filtro |= models.Q(prefijo=prefijo, periodo=periodo)
+        # Orden fijo de bloqueo: evita interbloqueos entre ingresos con patrones en común
+        contadores = {
+            (contador.prefijo, contador.periodo): contador
+            for contador in ContadorCodigo.objects.select_for_update().filter(filtro).order_by('prefijo', 'periodo')
+        }
+
+        faltantes = sorted(patron for patron in cantidades if claves[patron] not in contadores)
+        if faltantes:
+            ultimos = _ultimos_existentes(set(faltantes))
+            try:
+                with transaction.atomic():
+                    creados = ContadorCodigo.objects.bulk_create([
+                        ContadorCodigo(prefijo=claves[patron][0], periodo=claves[patron][1], ultimo=ultimos.get(patron, 0))
+                        for patron in faltantes
+                    ])
+            except IntegrityError:
+                # Otro ingreso creó alguno de estos contadores al mismo tiempo: se vuelven a bloquear
+                return reservar_codigos(patrones)
+            for contador in creados:
+                contadores[(contador.prefijo, contador.periodo)] = contador
+
+        siguientes = {}
+        for patron, cantidad in cantidades.items():
+            contador = contadores[claves[patron]]
+            siguientes[patron] = contador.ultimo + 1
+            contador.ultimo += cantidad
+        ContadorCodigo.objects.bulk_update(list(contadores.values()), ['ultimo'])
+
+    codigos = []
+    for patron in patrones:
+        codigos.append(f'{patron}-{siguientes[patron]:03d}')
+        siguientes[patron] += 1
+    return codigos
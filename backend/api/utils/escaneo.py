@@ -0,0 +1,101 @@
+from django.db.models import OuterRef, Subquery
+
+from api.models import Productos, BodegaCentral, Sucursal
+
+
+def consultar_producto_escaneo(codigo_interno):
+    """
+    Resuelve un código escaneado en una sola consulta: producto activo, marca, categoría y
+    una fila por cada ubicación con stock (LEFT JOIN), con el nombre de la bodega o sucursal.
+    Retorna la lista de filas (vacía si el producto no existe o está inactivo).
+    """
+    return list(
+        Productos.objects.filter(codigo_interno=codigo_interno, activo=True).annotate(
+            nombre_bodega=Subquery(BodegaCentral.objects.filter(id_bdg=OuterRef('stock__bodega_fk')).values('nombre_bdg')[:1]),
+            nombre_sucursal=Subquery(Sucursal.objects.filter(id=OuterRef('stock__sucursal_fk')).values('nombre_sucursal')[:1]),
+        ).values(
+            'id_prodc', 'nombre_prodc', 'codigo_interno', 'descripcion_prodc', 'fecha_creacion',
+            'marca_fk__nombre_mprod', 'categoria_fk__nombre',
+            'stock__bodega_fk', 'stock__sucursal_fk', 'stock__stock', 'stock__stock_minimo', 'stock__stock_maximo',
+            'nombre_bodega', 'nombre_sucursal',
+        ).order_by('stock__id_stock')
+    )
+
+
+def estado_stock(stock_actual, stock_minimo, stock_maximo=None):
+    """Retorna (estado, color) con los mismos umbrales que usa el escáner móvil."""
+    if stock_actual <= 0:
+        return 'SIN_STOCK', '#ff4444'
+    if stock_actual <= stock_minimo:
+        return 'CRÍTICO', '#ff8800'
+    if stock_actual <= stock_minimo * 1.5:
+        return 'BAJO', '#ffaa00'
+    if stock_maximo and stock_actual > stock_maximo:
+        return 'SOBRE_STOCK', '#4caf50'
+    return 'NORMAL', '#00aa00'
+
+
+def _nombre_ubicacion(fila):
+    if fila['stock__bodega_fk']:
+        return f"Bodega: {fila['nombre_bodega']}" if fila['nombre_bodega'] else "Bodega Central"
+    if fila['stock__sucursal_fk']:
+        return f"Sucursal: {fila['nombre_sucursal']}" if fila['nombre_sucursal'] else "Sucursal"
+    return None
+
+
+def armar_payload_escaneo(filas, bodega_id=None, sucursal_id=None, con_maximo=False):
+    """
+    Arma el payload de 'producto' del escáner a partir de las filas de consultar_producto_escaneo.
+    El stock principal es el de la ubicación indicada (la del usuario que escanea); sin ubicación
+    se usa la primera con stock. 'stocks' lista todas las ubicaciones del producto.
+    Con con_maximo se incluye stock_maximo y el estado SOBRE_STOCK (producto_por_codigo_unico).
+    """
+    fila = filas[0]
+    stocks = [
+        {
+            'bodega_id': f['stock__bodega_fk'],
+            'sucursal_id': f['stock__sucursal_fk'],
+            'ubicacion': _nombre_ubicacion(f),
+            'stock': float(f['stock__stock']),
+            'stock_minimo': float(f['stock__stock_minimo']) if f['stock__stock_minimo'] else 0,
+            'stock_maximo': float(f['stock__stock_maximo']) if f['stock__stock_maximo'] else 0,
+        }
+        for f in filas if f['stock__stock'] is not None
+    ]
+
+    if bodega_id or sucursal_id:
+        if bodega_id:
+            principal = next((s for s in stocks if s['bodega_id'] == bodega_id), None)
+        else:
+            principal = next((s for s in stocks if s['sucursal_id'] == sucursal_id), None)
+        ubicacion = principal['ubicacion'] if principal else "Sin stock en esta ubicación"
+    else:
+        principal = stocks[0] if stocks else None
+        ubicacion = principal['ubicacion'] if principal else "Sin ubicación asignada"
+
+    stock_actual = principal['stock'] if principal else 0
+    stock_minimo = principal['stock_minimo'] if principal else 0
+    stock_maximo = principal['stock_maximo'] if principal else 0
+    estado, color = estado_stock(stock_actual, stock_minimo, stock_maximo if con_maximo else None)
+
+    payload = {
+        'id': fila['id_prodc'],
+        'nombre': fila['nombre_prodc'],
+        'codigo_interno': fila['codigo_interno'],
+        'descripcion': fila['descripcion_prodc'],
+        'marca': fila['marca_fk__nombre_mprod'],
+        'categoria': fila['categoria_fk__nombre'],
+        'stock_actual': stock_actual,
+        'stock_minimo': stock_minimo,
+    }
+    if con_maximo:
+        payload['stock_maximo'] = stock_maximo
+    payload.update({
+        'estado_stock': estado,
+        'color_estado': color,
+        'ubicacion': ubicacion,
+        'stock_total': sum(s['stock'] for s in stocks),
+        'stocks': stocks,
+        'fecha_creacion': fila['fecha_creacion'].isoformat() if fila['fecha_creacion'] else None,
+    })
+    return payload
@@ -0,0 +1,190 @@
+import re
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image
+
+from api.utils.qr import obtener_qr_png
+
+# Hoja A4 en puntos, con una grilla de etiquetas (código QR arriba, código y nombre abajo)
+ANCHO_HOJA, ALTO_HOJA = 595, 842
+MARGEN = 20
+COLUMNAS, FILAS = 3, 7
+LADO_QR = 78
+ETIQUETAS_POR_HOJA = COLUMNAS * FILAS
+
+
+def _mapear_en_orden(funcion, productos, hilos, ventana):
+    """
+    Aplica `funcion` al código de cada producto en un pool de hilos y entrega
+    (producto, resultado) en el orden original. Nunca hay más de `ventana` imágenes
+    pendientes, así la memoria no depende del número de productos.
+    Se usan hilos: las imágenes salen del cache en disco de api/utils/qr.py y zlib/Pillow
+    liberan el GIL mientras comprimen.
+    """
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        pendientes = deque()
+        for producto in productos:
+            pendientes.append((producto, pool.submit(funcion, producto[2])))
+            if len(pendientes) >= ventana:
+                anterior, futuro = pendientes.popleft()
+                yield anterior, futuro.result()
+        while pendientes:
+            anterior, futuro = pendientes.popleft()
+            yield anterior, futuro.result()
+
+
+class _SalidaEnTrozos:
+    """Destino de escritura que acumula bytes hasta que la respuesta los consume."""
+
+    def __init__(self):
+        self._buffer = BytesIO()
+
+    def write(self, datos):
+        return self._buffer.write(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = self._buffer.getvalue()
+        self._buffer = BytesIO()
+        return datos
+
+
+def _nombre_archivo(codigo_interno):
+    return re.sub(r'[^A-Za-z0-9._-]', '_', codigo_interno) or 'producto'
+
+
+def generar_zip_etiquetas(productos, hilos=None):
+    """
+    Genera un ZIP con un PNG por producto a medida que se producen las imágenes.
+    `productos` es un iterable de (id, nombre, codigo_interno).
+    """
+    hilos = hilos or getattr(settings, 'QR_EXPORTACION_HILOS', 4)
+    salida = _SalidaEnTrozos()
+    nombres_usados = set()
+    # PNG ya viene comprimido: se guarda sin volver a comprimir
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_STORED) as archivo_zip:
+        for (id_prodc, _, codigo), png in _mapear_en_orden(obtener_qr_png, productos, hilos, hilos * 4):
+            nombre = _nombre_archivo(codigo)
+            if nombre in nombres_usados:
+                nombre = f'{nombre}-{id_prodc}'
+            nombres_usados.add(nombre)
+            archivo_zip.writestr(f'{nombre}.png', png)
+            yield salida.vaciar()
+    yield salida.vaciar()
+
+
+def _imagen_pdf(codigo_interno):
+    """QR del producto como imagen de 1 bit comprimida con Flate, lista para incrustar en el PDF."""
+    imagen = Image.open(BytesIO(obtener_qr_png(codigo_interno))).convert('1')
+    return imagen.width, imagen.height, zlib.compress(imagen.tobytes())
+
+
+def _texto_pdf(texto, maximo):
+    texto = texto if len(texto) <= maximo else texto[:maximo - 1] + '…'
+    datos = texto.encode('cp1252', errors='replace')
+    return datos.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+class _EscritorPDF:
+    """
+    Escritor mínimo de PDF en flujo: cada objeto se entrega apenas se arma y solo se
+    guardan los desplazamientos para la tabla xref final.
+    """
+
+    def __init__(self):
+        self.desplazamientos = {}
+        self.posicion = 0
+        self.siguiente = 1
+
+    def reservar(self):
+        numero = self.siguiente
+        self.siguiente += 1
+        return numero
+
+    def _emitir(self, datos):
+        self.posicion += len(datos)
+        return datos
+
+    def cabecera(self):
+        return self._emitir(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def objeto(self, numero, diccionario, flujo=None):
+        self.desplazamientos[numero] = self.posicion
+        datos = b'%d 0 obj\n' % numero + diccionario
+        if flujo is not None:
+            datos += b'\nstream\n' + flujo + b'\nendstream'
+        return self._emitir(datos + b'\nendobj\n')
+
+    def cierre(self, raiz):
+        total = self.siguiente
+        xref = [b'xref\n0 %d\n' % total, b'0000000000 65535 f \n']
+        for numero in range(1, total):
+            xref.append(b'%010d 00000 n \n' % self.desplazamientos[numero])
+        inicio_xref = self.posicion
+        xref.append(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (total, raiz, inicio_xref))
+        return self._emitir(b''.join(xref))
+
+
+def generar_pdf_etiquetas(productos, hilos=None):
+    """
+    Genera un PDF de varias hojas con etiquetas QR, emitiendo cada hoja apenas están sus
+    imágenes. `productos` es un iterable de (id, nombre, codigo_interno).
+    """
+    hilos = hilos or getattr(settings, 'QR_EXPORTACION_HILOS', 4)
+    pdf = _EscritorPDF()
+    catalogo, paginas, fuente = pdf.reservar(), pdf.reservar(), pdf.reservar()
+    yield pdf.cabecera()
+    yield pdf.objeto(catalogo, b'<< /Type /Catalog /Pages %d 0 R >>' % paginas)
+    yield pdf.objeto(fuente, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+
+    ancho_celda = (ANCHO_HOJA - 2 * MARGEN) / COLUMNAS
+    alto_celda = (ALTO_HOJA - 2 * MARGEN) / FILAS
+    hojas = []
+    hoja = []
+
+    def cerrar_hoja():
+        recursos, contenido = [], []
+        for posicion, (numero_imagen, nombre, codigo) in enumerate(hoja):
+            columna, fila = posicion % COLUMNAS, posicion // COLUMNAS
+            x = MARGEN + columna * ancho_celda
+            y = ALTO_HOJA - MARGEN - (fila + 1) * alto_celda
+            recursos.append(b'/Im%d %d 0 R' % (numero_imagen, numero_imagen))
+            contenido.append(
+                b'q %d 0 0 %d %.2f %.2f cm /Im%d Do Q\n' % (LADO_QR, LADO_QR, x + (ancho_celda - LADO_QR) / 2, y + 24, numero_imagen)
+                + b'BT /F1 9 Tf %.2f %.2f Td (%s) Tj ET\n' % (x + 8, y + 13, _texto_pdf(codigo, 34))
+                + b'BT /F1 7 Tf %.2f %.2f Td (%s) Tj ET\n' % (x + 8, y + 4, _texto_pdf(nombre, 44))
+            )
+        numero_contenido, numero_hoja = pdf.reservar(), pdf.reservar()
+        flujo = zlib.compress(b''.join(contenido))
+        datos = pdf.objeto(numero_contenido, b'<< /Length %d /Filter /FlateDecode >>' % len(flujo), flujo)
+        datos += pdf.objeto(numero_hoja, (
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R '
+            b'/Resources << /Font << /F1 %d 0 R >> /XObject << %s >> >> >>'
+        ) % (paginas, ANCHO_HOJA, ALTO_HOJA, numero_contenido, fuente, b' '.join(recursos)))
+        hojas.append(numero_hoja)
+        hoja.clear()
+        return datos
+
+    for (_, nombre, codigo), (ancho, alto, datos_imagen) in _mapear_en_orden(_imagen_pdf, productos, hilos, ETIQUETAS_POR_HOJA):
+        numero_imagen = pdf.reservar()
+        yield pdf.objeto(numero_imagen, (
+            b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray '
+            b'/BitsPerComponent 1 /Filter /FlateDecode /Length %d >>'
+        ) % (ancho, alto, len(datos_imagen)), datos_imagen)
+        hoja.append((numero_imagen, nombre, codigo))
+        if len(hoja) == ETIQUETAS_POR_HOJA:
+            yield cerrar_hoja()
+
+    if hoja or not hojas:
+        # Sin productos se entrega una hoja en blanco para que el PDF siga siendo válido
+        yield cerrar_hoja()
+    kids = b' '.join(b'%d 0 R' % numero for numero in hojas)
+    yield pdf.objeto(paginas, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(hojas)))
+    yield pdf.cierre(catalogo)
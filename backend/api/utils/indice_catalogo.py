@@ -0,0 +1,185 @@
+import re
+import threading
+import time
+
+from django.conf import settings
+
+# Códigos generados: {CAT}-{MARCA}-{MODELO}-{YYYYMM}-{NNN}
+_CODIGO_GENERADO = re.compile(r'^(.+)-\d{6}-\d+$')
+
+
+def normalizar(texto):
+    """Texto comparable como un iexact tolerante: sin mayúsculas y con los espacios colapsados."""
+    return ' '.join(str(texto or '').split()).casefold()
+
+
+def clave_catalogo(nombre, marca, categoria):
+    return normalizar(nombre), normalizar(marca), normalizar(categoria)
+
+
+def clave_producto(producto):
+    """Clave de un producto con marca y categoría cargadas (select_related)."""
+    return clave_catalogo(producto.nombre_prodc, producto.marca_fk.nombre_mprod, producto.categoria_fk.nombre)
+
+
+def variante_desde_codigo(codigo_interno):
+    """
+    Tramo {CAT}-{MARCA}-{MODELO} de un código generado (sin fecha ni correlativo), que es donde
+    queda registrado el modelo: Productos no tiene columna propia. None si el código no sigue el
+    formato (códigos manuales o antiguos).
+    """
+    coincidencia = _CODIGO_GENERADO.match(codigo_interno or '')
+    return coincidencia.group(1).upper() if coincidencia else None
+
+
+def _ubicaciones(bodega_id, sucursal_id):
+    ubicaciones = []
+    if bodega_id:
+        ubicaciones.append(('bodega', int(bodega_id)))
+    if sucursal_id:
+        ubicaciones.append(('sucursal', int(sucursal_id)))
+    return ubicaciones
+
+
+class IndiceCatalogo:
+    """
+    Índice en proceso de los productos activos de cada bodega/sucursal:
+    (nombre, marca, categoría) normalizados -> {variante: ids}, donde la variante es el tramo
+    {CAT}-{MARCA}-{MODELO} del código (ver variante_desde_codigo).
+
+    - Cada ubicación se carga con una consulta la primera vez que se usa y se recarga al vencer
+      CATALOGO_INDICE_SEGUNDOS, que acota lo que tarda en verse un producto creado por otro worker.
+    - Productos.save() mantiene al día las ubicaciones ya cargadas; las creaciones con bulk_create
+      deben llamar a registrar().
+    - Un id encontrado puede corresponder a una escritura revertida o de otro worker: quien lo usa
+      lo carga desde la BD y, si ya no existe, está inactivo o su clave cambió, llama a olvidar().
+    - Cada ubicación se carga fuera del lock general (una carga a la vez por ubicación). Los cambios
+      que llegan mientras tanto (registrar/olvidar) quedan pendientes y se aplican sobre el índice
+      recién cargado, que puede no incluirlos si la consulta empezó antes de la escritura.
+    """
+
+    def __init__(self):
+        # (tipo, id) -> {'vence': t, 'claves': {clave: {variante: set(ids)}}, 'productos': {id: (clave, variante)}}
+        self._ubicaciones = {}
+        # (tipo, id) -> cambios recibidos durante la carga en curso: [(id, (clave, variante) o None)]
+        self._pendientes = {}
+        self._cargas = {}  # (tipo, id) -> Lock de carga de la ubicación
+        self._lock = threading.Lock()
+
+    def _cargar(self, ubicacion):
+        from api.models import Productos  # Importación local para evitar circularidad
+        tipo, ubicacion_id = ubicacion
+        filas = Productos.objects.filter(activo=True, **{f'{tipo}_fk': ubicacion_id}).values_list(
+            'id_prodc', 'nombre_prodc', 'marca_fk__nombre_mprod', 'categoria_fk__nombre', 'codigo_interno'
+        )
+        indice = {'vence': time.monotonic() + getattr(settings, 'CATALOGO_INDICE_SEGUNDOS', 300), 'claves': {}, 'productos': {}}
+        for producto_id, nombre, marca, categoria, codigo in filas:
+            self._agregar(indice, producto_id, clave_catalogo(nombre, marca, categoria), variante_desde_codigo(codigo))
+        return indice
+
+    @staticmethod
+    def _agregar(indice, producto_id, clave, variante):
+        indice['claves'].setdefault(clave, {}).setdefault(variante, set()).add(producto_id)
+        indice['productos'][producto_id] = (clave, variante)
+
+    @staticmethod
+    def _quitar(indice, producto_id):
+        anterior = indice['productos'].pop(producto_id, None)
+        if anterior is None:
+            return
+        clave, variante = anterior
+        variantes = indice['claves'][clave]
+        variantes[variante].discard(producto_id)
+        if not variantes[variante]:
+            del variantes[variante]
+        if not variantes:
+            del indice['claves'][clave]
+
+    def _indice(self, ubicacion, recargar=False):
+        with self._lock:
+            indice = self._ubicaciones.get(ubicacion)
+            if not recargar and indice is not None and indice['vence'] > time.monotonic():
+                return indice
+            carga = self._cargas.setdefault(ubicacion, threading.Lock())
+        with carga:
+            with self._lock:
+                indice = self._ubicaciones.get(ubicacion)
+                if not recargar and indice is not None and indice['vence'] > time.monotonic():
+                    return indice  # La cargó otro hilo mientras se esperaba
+                self._pendientes[ubicacion] = []
+            try:
+                indice = self._cargar(ubicacion)
+            except Exception:
+                with self._lock:
+                    self._pendientes.pop(ubicacion, None)
+                raise
+            # En el mismo bloque: un cambio posterior ya encuentra la ubicación cargada
+            with self._lock:
+                for producto_id, entrada in self._pendientes.pop(ubicacion):
+                    self._quitar(indice, producto_id)
+                    if entrada is not None:
+                        self._agregar(indice, producto_id, *entrada)
+                self._ubicaciones[ubicacion] = indice
+        return indice
+
+    def precargar(self, bodega_id=None, sucursal_id=None):
+        """Carga (o recarga) las ubicaciones indicadas antes de la primera búsqueda."""
+        for ubicacion in _ubicaciones(bodega_id, sucursal_id):
+            self._indice(ubicacion, recargar=True)
+
+    def buscar(self, nombre, marca, categoria, variante=None, bodega_id=None, sucursal_id=None):
+        """
+        Retorna el id del producto activo de la ubicación con ese nombre, marca y categoría, o None.
+        Con variante solo se aceptan los productos de esa variante o sin variante conocida; sin ella,
+        cualquiera. Entre varios coincidentes se retorna el de menor id.
+        """
+        ubicacion = next(iter(_ubicaciones(bodega_id, sucursal_id)), None)
+        if ubicacion is None:
+            return None
+        indice = self._indice(ubicacion)
+        clave = clave_catalogo(nombre, marca, categoria)
+        with self._lock:
+            variantes = indice['claves'].get(clave)
+            if not variantes:
+                return None
+            if variante is None:
+                candidatos = set().union(*variantes.values())
+            else:
+                candidatos = variantes.get(variante.upper(), set()) | variantes.get(None, set())
+            return min(candidatos) if candidatos else None
+
+    def _olvidar(self, producto_id):
+        # Con el lock tomado
+        for indice in self._ubicaciones.values():
+            self._quitar(indice, producto_id)
+        for pendientes in self._pendientes.values():
+            pendientes.append((producto_id, None))
+
+    def registrar(self, producto):
+        """Actualiza las ubicaciones cargadas (o en carga) con el estado actual de `producto` (creado, editado o desactivado)."""
+        propias = _ubicaciones(producto.bodega_fk_id, producto.sucursal_fk_id)
+        with self._lock:
+            self._olvidar(producto.id_prodc)
+            if not producto.activo or not any(u in self._ubicaciones or u in self._pendientes for u in propias):
+                return
+        # Fuera del lock: marca y categoría pueden requerir una consulta si no vienen cargadas
+        entrada = (clave_producto(producto), variante_desde_codigo(producto.codigo_interno))
+        with self._lock:
+            for ubicacion in propias:
+                indice = self._ubicaciones.get(ubicacion)
+                if indice is not None:
+                    self._quitar(indice, producto.id_prodc)
+                    self._agregar(indice, producto.id_prodc, *entrada)
+                if ubicacion in self._pendientes:
+                    self._pendientes[ubicacion].append((producto.id_prodc, entrada))
+
+    def olvidar(self, producto_id):
+        with self._lock:
+            self._olvidar(producto_id)
+
+    def limpiar(self):
+        with self._lock:
+            self._ubicaciones.clear()
+
+
+indice_catalogo = IndiceCatalogo()
@@ -0,0 +1,79 @@
+import re
+from functools import lru_cache
+
+from api.utils.clasificador_productos import _alternancia_solapada, _palabras_en
+
+# Variantes reconocidas en el nombre, en orden de prioridad: gana el primer patrón que aparezca
+# en cualquier parte del nombre (no la coincidencia más a la izquierda entre todos)
+PATRONES_MODELO = [
+    r"(\d+\s?(m|ml|l|kg|g|cm|mm|pcs|un|lt|mts|mt|x\d+))",  # Medidas y cantidades
+    r"(\d+\s?(w|kw|hp|v|ah|hz|rpm|bar|psi|amp|a|kva|kcal|btu))",  # Potencias, voltajes, energía
+    r"(\d+/\d+\s?\"|\d+\s?\"|\d+/\d+\s?''|\d+\s?'')",  # Fracciones y pulgadas (doble y simple)
+    r"(\d+\s?mm|\d+\s?cm|\d+\s?m)",  # Milímetros, centímetros, metros
+    r"(rojo|azul|verde|negro|blanco|amarillo|gris|naranja|madera|inox|cobre|plata|dorado|transparente|beige|marrón|morado|celeste|turquesa|ocre|pino|nogal|grafito|acero|galvanizado|zinc)",  # Colores y materiales
+    r"(grande|pequeño|mediano|extra|mini|maxi|compacto|industrial|profesional|hogar|básico|premium)",  # Tamaños y calidades
+    r"(\d+\s?kg|\d+\s?g|\d+\s?lb|\d+\s?ton)",  # Pesos
+    r"(\d+\s?ml|\d+\s?l|\d+\s?cc)",  # Volúmenes
+    r"(\d+\s?panel|\d+\s?placa|\d+\s?rollo|\d+\s?bolsa|\d+\s?caja|\d+\s?bulto|\d+\s?barril|\d+\s?galón)",  # Unidades de empaque
+]
+
+# Patrones que son listas de palabras; todos los demás empiezan con un número
+_PRIORIDADES_PALABRAS = (4, 5)
+_PRIORIDADES_NUMERICAS = [i for i in range(len(PATRONES_MODELO)) if i not in _PRIORIDADES_PALABRAS]
+
+# Todos los patrones numéricos en una expresión, un grupo con nombre por prioridad. Se prueba solo
+# donde empieza un número: como cada patrón empieza con \d+, su coincidencia más a la izquierda
+# empieza siempre al inicio de un número, y en una misma posición la alternancia respeta la prioridad.
+_NUMERICOS = re.compile(
+    '|'.join(f'(?P<p{i}>{re.sub(r"[(](?![?])", "(?:", PATRONES_MODELO[i])})' for i in _PRIORIDADES_NUMERICAS),
+    re.IGNORECASE
+)
+_INICIO_NUMERO = re.compile(r'(?<!\d)\d')
+
+# Palabras de colores/materiales y tamaños/calidades -> prioridad, en una sola alternancia (trie).
+# Se buscan también solapadas: en 'mininox' cuenta 'inox' aunque 'mini' empiece antes
+_PALABRAS = {
+    palabra: prioridad
+    for prioridad in _PRIORIDADES_PALABRAS
+    for palabra in PATRONES_MODELO[prioridad][1:-1].split('|')
+}
+_PATRON_PALABRAS = _alternancia_solapada(_PALABRAS)
+
+
+@lru_cache(maxsize=10000)
+def extraer_modelo_desde_nombre(nombre):
+    """
+    Extrae una variante/modelo relevante del nombre del producto (ej: 10m, 500ml, 2L, 500W, 220V, 1HP, 1/2", 16mm, 10'', etc.)
+    Si no encuentra, retorna 'GEN'.
+    Mismo resultado que probar PATRONES_MODELO uno a uno, recorriendo el nombre una vez para los
+    patrones numéricos y otra para las palabras (solo si ningún número tiene más prioridad).
+    """
+    mejor = None  # (prioridad, texto)
+    for numero in _INICIO_NUMERO.finditer(nombre):
+        coincidencia = _NUMERICOS.match(nombre, numero.start())
+        if coincidencia is None:
+            continue
+        prioridad = int(coincidencia.lastgroup[1:])
+        if mejor is None or prioridad < mejor[0]:
+            mejor = (prioridad, coincidencia.group(coincidencia.lastgroup))
+            if prioridad == 0:
+                break
+    if mejor is None or mejor[0] > _PRIORIDADES_PALABRAS[0]:
+        for palabra in _palabras_en(_PATRON_PALABRAS, _PALABRAS, nombre.lower()):
+            prioridad = _PALABRAS[palabra]
+            if mejor is None or prioridad < mejor[0]:
+                mejor = (prioridad, palabra)
+                if prioridad == _PRIORIDADES_PALABRAS[0]:
+                    break
+    if mejor is None:
+        return 'GEN'
+    return mejor[1].replace(' ', '').upper()
+
+
+def extraer_modelos(nombres):
+    """Versión por lotes: retorna el modelo de cada nombre, calculando una sola vez los nombres repetidos."""
+    modelos = {}
+    for nombre in nombres:
+        if nombre not in modelos:
+            modelos[nombre] = extraer_modelo_desde_nombre(nombre)
+    return [modelos[nombre] for nombre in nombres]
@@ -0,0 +1,118 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q, Sum
+
+
+def calcular_estadisticas_movimientos(queryset):
+    """
+    Calcula las estadísticas de un queryset de MovInventario en UNA sola consulta
+    (agregación condicional) en lugar de un COUNT/SUM por cada tipo de movimiento.
+    """
+    totales = queryset.order_by().aggregate(
+        total_movimientos=Count('id_mvin'),
+        entradas=Count('id_mvin', filter=Q(cantidad__gt=0)),
+        salidas=Count('id_mvin', filter=Q(cantidad__lt=0)),
+        ajustes=Count('id_mvin', filter=Q(cantidad=0)),
+        suma_entradas=Sum('cantidad', filter=Q(cantidad__gt=0)),
+        suma_salidas=Sum('cantidad', filter=Q(cantidad__lt=0)),
+    )
+    totales['suma_entradas'] = totales['suma_entradas'] or 0
+    totales['suma_salidas'] = abs(totales['suma_salidas'] or 0)
+    return totales
+
+
+def estadisticas_movimientos_cacheadas(queryset, filtros):
+    """
+    Igual que calcular_estadisticas_movimientos, pero reutiliza el resultado para la misma
+    combinación de filtros durante ESTADISTICAS_MOVIMIENTOS_CACHE_SEGUNDOS (0 desactiva el cache).
+    """
+    segundos = getattr(settings, 'ESTADISTICAS_MOVIMIENTOS_CACHE_SEGUNDOS', 0)
+    if not segundos:
+        return calcular_estadisticas_movimientos(queryset)
+
+    firma = hashlib.sha1(json.dumps(filtros, sort_keys=True, default=str).encode()).hexdigest()
+    clave = f'estadisticas_movimientos:{firma}'
+    estadisticas = cache.get(clave)
+    if estadisticas is None:
+        estadisticas = calcular_estadisticas_movimientos(queryset)
+        cache.set(clave, estadisticas, segundos)
+    return estadisticas
+
+
+def registrar_movimiento(clave_idempotencia=None, **campos):
+    """
+    Crea un MovInventario de forma idempotente.
+
+    Si ya existe un movimiento con la misma clave_idempotencia (reintento del cliente,
+    doble clic, petición repetida) se retorna ese registro en lugar de crear otro.
+    Retorna (movimiento, creado).
+    """
+    from api.models import MovInventario
+
+    if not clave_idempotencia:
+        return MovInventario.objects.create(**campos), True
+
+    existente = MovInventario.objects.filter(clave_idempotencia=clave_idempotencia).first()
+    if existente:
+        return existente, False
+    try:
+        # Savepoint: si otra petición concurrente ganó la carrera, la transacción externa sigue válida
+        with transaction.atomic():
+            return MovInventario.objects.create(clave_idempotencia=clave_idempotencia, **campos), True
+    except IntegrityError:
+        return MovInventario.objects.get(clave_idempotencia=clave_idempotencia), False
+
+
+class CursorInvalido(ValueError):
+    """El cursor recibido no se pudo decodificar."""
+
+
+def codificar_cursor(movimiento):
+    """
+    Genera el cursor opaco que apunta DESPUÉS del movimiento indicado, usando la
+    clave de orden (fecha, id_mvin).
+    """
+    datos = {'f': movimiento.fecha.isoformat(), 'id': movimiento.id_mvin}
+    crudo = json.dumps(datos, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """
+    Retorna la tupla (fecha, id_mvin) contenida en el cursor.
+    Lanza CursorInvalido si el valor fue alterado o no tiene el formato esperado.
+    """
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        return datetime.fromisoformat(datos['f']), int(datos['id'])
+    except (ValueError, TypeError, KeyError):
+        raise CursorInvalido('Cursor inválido')
+
+
+def paginar_movimientos_por_cursor(queryset, cursor, limit):
+    """
+    Paginación keyset sobre (fecha, id_mvin) descendente: en lugar de OFFSET filtra
+    los movimientos posteriores al cursor, por lo que el costo no crece con la
+    profundidad de la página y no se duplican/saltan filas al llegar movimientos nuevos.
+
+    Retorna (movimientos, siguiente_cursor); siguiente_cursor es None en la última página.
+    """
+    queryset = queryset.order_by('-fecha', '-id_mvin')
+    if cursor:
+        fecha, id_mvin = decodificar_cursor(cursor)
+        queryset = queryset.filter(Q(fecha__lt=fecha) | Q(fecha=fecha, id_mvin__lt=id_mvin))
+
+    # Se pide una fila extra solo para saber si hay otra página
+    movimientos = list(queryset[:limit + 1])
+    siguiente_cursor = None
+    if len(movimientos) > limit:
+        movimientos = movimientos[:limit]
+        siguiente_cursor = codificar_cursor(movimientos[-1])
+    return movimientos, siguiente_cursor
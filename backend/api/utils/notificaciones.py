@@ -22,4 +22,47 @@ def crear_notificacion(
         usuario=usuario,
         notificacion=noti
     )
-    return noti 
\ No newline at end of file
+    return noti
+
+def insertar_notificaciones(notificaciones):
+    """
+    Inserta una lista de Notificacion (sin guardar) junto con su fila de
+    UsuarioNotificacion usando bulk_create: dos sentencias sin importar la cantidad.
+    """
+    from api.models import Notificacion, UsuarioNotificacion
+    from django.db import transaction
+    if not notificaciones:
+        return []
+    with transaction.atomic():
+        notificaciones = Notificacion.objects.bulk_create(notificaciones)
+        UsuarioNotificacion.objects.bulk_create([
+            UsuarioNotificacion(usuario=noti.usuario_fk, notificacion=noti) for noti in notificaciones
+        ])
+    return notificaciones
+
+
+def crear_notificaciones(
+    usuarios,
+    nombre,
+    descripcion,
+    tipo="info",
+    pedido=None,
+    producto=None,
+    link=None
+):
+    """
+    Versión masiva de crear_notificacion: misma notificación para varios destinatarios.
+    """
+    from api.models import Notificacion
+    return insertar_notificaciones([
+        Notificacion(
+            usuario_fk=usuario,
+            nombre_ntf=nombre,
+            descripcion=descripcion,
+            tipo=tipo,
+            pedido_fk=pedido,
+            producto_fk=producto,
+            link=link
+        )
+        for usuario in usuarios
+    ])
@@ -0,0 +1,182 @@
+import io
+import re
+import signal
+
+import pdfplumber
+
+from api.utils.clasificador_productos import CLASIFICADOR
+
+# Aumentar cuando cambie el resultado de la extracción (invalida el cache de api/utils/cache_pdf.py)
+VERSION_EXTRACTOR = 1
+
+# Palabras clave de cada campo de la cabecera de la guía
+PALABRAS_CABECERA = {
+    'proveedor': ['proveedor:', 'empresa:', 'razón social:', 'nombre:'],
+    'rut': ['rut:', 'r.u.t:', 'identificación:', 'cédula:'],
+    'direccion': ['dirección:', 'direccion:', 'domicilio:', 'address:'],
+    'fecha': ['fecha:', 'fecha de emisión:', 'fecha emisión:', 'date:'],
+    'num_guia': ['guía:', 'guia:', 'número de guía:', 'numero de guia:', 'guía nº:', 'guia nº:'],
+    'num_rem': ['rem:', 'número rem:', 'numero rem:', 'rem nº:', 'rem n°:'],
+    'telefono': ['teléfono:', 'telefono:', 'fono:', 'phone:'],
+    'email': ['email:', 'correo:', 'e-mail:'],
+    'contacto': ['contacto:', 'representante:', 'atencion:'],
+    'observaciones': ['observaciones:', 'observación:', 'notas:', 'comentarios:'],
+}
+
+# Una sola expresión precompilada por campo (antes: un .lower() y un recorrido por palabra clave)
+PATRONES_CABECERA = {
+    campo: re.compile('|'.join(re.escape(palabra) for palabra in palabras), re.IGNORECASE)
+    for campo, palabras in PALABRAS_CABECERA.items()
+}
+
+# Limpieza de valores de algunos campos
+LIMPIEZA_CABECERA = {
+    'rut': re.compile(r'[^\d\-kK]'),
+    'fecha': re.compile(r'[^\d\/\-]'),
+}
+
+
+def datos_vacios():
+    return {campo: '' for campo in (
+        'proveedor', 'rut', 'direccion', 'fecha', 'num_guia', 'num_rem',
+        'observaciones', 'contacto', 'email', 'telefono'
+    )}
+
+
+def extraer_datos_cabecera(lineas, datos):
+    """
+    Completa en `datos` los campos de cabecera que aún estén vacíos a partir de las líneas
+    de texto. Solo se evalúan los patrones de los campos pendientes.
+    Retorna True cuando todos los campos quedaron completos.
+    """
+    pendientes = [campo for campo, valor in datos.items() if not valor and campo in PATRONES_CABECERA]
+    for linea in lineas:
+        if not pendientes:
+            break
+        if ':' not in linea:
+            continue
+        linea = linea.strip()
+        valor = linea.split(':', 1)[1].strip()
+        for campo in list(pendientes):
+            if PATRONES_CABECERA[campo].search(linea):
+                limpieza = LIMPIEZA_CABECERA.get(campo)
+                if limpieza:
+                    valor_campo = limpieza.sub('', valor)
+                else:
+                    valor_campo = valor
+                if valor_campo:
+                    datos[campo] = valor_campo
+                    pendientes.remove(campo)
+    return not pendientes
+
+
+def productos_desde_tabla(tabla, clasificador=None):
+    """Convierte las filas de una tabla (la primera es el encabezado) en productos."""
+    clasificador = clasificador or CLASIFICADOR
+    productos = []
+    for i, row in enumerate(tabla):
+        if i == 0:
+            continue  # Saltar encabezado
+        if not row or all(cell is None or cell.strip() == '' for cell in row):
+            continue
+
+        nombre = row[0] or ''
+        codigo = row[1] if len(row) > 1 and row[1] else ''
+        try:
+            cantidad = int(row[2]) if len(row) > 2 and row[2] and str(row[2]).replace('.', '').isdigit() else 1
+        except Exception:
+            cantidad = 1
+
+        if nombre and cantidad > 0:
+            marca, categoria = clasificador.clasificar(nombre)
+            productos.append({
+                'nombre': nombre,
+                'codigo': codigo,
+                'cantidad': cantidad,
+                'marca': marca,
+                'categoria': categoria
+            })
+    return productos
+
+
+def extraer_guia_pdf(archivo, clasificador=None):
+    """
+    Extrae productos y datos de cabecera de una guía en PDF procesando una página a la vez:
+    el texto de cada página solo se extrae mientras falten campos de cabecera y la caché de
+    la página se libera al terminar con ella, por lo que la memoria no crece con el número
+    de páginas. `archivo` puede ser una ruta o un objeto tipo archivo.
+    Retorna el mismo payload que entrega ExtraerProductosPDF: productos, datos y resumen.
+    """
+    productos = []
+    datos = datos_vacios()
+    cabecera_completa = False
+    with pdfplumber.open(archivo) as pdf:
+        for page in pdf.pages:
+            try:
+                if not cabecera_completa:
+                    texto = page.extract_text() or ''
+                    cabecera_completa = extraer_datos_cabecera(texto.split('\n'), datos)
+                for tabla in page.extract_tables():
+                    productos.extend(productos_desde_tabla(tabla, clasificador))
+            finally:
+                page.close()
+    return armar_respuesta(productos, datos)
+
+
+def armar_respuesta(productos, datos):
+    return {
+        'productos': productos,
+        'datos': datos,
+        'resumen': {
+            'total_productos': len(productos),
+            'campos_extraidos': {k: v for k, v in datos.items() if v},
+            'campos_vacios': {k: v for k, v in datos.items() if not v}
+        }
+    }
+
+
+class TiempoExtraccionAgotado(Exception):
+    """La extracción superó el tiempo máximo configurado."""
+
+
+def _tiempo_agotado(signum, frame):
+    raise TiempoExtraccionAgotado('La extracción del PDF superó el tiempo máximo permitido')
+
+
+def extraer_guia_pdf_bytes(contenido, timeout=None, clasificador=None):
+    """
+    Punto de entrada para los procesos del pool (api/utils/trabajos_pdf.py): recibe el
+    contenido del archivo y corta la extracción si supera `timeout` segundos.
+    Este módulo no depende de Django, por lo que el proceso hijo no necesita configurarlo
+    (el clasificador, si viene desde la BD, se construye en el proceso padre).
+    """
+    usar_alarma = bool(timeout) and hasattr(signal, 'SIGALRM')
+    if usar_alarma:
+        anterior = signal.signal(signal.SIGALRM, _tiempo_agotado)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return extraer_guia_pdf(io.BytesIO(contenido), clasificador)
+    finally:
+        if usar_alarma:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, anterior)
+
+
+# Cola para avisar al proceso padre qué trabajo empieza cada proceso del pool (ver trabajos_pdf.py)
+_avisos_inicio = None
+
+
+def iniciar_proceso_extraccion(avisos_inicio):
+    """Inicializador de los procesos del pool: guarda la cola de avisos de inicio."""
+    global _avisos_inicio
+    _avisos_inicio = avisos_inicio
+
+
+def extraer_guia_pdf_trabajo(trabajo_id, contenido, timeout=None, clasificador=None):
+    """
+    Igual que extraer_guia_pdf_bytes, avisando antes al proceso padre que el trabajo `trabajo_id`
+    salió de la cola: el tiempo máximo se mide desde ese momento y no desde que se encoló.
+    """
+    if _avisos_inicio is not None:
+        _avisos_inicio.put(trabajo_id)
+    return extraer_guia_pdf_bytes(contenido, timeout, clasificador)
@@ -0,0 +1,127 @@
+import hashlib
+import logging
+import os
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+import qrcode
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Aumentar cuando cambie la forma de dibujar el QR (invalida las imágenes guardadas y los ETag)
+VERSION_QR = 1
+
+
+def contenido_qr(codigo_interno):
+    """Texto codificado en el QR: solo el código interno, para no depender de IDs automáticos."""
+    return f"PROD:{codigo_interno}"
+
+
+def etag_qr(codigo_interno, formato='png'):
+    """ETag de la imagen: depende solo del código, el formato y la versión, no de leer el archivo."""
+    return hashlib.sha1(f'{VERSION_QR}:{formato}:{contenido_qr(codigo_interno)}'.encode('utf-8')).hexdigest()
+
+
+def _crear_qr(codigo_interno):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(contenido_qr(codigo_interno))
+    qr.make(fit=True)
+    return qr
+
+
+def renderizar_qr_png(codigo_interno):
+    """Genera la imagen PNG del QR (sin cache)."""
+    img = _crear_qr(codigo_interno).make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def renderizar_qr_svg(codigo_interno):
+    """
+    Genera el QR como SVG (sin cache). Cada tramo horizontal de módulos oscuros es un solo
+    rectángulo del path, con un módulo por unidad del viewBox: la impresora escala sin pérdida.
+    """
+    matriz = _crear_qr(codigo_interno).get_matrix()
+    tramos = []
+    for y, fila in enumerate(matriz):
+        x = 0
+        while x < len(fila):
+            if not fila[x]:
+                x += 1
+                continue
+            inicio = x
+            while x < len(fila) and fila[x]:
+                x += 1
+            tramos.append(f'M{inicio} {y}h{x - inicio}v1h-{x - inicio}z')
+    lado = len(matriz)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" version="1.1" viewBox="0 0 {lado} {lado}" '
+        f'width="{lado * 10}" height="{lado * 10}" shape-rendering="crispEdges">'
+        f'<rect width="{lado}" height="{lado}" fill="#fff"/>'
+        f'<path fill="#000" d="{"".join(tramos)}"/></svg>'
+    ).encode('utf-8')
+
+
+# formato -> (content type, función que genera la imagen)
+FORMATOS_QR = {
+    'png': ('image/png', renderizar_qr_png),
+    'svg': ('image/svg+xml', renderizar_qr_svg),
+}
+
+
+def _directorio():
+    return Path(getattr(settings, 'QR_CACHE_DIR', Path(settings.BASE_DIR) / 'cache' / 'qr'))
+
+
+def _ruta(codigo_interno, formato):
+    # El nombre sale del hash del contenido: un código nuevo nunca reutiliza la imagen del anterior
+    return _directorio() / f'{etag_qr(codigo_interno, formato)}.{formato}'
+
+
+def obtener_qr(codigo_interno, formato='png'):
+    """
+    Retorna la imagen del QR en `formato` ('png' o 'svg') desde el cache en disco; si no
+    existe la genera y la guarda. Con QR_CACHE_DIR = None se genera siempre.
+    """
+    renderizar = FORMATOS_QR[formato][1]
+    if getattr(settings, 'QR_CACHE_DIR', '') is None:
+        return renderizar(codigo_interno)
+    ruta = _ruta(codigo_interno, formato)
+    try:
+        return ruta.read_bytes()
+    except OSError:
+        pass
+    imagen = renderizar(codigo_interno)
+    try:
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        # Escritura atómica: otro worker nunca lee una imagen a medio escribir
+        descriptor, temporal = tempfile.mkstemp(dir=ruta.parent, suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(imagen)
+        os.replace(temporal, ruta)
+    except OSError as e:
+        logger.warning(f"[QR] No se pudo guardar el QR de {codigo_interno} en cache: {str(e)}")
+    return imagen
+
+
+def obtener_qr_png(codigo_interno):
+    return obtener_qr(codigo_interno, 'png')
+
+
+def eliminar_qr(codigo_interno):
+    """Elimina las imágenes guardadas de un código (se llama cuando el producto cambia de código)."""
+    if not codigo_interno or getattr(settings, 'QR_CACHE_DIR', '') is None:
+        return
+    for formato in FORMATOS_QR:
+        try:
+            _ruta(codigo_interno, formato).unlink()
+        except OSError:
+            pass
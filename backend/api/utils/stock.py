@@ -0,0 +1,176 @@
+def obtener_stocks_por_producto(productos, bodega_id=None, sucursal_id=None):
+    """
+    Resuelve en UNA sola consulta el registro de Stock de cada producto.
+
+    Si se indica bodega_id o sucursal_id se usa esa ubicación para todos los
+    productos; si no, cada producto usa su propia bodega/sucursal.
+    Retorna un diccionario {id_prodc: Stock}.
+    """
+    from api.models import Stock
+
+    productos = list(productos)
+    if not productos:
+        return {}
+
+    ids = [p.id_prodc for p in productos]
+    queryset = Stock.objects.filter(productos_fk__in=ids)
+    if sucursal_id:
+        queryset = queryset.filter(sucursal_fk=sucursal_id)
+    elif bodega_id:
+        queryset = queryset.filter(bodega_fk=bodega_id)
+
+    # Ubicación propia de cada producto (solo se usa cuando no viene una en la petición)
+    ubicacion_producto = {
+        p.id_prodc: (p.bodega_fk_id, p.sucursal_fk_id) for p in productos
+    }
+
+    stocks = {}
+    # Ordenar por id_stock para respetar el mismo registro que retornaba .first()
+    for stock_obj in queryset.order_by('id_stock'):
+        producto_id = stock_obj.productos_fk_id
+        if producto_id in stocks:
+            continue
+        if not sucursal_id and not bodega_id:
+            bodega_propia, sucursal_propia = ubicacion_producto[producto_id]
+            if bodega_propia:
+                if stock_obj.bodega_fk != bodega_propia:
+                    continue
+            elif sucursal_propia:
+                if stock_obj.sucursal_fk != sucursal_propia:
+                    continue
+            else:
+                continue
+        stocks[producto_id] = stock_obj
+    return stocks
+
+
+def aplicar_ingresos_stock(lineas, usuario, motivo, bodega_id=None, sucursal_id=None, pedido=None, defaults_stock=None):
+    """
+    Aplica en bloque los ingresos de varias líneas sobre el stock de UNA ubicación.
+
+    Cada línea es un dict con 'producto', 'cantidad', 'clave' (clave de idempotencia del
+    movimiento) y opcionalmente 'motivo' (si no, se usa el motivo general). En lugar de 'cantidad'
+    una línea puede traer 'conteo' (stock contado): la cantidad es la diferencia con el saldo
+    bloqueado y, si no hay diferencia, no se registra movimiento. Dentro de una transacción:
+      - bloquea una sola vez los registros de Stock afectados (SELECT ... FOR UPDATE),
+      - crea con bulk_create los registros de Stock que falten,
+      - suma todas las cantidades con un único UPDATE,
+      - crea con bulk_create los MovInventario (y los Historial si se indica pedido).
+    Las líneas cuya clave ya fue registrada se omiten (reintentos).
+    Retorna una lista con el resultado de cada línea aplicada.
+    """
+    from decimal import Decimal
+    from django.db import transaction
+    from django.db.models import Case, DecimalField, F, Value, When
+    from django.utils import timezone
+    from api.models import Stock, MovInventario, Historial
+    from api.utils.alertas_stock import detectar_alertas_stock, encolar_alertas_stock
+    from api.utils.cache_escaneo import cache_escaneo
+
+    if not lineas:
+        return []
+
+    with transaction.atomic():
+        claves = [linea['clave'] for linea in lineas if linea.get('clave')]
+        registradas = set(
+            MovInventario.objects.filter(clave_idempotencia__in=claves).values_list('clave_idempotencia', flat=True)
+        ) if claves else set()
+        lineas = [linea for linea in lineas if linea.get('clave') not in registradas]
+        if not lineas:
+            return []
+
+        productos_ids = {linea['producto'].id_prodc for linea in lineas}
+        filtro_ubicacion = {'sucursal_fk': sucursal_id} if sucursal_id else {'bodega_fk': bodega_id}
+        bloqueados = Stock.objects.select_for_update().filter(
+            productos_fk__in=productos_ids, **filtro_ubicacion
+        ).order_by('id_stock')
+        stocks = {}
+        for stock_obj in bloqueados:
+            stocks.setdefault(stock_obj.productos_fk_id, stock_obj)
+
+        faltantes = [
+            Stock(
+                productos_fk_id=producto_id,
+                stock=0,
+                bodega_fk=bodega_id if not sucursal_id else None,
+                sucursal_fk=sucursal_id,
+                proveedor_fk=None,
+                **(defaults_stock or {'stock_minimo': 0})
+            )
+            for producto_id in productos_ids if producto_id not in stocks
+        ]
+        for stock_obj in Stock.objects.bulk_create(faltantes):
+            stocks[stock_obj.productos_fk_id] = stock_obj
+
+        # Saldos en memoria: permiten calcular antes/después de cada movimiento sin releer
+        saldos = {producto_id: Decimal(str(stocks[producto_id].stock)) for producto_id in productos_ids}
+        anteriores = dict(saldos)
+        ahora = timezone.now()
+        movimientos, historiales, resultados = [], [], []
+        for linea in lineas:
+            producto = linea['producto']
+            stock_obj = stocks[producto.id_prodc]
+            antes = saldos[producto.id_prodc]
+            if 'conteo' in linea:
+                cantidad = Decimal(str(linea['conteo'])) - antes
+                if not cantidad:
+                    resultados.append({
+                        'producto': producto,
+                        'cantidad': cantidad,
+                        'stock': stock_obj,
+                        'stock_antes': antes,
+                        'stock_despues': antes,
+                        'movimiento_creado': False,
+                        'linea': linea,
+                    })
+                    continue
+            else:
+                cantidad = Decimal(str(linea['cantidad']))
+            saldos[producto.id_prodc] = antes + cantidad
+            movimientos.append(MovInventario(
+                cantidad=cantidad,
+                fecha=ahora,
+                productos_fk=producto,
+                usuario_fk=usuario,
+                stock_fk=stock_obj,
+                motivo=linea.get('motivo', motivo),
+                stock_antes=antes,
+                stock_despues=saldos[producto.id_prodc],
+                clave_idempotencia=linea.get('clave'),
+            ))
+            if pedido is not None:
+                historiales.append(Historial(usuario_fk=usuario, pedidos_fk=pedido, producto_fk=producto))
+            resultados.append({
+                'producto': producto,
+                'cantidad': cantidad,
+                'stock': stock_obj,
+                'stock_antes': antes,
+                'stock_despues': saldos[producto.id_prodc],
+                'movimiento_creado': True,
+                'linea': linea,
+            })
+
+        incrementos = {
+            stocks[producto_id].id_stock: saldos[producto_id] - anteriores[producto_id]
+            for producto_id in productos_ids if saldos[producto_id] != anteriores[producto_id]
+        }
+        if incrementos:
+            Stock.objects.filter(id_stock__in=incrementos.keys()).update(stock=Case(
+                *[When(id_stock=id_stock, then=F('stock') + Value(incremento)) for id_stock, incremento in incrementos.items()],
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            ))
+        MovInventario.objects.bulk_create(movimientos)
+        if historiales:
+            Historial.objects.bulk_create(historiales)
+
+        # update() no pasa por Stock.save(): las alertas de umbral se detectan con los saldos en memoria
+        alertas = []
+        for producto_id in productos_ids:
+            stock_obj = stocks[producto_id]
+            stock_obj.stock = saldos[producto_id]
+            stock_obj._stock_original = float(stock_obj.stock)
+            alertas.extend(detectar_alertas_stock(stock_obj, float(anteriores[producto_id])))
+        encolar_alertas_stock(alertas)
+        cache_escaneo.invalidar(productos_ids=productos_ids)
+
+    return resultados
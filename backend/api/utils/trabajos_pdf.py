@@ -0,0 +1,130 @@
+import logging
+import multiprocessing
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from api.models import TrabajoExtraccionPDF
+from api.utils.cache_pdf import guardar_resultado
+from api.utils.pdf_guias import extraer_guia_pdf_trabajo, iniciar_proceso_extraccion
+
+logger = logging.getLogger(__name__)
+
+# Los estados se guardan en la BD (tabla trabajo_extraccion_pdf) para que cualquier worker pueda
+# consultarlos; los trabajos más antiguos que esto se eliminan al crear uno nuevo
+DURACION_ESTADO_SEGUNDOS = 60 * 60
+
+_pool = None
+_pool_lock = threading.Lock()
+# Los procesos del pool no usan Django: avisan por esta cola cuándo empiezan cada trabajo y un hilo
+# de este proceso lo registra en la BD (en_proceso_desde)
+_avisos_inicio = None
+
+
+def _registrar_inicios(avisos):
+    while True:
+        trabajo_id = avisos.get()
+        try:
+            TrabajoExtraccionPDF.objects.filter(id_trabajo=trabajo_id).update(en_proceso_desde=timezone.now())
+        except Exception as e:
+            logger.error(f"[PDF] No se pudo registrar el inicio del trabajo de extracción {trabajo_id}: {str(e)}")
+        finally:
+            connection.close()
+
+
+def _obtener_pool():
+    global _pool, _avisos_inicio
+    with _pool_lock:
+        if _pool is None:
+            procesos = getattr(settings, 'PDF_EXTRACCION_PROCESOS', 2)
+            # 'spawn': el proceso hijo no hereda hilos ni conexiones del servidor
+            contexto = multiprocessing.get_context('spawn')
+            if _avisos_inicio is None:
+                _avisos_inicio = contexto.SimpleQueue()
+                threading.Thread(target=_registrar_inicios, args=(_avisos_inicio,), daemon=True).start()
+            _pool = ProcessPoolExecutor(
+                max_workers=procesos, mp_context=contexto,
+                initializer=iniciar_proceso_extraccion, initargs=(_avisos_inicio,)
+            )
+        return _pool
+
+
+def _timeout():
+    return getattr(settings, 'PDF_EXTRACCION_TIMEOUT_SEGUNDOS', 60)
+
+
+def _nuevo_trabajo(**campos):
+    ahora = timezone.now()
+    TrabajoExtraccionPDF.objects.filter(inicio__lt=ahora - timedelta(seconds=DURACION_ESTADO_SEGUNDOS)).delete()
+    trabajo = TrabajoExtraccionPDF.objects.create(id_trabajo=uuid.uuid4().hex, inicio=ahora, **campos)
+    return trabajo.id_trabajo
+
+
+def crear_trabajo_completado(resultado, nombre_archivo=''):
+    """Registra como completado un trabajo cuyo resultado ya se conoce (ej. desde el cache)."""
+    return _nuevo_trabajo(estado='completado', archivo=nombre_archivo[:255], fin=timezone.now(), resultado=resultado)
+
+
+def crear_trabajo_extraccion(contenido, nombre_archivo='', hash_contenido=None, clasificador=None):
+    """
+    Encola la extracción de una guía en el pool de procesos y retorna el id del trabajo.
+    Si se indica hash_contenido el resultado se guarda en el cache de PDFs.
+    """
+    global _pool
+    trabajo_id = _nuevo_trabajo(estado='pendiente', archivo=nombre_archivo[:255])
+    try:
+        futuro = _obtener_pool().submit(extraer_guia_pdf_trabajo, trabajo_id, contenido, _timeout(), clasificador)
+    except Exception:
+        # Pool roto (ej. un proceso hijo murió): se descarta para recrearlo en el próximo trabajo
+        with _pool_lock:
+            _pool = None
+        raise
+    futuro.add_done_callback(lambda f: _registrar_resultado(trabajo_id, f, hash_contenido, clasificador))
+    return trabajo_id
+
+
+def _registrar_resultado(trabajo_id, futuro, hash_contenido=None, clasificador=None):
+    # Se ejecuta en un hilo del pool, con su propia conexión a la BD
+    try:
+        try:
+            resultado = futuro.result()
+            campos = {'estado': 'completado', 'resultado': resultado}
+            if hash_contenido:
+                guardar_resultado(hash_contenido, resultado, clasificador)
+        except Exception as e:
+            logger.error(f"[PDF] Error en trabajo de extracción {trabajo_id}: {str(e)}")
+            campos = {'estado': 'error', 'error': f'Error al procesar el PDF: {str(e)}'}
+        TrabajoExtraccionPDF.objects.filter(id_trabajo=trabajo_id).update(fin=timezone.now(), **campos)
+    except Exception as e:
+        logger.error(f"[PDF] No se pudo registrar el trabajo de extracción {trabajo_id}: {str(e)}")
+    finally:
+        connection.close()
+
+
+def obtener_trabajo(trabajo_id):
+    """
+    Retorna el estado del trabajo (dict) o None si no existe. Si un trabajo lleva en proceso más
+    del doble del timeout (ej. el proceso hijo quedó colgado) se informa como error; mientras espera
+    en la cola del pool no se le aplica el timeout.
+    """
+    trabajo = TrabajoExtraccionPDF.objects.filter(id_trabajo=trabajo_id).first()
+    if trabajo is None:
+        return None
+    estado = {
+        'estado': trabajo.estado,
+        'archivo': trabajo.archivo,
+        'inicio': trabajo.inicio.timestamp(),
+        'fin': trabajo.fin.timestamp() if trabajo.fin else None,
+        'resultado': trabajo.resultado,
+        'error': trabajo.error,
+    }
+    en_proceso = trabajo.en_proceso_desde
+    if trabajo.estado == 'pendiente' and en_proceso and timezone.now() - en_proceso > timedelta(seconds=_timeout() * 2):
+        estado['estado'] = 'error'
+        estado['error'] = 'La extracción del PDF superó el tiempo máximo permitido'
+    return estado
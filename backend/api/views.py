@@ -17,17 +17,34 @@ from rest_framework import serializers
 from rest_framework_simplejwt.authentication import JWTAuthentication
 import logging
 import json
-import pdfplumber
+import time
 import re
-import qrcode
 import base64
-from io import BytesIO
-from django.http import HttpResponse
+from decimal import Decimal, InvalidOperation
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.conf import settings
 from django.db import models
-from api.utils.notificaciones import crear_notificacion
-from django.db.models import Min
+from api.utils.notificaciones import crear_notificacion, crear_notificaciones
+from api.utils.stock import aplicar_ingresos_stock
+from api.utils.pdf_guias import extraer_guia_pdf, datos_vacios
+from api.utils.clasificador_productos import obtener_clasificador
+from api.utils.trabajos_pdf import crear_trabajo_extraccion, crear_trabajo_completado, obtener_trabajo
+from api.utils.cache_pdf import hash_archivo, obtener_resultado_cacheado, guardar_resultado
+from api.utils.qr import obtener_qr, etag_qr, FORMATOS_QR
+from api.utils.etiquetas_qr import generar_pdf_etiquetas, generar_zip_etiquetas
+from api.utils.escaneo import consultar_producto_escaneo, armar_payload_escaneo
+from api.utils.cache_escaneo import cache_escaneo
+from api.utils.busqueda_productos import buscar_productos_rankeados, anotar_stock, COLUMNAS as COLUMNAS_BUSQUEDA
+from api.utils.indice_catalogo import indice_catalogo, clave_catalogo, clave_producto
+from api.utils.codigos import reservar_codigos
+from api.utils.modelo_producto import extraer_modelo_desde_nombre
+from api.utils.movimientos import (
+    calcular_estadisticas_movimientos, estadisticas_movimientos_cacheadas,
+    paginar_movimientos_por_cursor, CursorInvalido, registrar_movimiento,
+)
 from django.db import IntegrityError
+from django.db.models.functions import NullIf, Trim, Upper
 
 logger = logging.getLogger(__name__)
 
@@ -126,7 +143,9 @@ class ProductoViewSet(viewsets.ModelViewSet):
         return [IsAuthenticated()]
 
     def get_queryset(self):
-        queryset = Productos.objects.filter(activo=True)
+        queryset = Productos.objects.filter(activo=True).select_related(
+            'marca_fk', 'categoria_fk', 'bodega_fk', 'sucursal_fk'
+        )
         bodega_id = self.request.query_params.get('bodega_id')
         sucursal_id = self.request.query_params.get('sucursal_id')
         
@@ -939,20 +958,20 @@ class PedidosViewSet(viewsets.ModelViewSet):
                     )
                 # --- FIN REGISTRO HISTORIAL ---
                 if estado_nuevo.nombre == 'En camino' and estado_anterior != 'En camino':
-                    # Notificar a la sucursal que el pedido fue despachado
-                    if instance.sucursal_fk and hasattr(instance.sucursal_fk, 'usuarios_fk'):
-                        crear_notificacion(
-                            usuario=instance.sucursal_fk.usuarios_fk,
+                    # Notificar a los usuarios de la sucursal que el pedido fue despachado
+                    if instance.sucursal_fk:
+                        crear_notificaciones(
+                            usuarios=Usuario.objects.filter(sucursal_fk=instance.sucursal_fk),
                             nombre=f"Pedido #{instance.id_p} despachado",
                             descripcion=f"Tu pedido #{instance.id_p} ha sido despachado y está en camino.",
                             tipo="success",
                             pedido=instance
                         )
                 if estado_nuevo.nombre == 'Completado' and estado_anterior != 'Completado':
-                    # Notificar a la sucursal que el pedido fue recibido
-                    if instance.sucursal_fk and hasattr(instance.sucursal_fk, 'usuarios_fk'):
-                        crear_notificacion(
-                            usuario=instance.sucursal_fk.usuarios_fk,
+                    # Notificar a los usuarios de la sucursal que el pedido fue recibido
+                    if instance.sucursal_fk:
+                        crear_notificaciones(
+                            usuarios=Usuario.objects.filter(sucursal_fk=instance.sucursal_fk),
                             nombre=f"Pedido #{instance.id_p} recibido",
                             descripcion=f"Tu pedido #{instance.id_p} ha sido recibido y completado.",
                             tipo="success",
@@ -961,8 +980,8 @@ class PedidosViewSet(viewsets.ModelViewSet):
                 if estado_nuevo.nombre == 'Rechazado' and estado_anterior != 'Rechazado':
                     # Notificar al usuario solicitante que el pedido fue rechazado
                     if instance.usuario_fk:
-                        crear_notificacion(
-                            usuario=instance.usuario_fk,
+                        crear_notificaciones(
+                            usuarios=[instance.usuario_fk],
                             nombre=f"Pedido #{instance.id_p} rechazado",
                             descripcion=f"Tu pedido #{instance.id_p} ha sido rechazado.",
                             tipo="error",
@@ -1042,7 +1061,8 @@ class PedidosViewSet(viewsets.ModelViewSet):
                         bodega_fk=solicitud.fk_bodega.id_bdg,
                         defaults={'stock': 0, 'stock_minimo': 0, 'stock_maximo': 0, 'sucursal_fk': None, 'proveedor_fk': None}
                     )
-                    MovInventario.objects.create(
+                    registrar_movimiento(
+                        clave_idempotencia=f'solicitud:{solicitud.id_solc}:salida:{sp.id_solc_prod}',
                         cantidad=-abs(sp.cantidad),
                         fecha=timezone.now(),
                         productos_fk=sp.producto_fk,
@@ -1100,6 +1120,7 @@ class PedidosViewSet(viewsets.ModelViewSet):
                     'error': 'Solo se puede confirmar la recepción de pedidos en estado "En camino"'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
+            inicio = time.perf_counter()
             # Obtener el estado "Completado"
             try:
                 estado_completado = EstadoPedido.objects.get(nombre='Completado')
@@ -1110,63 +1131,52 @@ class PedidosViewSet(viewsets.ModelViewSet):
                     descripcion='Pedido recibido y completado'
                 )
             
-            # Actualizar el estado del pedido a "Completado"
-            pedido.estado_pedido_fk = estado_completado
-            pedido.save()
-            
-            # --- REGISTRO DE HISTORIAL DE ESTADO ---
-            from .models import HistorialEstadoPedido
-            estado_anterior = pedido.estado_pedido_fk
-            HistorialEstadoPedido.objects.create(
-                pedido_fk=pedido,
-                estado_anterior=estado_anterior,
-                estado_nuevo=estado_completado,
-                usuario_fk=request.user,
-                comentario="Recepción confirmada"
-            )
-            # --- FIN REGISTRO HISTORIAL ---
-            
             # Obtener los detalles del pedido
-            detalles_pedido = DetallePedido.objects.filter(pedidos_fk=pedido)
-            
-            # Agregar productos al inventario de la sucursal
-            productos_agregados = []
-            for detalle in detalles_pedido:
-                # Buscar o crear el stock para este producto en la sucursal
-                stock_obj, created = Stock.objects.get_or_create(
-                    productos_fk=detalle.productos_pedido_fk,
-                    sucursal_fk=pedido.sucursal_fk.id,
-                    defaults={
-                        'stock': 0,
-                        'stock_minimo': 0,
-                        'bodega_fk': None,
-                        'proveedor_fk': None
-                    }
-                )
-                # Agregar la cantidad del pedido al stock existente
-                stock_obj.stock += detalle.cantidad
-                stock_obj.save()
-
-                # Registrar movimiento de inventario
-                MovInventario.objects.create(
-                    cantidad=detalle.cantidad,
-                    fecha=timezone.now(),
-                    productos_fk=detalle.productos_pedido_fk,
+            detalles_pedido = DetallePedido.objects.filter(pedidos_fk=pedido).select_related('productos_pedido_fk')
+
+            with transaction.atomic():
+                # Actualizar el estado del pedido a "Completado"
+                estado_anterior = pedido.estado_pedido_fk
+                pedido.estado_pedido_fk = estado_completado
+                pedido.save()
+
+                # --- REGISTRO DE HISTORIAL DE ESTADO ---
+                from .models import HistorialEstadoPedido
+                HistorialEstadoPedido.objects.create(
+                    pedido_fk=pedido,
+                    estado_anterior=estado_anterior,
+                    estado_nuevo=estado_completado,
                     usuario_fk=request.user,
-                    stock_fk=stock_obj,
-                    motivo='Ingreso por pedido desde bodega central'
+                    comentario="Recepción confirmada"
                 )
-                Historial.objects.create(
-                    fecha=timezone.now(),
-                    usuario_fk=request.user,
-                    pedidos_fk=pedido,
-                    producto_fk=detalle.productos_pedido_fk
+                # --- FIN REGISTRO HISTORIAL ---
+
+                # Agregar productos al inventario de la sucursal en bloque
+                # (un bloqueo, un UPDATE y bulk_create de movimientos e historial)
+                resultados = aplicar_ingresos_stock(
+                    [
+                        {
+                            'producto': detalle.productos_pedido_fk,
+                            'cantidad': detalle.cantidad,
+                            'clave': f'recepcion:{pedido.id_p}:{detalle.id}',
+                        }
+                        for detalle in detalles_pedido
+                    ],
+                    usuario=request.user,
+                    motivo='Ingreso por pedido desde bodega central',
+                    sucursal_id=pedido.sucursal_fk.id,
+                    pedido=pedido,
+                    defaults_stock={'stock_minimo': 0}
                 )
-                productos_agregados.append({
-                    'producto': detalle.productos_pedido_fk.nombre_prodc,
-                    'cantidad': float(detalle.cantidad),
-                    'stock_actual': float(stock_obj.stock)
-                })
+            productos_agregados = [
+                {
+                    'producto': resultado['producto'].nombre_prodc,
+                    'cantidad': float(resultado['cantidad']),
+                    'stock_actual': float(resultado['stock_despues'])
+                }
+                for resultado in resultados
+            ]
+            tiempo_ms = round((time.perf_counter() - inicio) * 1000, 2)
             
             logger.info(f"Recepción confirmada para pedido {pedido.id_p}. Productos agregados al inventario: {productos_agregados}")
             
@@ -1175,7 +1185,8 @@ class PedidosViewSet(viewsets.ModelViewSet):
                 'pedido_id': pedido.id_p,
                 'estado_nuevo': 'Completado',
                 'productos_agregados': productos_agregados,
-                'sucursal': pedido.sucursal_fk.nombre_sucursal if pedido.sucursal_fk else 'N/A'
+                'sucursal': pedido.sucursal_fk.nombre_sucursal if pedido.sucursal_fk else 'N/A',
+                'tiempo_procesamiento_ms': tiempo_ms
             }, status=status.HTTP_200_OK)
             
         except Pedidos.DoesNotExist:
@@ -1211,16 +1222,15 @@ class PedidosViewSet(viewsets.ModelViewSet):
             if not bodega_id:
                 return Response({'error': 'ID de bodega es requerido'}, status=status.HTTP_400_BAD_REQUEST)
             # --- VALIDACIÓN DE DUPLICADOS POR GUÍA DE DESPACHO Y BODEGA ---
-            # Log de todas las guías existentes para esa bodega
-            guias_existentes = list(Pedidos.objects.filter(bodega_fk=bodega_id).values_list('num_guia_despacho', flat=True))
-            logger.info(f"[crear_ingreso_bodega] Guías existentes en bodega {bodega_id}: {guias_existentes}")
-            logger.info(f"[crear_ingreso_bodega] Guía recibida: '{num_guia_despacho}'")
-            if num_guia_despacho and bodega_id:
-                guia_normalizada = num_guia_despacho.strip().upper()
-                guias_existentes_normalizadas = [ (g.strip().upper() if g else '') for g in guias_existentes ]
-                logger.info(f"[crear_ingreso_bodega] Guías normalizadas en bodega {bodega_id}: {guias_existentes_normalizadas}")
-                logger.info(f"[crear_ingreso_bodega] Guía recibida normalizada: '{guia_normalizada}'")
-                if guia_normalizada in guias_existentes_normalizadas:
+            # Una sola consulta sobre NULLIF(UPPER(TRIM(num_guia_despacho)), ''), la misma expresión
+            # del índice único idx_pedidos_guia_bodega_norm (migración 0009). TRIM de SQL solo quita
+            # espacios, por eso aquí se usa strip(' ') y no strip()
+            if num_guia_despacho and num_guia_despacho.strip(' '):
+                guia_normalizada = num_guia_despacho.strip(' ').upper()
+                guia_duplicada = Pedidos.objects.annotate(
+                    guia_normalizada=NullIf(Upper(Trim('num_guia_despacho')), models.Value(''))
+                ).filter(bodega_fk=bodega_id, guia_normalizada=guia_normalizada).exists()
+                if guia_duplicada:
                     return Response({'error': 'Ya existe un ingreso con la misma guía de despacho en esta bodega.'}, status=status.HTTP_400_BAD_REQUEST)
             # ... existing code ...
             
@@ -1281,115 +1291,50 @@ class PedidosViewSet(viewsets.ModelViewSet):
                 'num_guia_despacho': num_guia_despacho
             }
             
-            serializer = PedidosCreateSerializer(data=pedido_data)
-            serializer.is_valid(raise_exception=True)
-            try:
-                pedido = serializer.save()
-            except IntegrityError as e:
-                if 'idx_pedidos_guia_bodega' in str(e) or 'unique constraint' in str(e).lower():
-                    return Response({'error': 'Ya existe un ingreso con este número de guía de despacho en esta bodega.'}, status=status.HTTP_400_BAD_REQUEST)
-                raise
-            
-            try:
-                historial = HistorialEstadoPedido.objects.create(
-                    pedido_fk=pedido,
-                    estado_anterior=None,
-                    estado_nuevo=estado_completado,
-                    usuario_fk=request.user,
-                    fecha=timezone.now(),  # Usar fecha actual para evitar problemas
-                    comentario="Ingreso proveedor"
-                )
-                logger.info(f"[crear_ingreso_bodega] Historial de estado 'Completado' creado para pedido {pedido.id_p} (historial id: {historial.id_hist_ped})")
-            except Exception as e:
-                logger.error(f"[crear_ingreso_bodega] ERROR al crear historial de estado 'Completado' para pedido {pedido.id_p}: {str(e)}")
-            
-            # Procesar productos y agregarlos al inventario
-            productos_agregados = []
-            for producto_info in productos_data:
+            # Pedido, productos, códigos, stock y detalles en una sola transacción: si algo falla no queda
+            # un pedido 'Completado' a medias ni correlativos consumidos (el except de abajo responde
+            # sin propagar la excepción, por lo que el atomic del método no alcanzaría a revertir)
+            with transaction.atomic():
+                serializer = PedidosCreateSerializer(data=pedido_data)
+                serializer.is_valid(raise_exception=True)
                 try:
-                    resultado = procesar_producto_ingreso(producto_info, bodega, proveedor_obj, request)
-                    productos_agregados.append(resultado)
-
-                    # Obtener el producto real usado (por ID/codigo_interno)
-                    producto_real = None
-                    if resultado.get('codigo_interno'):
-                        try:
-                            producto_real = Productos.objects.get(codigo_interno=resultado['codigo_interno'], activo=True)
-                        except Productos.DoesNotExist:
-                            producto_real = None
-                    # Crear detalle del pedido SOLO si se encontró el producto
-                    if producto_real:
-                        DetallePedido.objects.create(
-                            cantidad=producto_info.get('cantidad', 0),
-                            descripcion=f"Producto de ingreso: {producto_info.get('nombre', '')}",
-                            productos_pedido_fk=producto_real,
-                            pedidos_fk=pedido
+                    with transaction.atomic():
+                        pedido = serializer.save()
+                except IntegrityError as e:
+                    if 'idx_pedidos_guia_bodega' in str(e) or 'unique constraint' in str(e).lower():
+                        return Response({'error': 'Ya existe un ingreso con este número de guía de despacho en esta bodega.'}, status=status.HTTP_400_BAD_REQUEST)
+                    raise
+
+                try:
+                    with transaction.atomic():
+                        historial = HistorialEstadoPedido.objects.create(
+                            pedido_fk=pedido,
+                            estado_anterior=None,
+                            estado_nuevo=estado_completado,
+                            usuario_fk=request.user,
+                            fecha=timezone.now(),  # Usar fecha actual para evitar problemas
+                            comentario="Ingreso proveedor"
                         )
-                    else:
-                        logger.warning(f"No se pudo encontrar producto para detalle con código interno {resultado.get('codigo_interno')}")
+                    logger.info(f"[crear_ingreso_bodega] Historial de estado 'Completado' creado para pedido {pedido.id_p} (historial id: {historial.id_hist_ped})")
                 except Exception as e:
-                    logger.error(f"Error procesando producto {producto_info.get('nombre', '')}: {str(e)}")
-                    continue
-            
-            logger.info(f"Ingreso creado para bodega {bodega.nombre_bdg}. Productos agregados: {productos_agregados}")
-            
-            # Guardar historial de ingreso del proveedor si existe
-            if proveedor_obj:
-                try:
-                    # Crear un registro de historial por cada producto del ingreso
-                    for producto_info in productos_data:
-                        nombre = producto_info.get('nombre', '')
-                        cantidad = producto_info.get('cantidad', 0)
-                        
-                        # Buscar el producto en la base de datos
-                        try:
-                            # Buscar el producto más específicamente usando marca y categoría también
-                            producto_obj = Productos.objects.get(
-                                nombre_prodc__iexact=nombre,
-                                marca_fk__nombre_mprod__iexact=producto_info.get('marca', ''),
-                                categoria_fk__nombre__iexact=producto_info.get('categoria', ''),
-                                bodega_fk=bodega
-                            )
-                            
-                            # Crear registro de historial
-                            Historial.objects.create(
-                                fecha=timezone.now(),
-                                usuario_fk=request.user,
-                                pedidos_fk=pedido,
-                                producto_fk=producto_obj
-                            )
-                        except Productos.DoesNotExist:
-                            logger.warning(f"Producto {nombre} no encontrado para historial")
-                        except Productos.MultipleObjectsReturned:
-                            # Si hay múltiples productos, usar el más reciente
-                            producto_obj = Productos.objects.filter(
-                                nombre_prodc__iexact=nombre,
-                                bodega_fk=bodega
-                            ).order_by('-fecha_creacion').first()
-                            
-                            if producto_obj:
-                                Historial.objects.create(
-                                    fecha=timezone.now(),
-                                    usuario_fk=request.user,
-                                    pedidos_fk=pedido,
-                                    producto_fk=producto_obj
-                                )
-                            else:
-                                logger.warning(f"No se pudo encontrar producto {nombre} para historial")
-                    
+                    logger.error(f"[crear_ingreso_bodega] ERROR al crear historial de estado 'Completado' para pedido {pedido.id_p}: {str(e)}")
+
+                # Procesar productos y agregarlos al inventario en bloque
+                # (productos, stock, movimientos, historial y detalles del pedido con consultas por conjunto)
+                productos_agregados = procesar_ingreso_en_bloque(productos_data, bodega, proveedor_obj, request.user, pedido)
+
+                logger.info(f"Ingreso creado para bodega {bodega.nombre_bdg}. Productos agregados: {len(productos_agregados)}")
+                if proveedor_obj:
                     logger.info(f"Historial de ingreso guardado para proveedor {proveedor_obj.nombres_provd}")
-                except Exception as e:
-                    logger.warning(f"No se pudo guardar historial de ingreso: {str(e)}")
-            
 
-            HistorialEstadoPedido.objects.create(
-                pedido_fk=pedido,
-                estado_anterior=None,
-                estado_nuevo=estado_completado,
-                usuario_fk=request.user if hasattr(request, 'user') else None,
-                comentario="Ingreso proveedor: estado Completado"
-            )
-            
+                HistorialEstadoPedido.objects.create(
+                    pedido_fk=pedido,
+                    estado_anterior=None,
+                    estado_nuevo=estado_completado,
+                    usuario_fk=request.user if hasattr(request, 'user') else None,
+                    comentario="Ingreso proveedor: estado Completado"
+                )
+
             return Response({
                 'mensaje': 'Ingreso creado exitosamente',
                 'pedido_id': pedido.id_p,
@@ -1678,19 +1623,6 @@ class UsuarioNotificacionDetailView(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         return UsuarioNotificacion.objects.filter(usuario=self.request.user)
 
-MARCAS = [
-    'Stanley', 'Bosch', 'Makita', 'Dewalt', 'Black+Decker', 'Einhell', 'Truper', 'Irwin', 'Hilti', '3M'
-]
-
-CATEGORIAS = {
-    'Herramientas manuales': ['martillo', 'destornillador', 'llave inglesa', 'alicate'],
-    'Herramientas eléctricas': ['taladro', 'atornillador', 'amoladora', 'sierracircular'],
-    'Materiales de fijación': ['clavo', 'tornillo', 'perno', 'tarugo'],
-    'Medición y nivelación': ['cinta métrica', 'nivel', 'escuadra'],
-    'Seguridad industrial': ['guantes', 'gafas', 'casco', 'mascarilla'],
-    'Accesorios': ['broca', 'disco de corte', 'hoja de sierra']
-}
-
 def buscar_patron(patron, texto):
     match = re.search(patron, texto, re.IGNORECASE | re.MULTILINE)
     return match.group(1).strip() if match else ''
@@ -1702,180 +1634,109 @@ class ExtraerProductosPDF(APIView):
         archivo = request.FILES.get('archivo')
         if not archivo:
             return Response({'error': 'No se envió archivo'}, status=400)
-        
-        productos = []
-        datos = {
-            'proveedor': '',
-            'rut': '',
-            'direccion': '',
-            'fecha': '',
-            'num_guia': '',
-            'num_rem': '',
-            'observaciones': '',
-            'contacto': '',
-            'email': '',
-            'telefono': ''
-        }
+
+        # Una guía ya procesada (mismo contenido) se responde desde el cache sin volver a leerla
+        # (el cache distingue el clasificador: con PDF_CLASIFICADOR_DESDE_BD cambia con las marcas/categorías)
+        hash_contenido = hash_archivo(archivo)
+        clasificador = obtener_clasificador()
+        resultado = obtener_resultado_cacheado(hash_contenido, clasificador)
+
+        # Modo asíncrono: se responde de inmediato con el id del trabajo y el PDF se procesa
+        # en el pool de procesos; el resultado se consulta en EstadoExtraccionPDF
+        modo = request.data.get('modo') or request.query_params.get('modo')
+        if modo == 'async':
+            try:
+                if resultado is not None:
+                    trabajo_id = crear_trabajo_completado(resultado, archivo.name)
+                else:
+                    trabajo_id = crear_trabajo_extraccion(archivo.read(), archivo.name, hash_contenido, clasificador)
+            except Exception as e:
+                logger.error(f"Error al encolar PDF: {str(e)}")
+                return Response({'error': f'Error al procesar el PDF: {str(e)}'}, status=500)
+            return Response({
+                'trabajo_id': trabajo_id,
+                'estado': 'completado' if resultado is not None else 'pendiente',
+                'url_estado': reverse('estado_extraccion_pdf', args=[trabajo_id])
+            }, status=status.HTTP_202_ACCEPTED)
+
+        if resultado is not None:
+            return Response(resultado)
         
         try:
-            with pdfplumber.open(archivo) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text() or ''
-                    print('TEXTO EXTRAÍDO:', repr(text))  # Debug
-                    
-                    # Procesar línea por línea para extraer datos
-                    for i, line in enumerate(text.split('\n')):
-                        line = line.strip()
-                        print(f"Línea {i}: {repr(line)}")
-                        
-                        # Patrones más flexibles para extraer información
-                        if any(keyword in line.lower() for keyword in ['proveedor:', 'empresa:', 'razón social:', 'nombre:']):
-                            if ':' in line:
-                                datos['proveedor'] = line.split(':', 1)[1].strip()
-                        
-                        if any(keyword in line.lower() for keyword in ['rut:', 'r.u.t:', 'identificación:', 'cédula:']):
-                            if ':' in line:
-                                rut = line.split(':', 1)[1].strip()
-                                # Limpiar formato del RUT
-                                rut = re.sub(r'[^\d\-kK]', '', rut)
-                                datos['rut'] = rut
-                        
-                        if any(keyword in line.lower() for keyword in ['dirección:', 'direccion:', 'domicilio:', 'address:']):
-                            if ':' in line:
-                                datos['direccion'] = line.split(':', 1)[1].strip()
-                        
-                        if any(keyword in line.lower() for keyword in ['fecha:', 'fecha de emisión:', 'fecha emisión:', 'date:']):
-                            if ':' in line:
-                                fecha = line.split(':', 1)[1].strip()
-                                # Limpiar y normalizar fecha
-                                fecha = re.sub(r'[^\d\/\-]', '', fecha)
-                                datos['fecha'] = fecha
-                        
-                        if any(keyword in line.lower() for keyword in ['guía:', 'guia:', 'número de guía:', 'numero de guia:', 'guía nº:', 'guia nº:']):
-                            if ':' in line:
-                                guia = line.split(':', 1)[1].strip()
-                                datos['num_guia'] = guia
-                        
-                        if any(keyword in line.lower() for keyword in ['rem:', 'número rem:', 'numero rem:', 'rem nº:', 'rem n°:']):
-                            if ':' in line:
-                                rem = line.split(':', 1)[1].strip()
-                                datos['num_rem'] = rem
-                        
-                        if any(keyword in line.lower() for keyword in ['teléfono:', 'telefono:', 'fono:', 'phone:']):
-                            if ':' in line:
-                                datos['telefono'] = line.split(':', 1)[1].strip()
-                        
-                        if any(keyword in line.lower() for keyword in ['email:', 'correo:', 'e-mail:']):
-                            if ':' in line:
-                                datos['email'] = line.split(':', 1)[1].strip()
-                        
-                        if any(keyword in line.lower() for keyword in ['contacto:', 'representante:', 'atencion:']):
-                            if ':' in line:
-                                datos['contacto'] = line.split(':', 1)[1].strip()
-                        
-                        if any(keyword in line.lower() for keyword in ['observaciones:', 'observación:', 'notas:', 'comentarios:']):
-                            if ':' in line:
-                                datos['observaciones'] = line.split(':', 1)[1].strip()
-                    
-                    # Procesar tablas para productos
-                    tables = page.extract_tables()
-                    for table in tables:
-                        for i, row in enumerate(table):
-                            if i == 0:
-                                continue  # Saltar encabezado
-                            if not row or all(cell is None or cell.strip() == '' for cell in row):
-                                continue
-                            
-                            nombre = row[0] or ''
-                            codigo = row[1] or ''
-                            try:
-                                cantidad = int(row[2]) if row[2] and str(row[2]).replace('.', '').isdigit() else 1
-                            except Exception:
-                                cantidad = 1
-                            
-                            # Inferir marca y categoría
-                            marca = ''
-                            for m in MARCAS:
-                                if m.lower() in nombre.lower():
-                                    marca = m
-                                    break
-                            
-                            categoria = 'General'
-                            for cat, palabras in CATEGORIAS.items():
-                                if any(palabra in nombre.lower() for palabra in palabras):
-                                    categoria = cat
-                                    break
-                            
-                            if nombre and cantidad > 0:
-                                productos.append({
-                                    'nombre': nombre,
-                                    'codigo': codigo,
-                                    'cantidad': cantidad,
-                                    'marca': marca,
-                                    'categoria': categoria
-                                })
-            
-            print('DATOS EXTRAÍDOS:', datos)
-            print('PRODUCTOS EXTRAÍDOS:', len(productos))
-            
-            return Response({
-                'productos': productos, 
-                'datos': datos,
-                'resumen': {
-                    'total_productos': len(productos),
-                    'campos_extraidos': {k: v for k, v in datos.items() if v},
-                    'campos_vacios': {k: v for k, v in datos.items() if not v}
-                }
-            })
+            # Extracción página por página (ver api/utils/pdf_guias.py)
+            resultado = extraer_guia_pdf(archivo, clasificador)
+            guardar_resultado(hash_contenido, resultado, clasificador)
+            logger.info(f"[PDF] Productos extraídos: {resultado['resumen']['total_productos']}")
+            return Response(resultado)
             
         except Exception as e:
             logger.error(f"Error al procesar PDF: {str(e)}")
             return Response({
                 'error': f'Error al procesar el PDF: {str(e)}',
                 'productos': [],
-                'datos': datos
+                'datos': datos_vacios()
             }, status=500)
+class EstadoExtraccionPDF(APIView):
+    """
+    Estado de un trabajo de extracción asíncrona. Cuando está completado retorna el mismo
+    payload que ExtraerProductosPDF (productos, datos y resumen).
+    """
+
+    def get(self, request, trabajo_id, format=None):
+        trabajo = obtener_trabajo(trabajo_id)
+        if not trabajo:
+            return Response({'error': 'Trabajo no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+        respuesta = {'trabajo_id': trabajo_id, 'estado': trabajo['estado']}
+        if trabajo['estado'] == 'completado':
+            respuesta.update(trabajo['resultado'])
+        elif trabajo['estado'] == 'error':
+            respuesta.update({'error': trabajo['error'], 'productos': [], 'datos': datos_vacios()})
+        if trabajo.get('fin'):
+            respuesta['tiempo_procesamiento_ms'] = round((trabajo['fin'] - trabajo['inicio']) * 1000, 2)
+        return Response(respuesta)
+
 class BodegaCentralViewSet(viewsets.ModelViewSet):
     queryset = BodegaCentral.objects.all()
     serializer_class = BodegaCentralSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
 
-def generar_qr_producto(codigo_interno):
-    """Genera un código QR para un producto usando solo el código interno"""
-    # Usar solo el código interno para evitar problemas con IDs automáticos
-    data = f"PROD:{codigo_interno}"
-    
-    # Crear QR
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-    
-    # Crear imagen
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convertir a base64
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    
-    return img_str
+def generar_qr_producto(codigo_interno, formato='png'):
+    """
+    Retorna el QR de un producto para incluirlo en JSON: PNG en base64 o el texto SVG.
+    La imagen sale del cache en disco de api/utils/qr.py
+    """
+    imagen = obtener_qr(codigo_interno, formato)
+    if formato == 'svg':
+        return imagen.decode('utf-8')
+    return base64.b64encode(imagen).decode()
+
+def formato_qr_solicitado(datos):
+    """Lee el parámetro formato (png por defecto). Retorna None si no es válido."""
+    formato = str(datos.get('formato') or 'png').lower()
+    return formato if formato in FORMATOS_QR else None
+
+ERROR_FORMATO_QR = f"formato debe ser uno de: {', '.join(FORMATOS_QR)}"
+
+def url_qr_producto(producto_id, formato='png'):
+    url = reverse('qr_producto_imagen', args=[producto_id])
+    return url if formato == 'png' else f'{url}?formato={formato}'
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def generar_qr_producto_view(request, producto_id):
     """Endpoint para generar QR de un producto específico"""
+    formato = formato_qr_solicitado(request.query_params)
+    if formato is None:
+        return Response({'error': ERROR_FORMATO_QR}, status=status.HTTP_400_BAD_REQUEST)
     try:
         producto = Productos.objects.get(id_prodc=producto_id)
-        qr_base64 = generar_qr_producto(producto.codigo_interno)
+        qr_code = generar_qr_producto(producto.codigo_interno, formato)
         
         return Response({
-            'qr_code': qr_base64,
+            'qr_code': qr_code,
+            'formato': formato,
+            'qr_url': url_qr_producto(producto.id_prodc, formato),
             'producto': {
                 'id': producto.id_prodc,
                 'nombre': producto.nombre_prodc,
@@ -1886,6 +1747,19 @@ def generar_qr_producto_view(request, producto_id):
     except Productos.DoesNotExist:
         return Response({'error': 'Producto no encontrado'}, status=status.HTTP_404_NOT_FOUND)
 
+def ubicacion_escaneo(request):
+    """
+    Ubicación desde la que se escanea: bodega_id/sucursal_id de la URL o, si no vienen, la
+    bodega o sucursal del usuario autenticado. Retorna (bodega_id, sucursal_id).
+    """
+    bodega_id = request.query_params.get('bodega_id')
+    sucursal_id = request.query_params.get('sucursal_id')
+    if not bodega_id and not sucursal_id and request.user and request.user.is_authenticated:
+        bodega_id = getattr(request.user, 'bodeg_fk_id', None)
+        sucursal_id = None if bodega_id else getattr(request.user, 'sucursal_fk_id', None)
+    # ValueError si los parámetros no son numéricos
+    return (int(bodega_id) if bodega_id else None), (int(sucursal_id) if sucursal_id else None)
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def producto_por_codigo(request, codigo_interno):
@@ -1893,66 +1767,18 @@ def producto_por_codigo(request, codigo_interno):
     try:
         # Limpiar el código interno de espacios y caracteres especiales
         codigo_limpio = codigo_interno.strip().upper()
+        bodega_id, sucursal_id = ubicacion_escaneo(request)
         
-        # Buscar producto por código interno
-        producto = Productos.objects.get(codigo_interno=codigo_limpio, activo=True)
-        
-        # Obtener stock actual
-        stock_actual = 0
-        stock_minimo = 0
-        ubicacion = None
-        
-        try:
-            stock_obj = Stock.objects.get(productos_fk=producto)
-            stock_actual = float(stock_obj.stock)
-            stock_minimo = float(stock_obj.stock_minimo) if stock_obj.stock_minimo else 0
-            
-            # Determinar ubicación
-            if stock_obj.bodega_fk:
-                try:
-                    bodega = BodegaCentral.objects.get(id_bdg=stock_obj.bodega_fk)
-                    ubicacion = f"Bodega: {bodega.nombre_bdg}"
-                except BodegaCentral.DoesNotExist:
-                    ubicacion = "Bodega Central"
-            elif stock_obj.sucursal_fk:
-                try:
-                    sucursal = Sucursal.objects.get(id=stock_obj.sucursal_fk)
-                    ubicacion = f"Sucursal: {sucursal.nombre_sucursal}"
-                except Sucursal.DoesNotExist:
-                    ubicacion = "Sucursal"
-        except Stock.DoesNotExist:
-            ubicacion = "Sin ubicación asignada"
-        
-        # Determinar estado del stock
-        if stock_actual <= 0:
-            estado_stock = 'SIN_STOCK'
-            color_estado = '#ff4444'
-        elif stock_actual <= stock_minimo:
-            estado_stock = 'CRÍTICO'
-            color_estado = '#ff8800'
-        elif stock_actual <= stock_minimo * 1.5:
-            estado_stock = 'BAJO'
-            color_estado = '#ffaa00'
-        else:
-            estado_stock = 'NORMAL'
-            color_estado = '#00aa00'
+        # Producto, marca, categoría y stock por ubicación en una sola consulta (o desde el cache de escaneo)
+        filas = cache_escaneo.obtener(codigo_limpio, consultar_producto_escaneo)
+        if not filas:
+            raise Productos.DoesNotExist
         
         return Response({
-            'producto': {
-                'id': producto.id_prodc,
-                'nombre': producto.nombre_prodc,
-                'codigo_interno': producto.codigo_interno,
-                'descripcion': producto.descripcion_prodc,
-                'marca': producto.marca_fk.nombre_mprod,
-                'categoria': producto.categoria_fk.nombre,
-                'stock_actual': stock_actual,
-                'stock_minimo': stock_minimo,
-                'estado_stock': estado_stock,
-                'color_estado': color_estado,
-                'ubicacion': ubicacion,
-                'fecha_creacion': producto.fecha_creacion.isoformat() if producto.fecha_creacion else None
-            }
+            'producto': armar_payload_escaneo(filas, bodega_id, sucursal_id, con_maximo=False)
         })
+    except ValueError:
+        return Response({'error': 'bodega_id y sucursal_id deben ser numéricos'}, status=status.HTTP_400_BAD_REQUEST)
     except Productos.DoesNotExist:
         return Response({
             'error': 'Producto no encontrado',
@@ -1978,6 +1804,8 @@ def actualizar_stock_con_movimiento(request, producto_id):
     try:
         nueva_cantidad = request.data.get('stock_write')
         motivo = request.data.get('motivo', 'Sin motivo especificado')
+        # Clave opcional enviada por el cliente para que los reintentos no dupliquen el movimiento
+        clave_cliente = request.headers.get('Idempotency-Key') or request.data.get('clave_idempotencia')
         
         if nueva_cantidad is None:
             return Response({
@@ -2029,6 +1857,7 @@ def actualizar_stock_con_movimiento(request, producto_id):
         cantidad_actual = float(stock_obj.stock)
         
         # Solo crear movimiento si hay cambio en el stock
+        movimiento_creado = False
         if cantidad_nueva != cantidad_actual:
             # Calcular la cantidad del movimiento
             cantidad_movimiento = cantidad_nueva - cantidad_actual
@@ -2036,15 +1865,35 @@ def actualizar_stock_con_movimiento(request, producto_id):
             logger.info(f"🔍 DEBUG - Creando movimiento: Stock actual={cantidad_actual}, Stock nuevo={cantidad_nueva}, Cantidad movimiento={cantidad_movimiento}")
             
             # Crear el movimiento de inventario
-            movimiento = MovInventario.objects.create(
+            movimiento, movimiento_creado = registrar_movimiento(
+                clave_idempotencia=f'ajuste:{request.user.id_us}:{clave_cliente}'[:150] if clave_cliente else None,
                 cantidad=cantidad_movimiento,
                 fecha=timezone.now(),
                 productos_fk=producto,
                 usuario_fk=request.user,
                 motivo=motivo,
-                stock_fk=stock_obj  # <-- NUEVO: referencia al stock de la ubicación
+                stock_fk=stock_obj,  # <-- NUEVO: referencia al stock de la ubicación
+                stock_antes=cantidad_actual,
+                stock_despues=cantidad_nueva
             )
             
+            if not movimiento_creado:
+                # Reintento de una operación ya registrada: no volver a aplicar el stock
+                logger.info(f"ℹ️ Movimiento {movimiento.id_mvin} ya registrado para la clave '{clave_cliente}'")
+                return Response({
+                    'mensaje': 'Stock actualizado correctamente',
+                    'producto': {
+                        'id': producto.id_prodc,
+                        'nombre': producto.nombre_prodc,
+                        'codigo_interno': producto.codigo_interno,
+                        'stock_anterior': float(movimiento.stock_antes) if movimiento.stock_antes is not None else cantidad_actual,
+                        'stock_nuevo': float(movimiento.stock_despues) if movimiento.stock_despues is not None else cantidad_actual,
+                        'movimiento_creado': False,
+                        'fecha_actualizacion': movimiento.fecha.isoformat(),
+                        'motivo': movimiento.motivo
+                    }
+                })
+
             # Actualizar stock
             stock_obj.stock = cantidad_nueva
             stock_obj.save()
@@ -2061,7 +1910,7 @@ def actualizar_stock_con_movimiento(request, producto_id):
                 'codigo_interno': producto.codigo_interno,
                 'stock_anterior': cantidad_actual,
                 'stock_nuevo': cantidad_nueva,
-                'movimiento_creado': cantidad_nueva != cantidad_actual,
+                'movimiento_creado': movimiento_creado,
                 'fecha_actualizacion': timezone.now().isoformat(),
                 'motivo': motivo
             }
@@ -2074,27 +1923,251 @@ def actualizar_stock_con_movimiento(request, producto_id):
             'detalle': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def conteo_inventario(request):
+    """
+    Aplica en bloque un conteo cíclico de una ubicación.
+    Body: {"bodega_id" | "sucursal_id" (por defecto la del usuario), "motivo", "clave_idempotencia",
+           "lineas": [{"codigo_interno": "...", "cantidad_contada": n}, ...]}
+    cantidad_contada debe ser un entero no negativo; si no, la línea queda como 'invalido'.
+    Los códigos se resuelven con una consulta y todos los ajustes (stock y MovInventario) se aplican
+    en una sola transacción. Retorna un resultado por línea, en el orden recibido.
+    """
+    lineas = request.data.get('lineas')
+    if not isinstance(lineas, list) or not lineas:
+        return Response({'error': 'lineas debe ser una lista de {codigo_interno, cantidad_contada}'}, status=status.HTTP_400_BAD_REQUEST)
+    maximo = getattr(settings, 'CONTEO_INVENTARIO_MAXIMO_LINEAS', 2000)
+    if len(lineas) > maximo:
+        return Response({'error': f'Se permiten como máximo {maximo} líneas por conteo'}, status=status.HTTP_400_BAD_REQUEST)
+
+    bodega_id = request.data.get('bodega_id')
+    sucursal_id = request.data.get('sucursal_id')
+    if not bodega_id and not sucursal_id:
+        bodega_id = getattr(request.user, 'bodeg_fk_id', None)
+        sucursal_id = None if bodega_id else getattr(request.user, 'sucursal_fk_id', None)
+    try:
+        bodega_id = int(bodega_id) if bodega_id else None
+        sucursal_id = int(sucursal_id) if sucursal_id and not bodega_id else None
+    except (ValueError, TypeError):
+        return Response({'error': 'bodega_id y sucursal_id deben ser numéricos'}, status=status.HTTP_400_BAD_REQUEST)
+    if not bodega_id and not sucursal_id:
+        return Response({'error': 'Se requiere bodega_id o sucursal_id'}, status=status.HTTP_400_BAD_REQUEST)
+
+    motivo = request.data.get('motivo') or 'Conteo de inventario'
+    # Clave opcional del cliente: reenviar el mismo conteo no duplica los ajustes ya registrados
+    clave_cliente = request.headers.get('Idempotency-Key') or request.data.get('clave_idempotencia')
+
+    resultados = []
+    validas = {}
+    for indice, linea in enumerate(lineas):
+        linea = linea if isinstance(linea, dict) else {}
+        codigo = str(linea.get('codigo_interno') or '').strip().upper()
+        resultado = {'linea': indice, 'codigo_interno': codigo, 'cantidad_contada': linea.get('cantidad_contada')}
+        resultados.append(resultado)
+        try:
+            # Solo unidades enteras: la diferencia se registra en MovInventario.cantidad (entero)
+            contado = float(linea.get('cantidad_contada'))
+            if not codigo or contado < 0 or contado != int(contado):
+                raise ValueError
+            contado = int(contado)
+        except (ValueError, TypeError, OverflowError):
+            resultado.update({'estado': 'invalido', 'error': 'Se requiere codigo_interno y una cantidad_contada entera no negativa'})
+            continue
+        if codigo in validas:
+            resultado.update({'estado': 'repetido', 'error': f'El código ya fue contado en la línea {validas[codigo][0]}'})
+            continue
+        validas[codigo] = (indice, contado)
+
+    productos = {
+        producto.codigo_interno: producto
+        for producto in Productos.objects.filter(codigo_interno__in=validas.keys(), activo=True)
+    }
+    lineas_conteo = []
+    for codigo, (indice, contado) in validas.items():
+        producto = productos.get(codigo)
+        if producto is None:
+            resultados[indice].update({'estado': 'no_encontrado', 'error': 'Producto no encontrado o inactivo'})
+            continue
+        resultados[indice]['producto_id'] = producto.id_prodc
+        lineas_conteo.append({
+            'producto': producto,
+            'conteo': contado,
+            'clave': f'conteo:{request.user.id_us}:{clave_cliente}:{codigo}'[:150] if clave_cliente else None,
+            'indice': indice,
+        })
+
+    try:
+        aplicados = aplicar_ingresos_stock(lineas_conteo, request.user, motivo, bodega_id=bodega_id, sucursal_id=sucursal_id)
+    except Exception as e:
+        logger.error(f"[CONTEO] Error aplicando conteo: {str(e)}")
+        return Response({'error': 'Error interno del servidor', 'detalle': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    for aplicado in aplicados:
+        resultados[aplicado['linea']['indice']].update({
+            'estado': 'ajustado' if aplicado['movimiento_creado'] else 'sin_cambios',
+            'stock_anterior': float(aplicado['stock_antes']),
+            'stock_nuevo': float(aplicado['stock_despues']),
+            'diferencia': float(aplicado['cantidad']),
+        })
+    for linea in lineas_conteo:
+        resultado = resultados[linea['indice']]
+        if 'estado' not in resultado:
+            # Clave ya registrada: el ajuste se aplicó en un envío anterior
+            resultado['estado'] = 'ya_registrado'
+
+    resumen = {}
+    for resultado in resultados:
+        resumen[resultado['estado']] = resumen.get(resultado['estado'], 0) + 1
+    return Response({'resumen': resumen, 'resultados': resultados})
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def lista_productos_qr(request):
-    """Endpoint para obtener lista de productos con QR (para impresión)"""
+    """
+    Endpoint para obtener lista de productos con QR (para impresión).
+    Cada producto trae la URL de su imagen (cacheable con ETag) en lugar del PNG en base64;
+    ?incluir_base64=true mantiene el formato anterior con 'qr_code'. ?formato=svg entrega SVG.
+    """
+    formato = formato_qr_solicitado(request.query_params)
+    if formato is None:
+        return Response({'error': ERROR_FORMATO_QR}, status=status.HTTP_400_BAD_REQUEST)
     try:
-        productos = Productos.objects.filter(activo=True)
+        incluir_base64 = request.query_params.get('incluir_base64', '').lower() in ('1', 'true', 'si')
+        productos = Productos.objects.filter(activo=True).values_list('id_prodc', 'nombre_prodc', 'codigo_interno')
         productos_con_qr = []
         
-        for producto in productos:
-            qr_base64 = generar_qr_producto(producto.codigo_interno)
-            productos_con_qr.append({
-                'id': producto.id_prodc,
-                'nombre': producto.nombre_prodc,
-                'codigo_interno': producto.codigo_interno,
-                'qr_code': qr_base64
-            })
+        for id_prodc, nombre, codigo_interno in productos:
+            item = {
+                'id': id_prodc,
+                'nombre': nombre,
+                'codigo_interno': codigo_interno,
+                'qr_url': url_qr_producto(id_prodc, formato),
+                'qr_etag': etag_qr(codigo_interno, formato),
+            }
+            if incluir_base64:
+                item['qr_code'] = generar_qr_producto(codigo_interno, formato)
+            productos_con_qr.append(item)
         
         return Response({'productos': productos_con_qr})
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def qr_producto_imagen(request, producto_id):
+    """
+    Imagen del QR de un producto como respuesta binaria (?formato=png por defecto, o svg). El ETag
+    depende solo del código interno, por lo que un If-None-Match vigente responde 304 sin leer ni
+    generar la imagen.
+    """
+    formato = formato_qr_solicitado(request.query_params)
+    if formato is None:
+        return Response({'error': ERROR_FORMATO_QR}, status=status.HTTP_400_BAD_REQUEST)
+    codigo_interno = Productos.objects.filter(id_prodc=producto_id).values_list('codigo_interno', flat=True).first()
+    if codigo_interno is None:
+        return Response({'error': 'Producto no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+
+    etag = f'"{etag_qr(codigo_interno, formato)}"'
+    if etag in [valor.strip() for valor in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+        respuesta = HttpResponse(status=304)
+    else:
+        respuesta = HttpResponse(obtener_qr(codigo_interno, formato), content_type=FORMATOS_QR[formato][0])
+    respuesta['ETag'] = etag
+    # El navegador revalida siempre: si el producto cambia de código el ETag cambia
+    respuesta['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    return respuesta
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def qr_productos_lote(request):
+    """
+    Genera en una sola respuesta los QR de varios productos.
+    Body: {"ids": [1, 2, ...], "formato": "png" | "svg"}. Los productos se leen con una consulta
+    y el orden de la respuesta sigue el de "ids"; los ids inexistentes se informan aparte.
+    """
+    formato = formato_qr_solicitado(request.data)
+    if formato is None:
+        return Response({'error': ERROR_FORMATO_QR}, status=status.HTTP_400_BAD_REQUEST)
+    ids = request.data.get('ids')
+    maximo = getattr(settings, 'QR_LOTE_MAXIMO', 500)
+    try:
+        if not isinstance(ids, list) or not ids:
+            raise ValueError
+        ids = list(dict.fromkeys(int(i) for i in ids))
+    except (TypeError, ValueError):
+        return Response({'error': 'ids debe ser una lista de IDs de producto'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > maximo:
+        return Response({'error': f'Se permiten como máximo {maximo} productos por solicitud'}, status=status.HTTP_400_BAD_REQUEST)
+
+    productos = {
+        id_prodc: (nombre, codigo_interno)
+        for id_prodc, nombre, codigo_interno in Productos.objects.filter(id_prodc__in=ids).values_list('id_prodc', 'nombre_prodc', 'codigo_interno')
+    }
+    resultado = []
+    for id_prodc in ids:
+        if id_prodc not in productos:
+            continue
+        nombre, codigo_interno = productos[id_prodc]
+        resultado.append({
+            'id': id_prodc,
+            'nombre': nombre,
+            'codigo_interno': codigo_interno,
+            'qr_code': generar_qr_producto(codigo_interno, formato),
+        })
+    return Response({
+        'formato': formato,
+        'productos': resultado,
+        'no_encontrados': [id_prodc for id_prodc in ids if id_prodc not in productos],
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def exportar_etiquetas_qr(request):
+    """
+    Exporta etiquetas QR imprimibles como PDF de varias hojas (formato=pdf) o ZIP de PNG (formato=zip).
+    Filtros: bodega_id / sucursal_id (productos con stock en la ubicación) y paginación opcional
+    con pagina y tamano_pagina. La respuesta se escribe a medida que se generan las imágenes.
+    """
+    formato = request.query_params.get('formato', 'pdf').lower()
+    if formato not in ('pdf', 'zip'):
+        return Response({'error': "formato debe ser 'pdf' o 'zip'"}, status=status.HTTP_400_BAD_REQUEST)
+
+    productos = Productos.objects.filter(activo=True)
+    bodega_id = request.query_params.get('bodega_id')
+    sucursal_id = request.query_params.get('sucursal_id')
+    if bodega_id:
+        productos = productos.filter(id_prodc__in=Stock.objects.filter(bodega_fk=bodega_id, stock__gt=0).values('productos_fk'))
+    elif sucursal_id:
+        productos = productos.filter(id_prodc__in=Stock.objects.filter(sucursal_fk=sucursal_id, stock__gt=0).values('productos_fk'))
+    productos = productos.order_by('id_prodc')
+
+    tamano_pagina = request.query_params.get('tamano_pagina')
+    if tamano_pagina:
+        try:
+            tamano_pagina = int(tamano_pagina)
+            pagina = int(request.query_params.get('pagina', 1))
+            if tamano_pagina < 1 or pagina < 1:
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'pagina y tamano_pagina deben ser enteros positivos'}, status=status.HTTP_400_BAD_REQUEST)
+        inicio = (pagina - 1) * tamano_pagina
+        productos = productos[inicio:inicio + tamano_pagina]
+
+    filas = productos.values_list('id_prodc', 'nombre_prodc', 'codigo_interno').iterator(chunk_size=500)
+    if formato == 'zip':
+        respuesta = StreamingHttpResponse(generar_zip_etiquetas(filas), content_type='application/zip')
+    else:
+        respuesta = StreamingHttpResponse(generar_pdf_etiquetas(filas), content_type='application/pdf')
+    respuesta['Content-Disposition'] = f'attachment; filename="etiquetas_qr.{formato}"'
+    return respuesta
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def estadisticas_cache_escaneo(request):
+    """Aciertos y fallos del cache de códigos escaneados de este proceso"""
+    return Response(cache_escaneo.estadisticas())
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def validar_codigo_producto(request, codigo_interno):
@@ -2103,17 +2176,20 @@ def validar_codigo_producto(request, codigo_interno):
         # Limpiar el código interno
         codigo_limpio = codigo_interno.strip().upper()
         
-        # Verificar si existe el producto
-        producto = Productos.objects.get(codigo_interno=codigo_limpio, activo=True)
+        # Verificar si existe el producto (comparte el cache de escaneo con producto_por_codigo)
+        filas = cache_escaneo.obtener(codigo_limpio, consultar_producto_escaneo)
+        if not filas:
+            raise Productos.DoesNotExist
+        producto = filas[0]
         
         return Response({
             'valido': True,
             'producto': {
-                'id': producto.id_prodc,
-                'nombre': producto.nombre_prodc,
-                'codigo_interno': producto.codigo_interno,
-                'marca': producto.marca_fk.nombre_mprod,
-                'categoria': producto.categoria_fk.nombre
+                'id': producto['id_prodc'],
+                'nombre': producto['nombre_prodc'],
+                'codigo_interno': producto['codigo_interno'],
+                'marca': producto['marca_fk__nombre_mprod'],
+                'categoria': producto['categoria_fk__nombre']
             }
         })
     except Productos.DoesNotExist:
@@ -2186,14 +2262,18 @@ def verificar_producto_existente(request):
                 'error': 'Todos los campos son requeridos'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Buscar producto existente
         try:
-            producto = Productos.objects.get(
-                nombre_prodc__iexact=nombre,
-                marca_fk__nombre_mprod__iexact=marca,
-                categoria_fk__nombre__iexact=categoria,
-                bodega_fk=bodega_id
-            )
+            bodega_id = int(bodega_id)
+        except (TypeError, ValueError):
+            return Response({
+                'error': 'bodega_id inválido'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Buscar producto existente en el índice del catálogo de la bodega
+        try:
+            producto = buscar_producto_en_catalogo(nombre, marca, categoria, bodega_id=bodega_id)
+            if producto is None:
+                raise Productos.DoesNotExist
             
             # Obtener stock actual
             stock_obj = Stock.objects.filter(
@@ -2225,212 +2305,262 @@ def verificar_producto_existente(request):
             'error': 'Error interno del servidor'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-def extraer_modelo_desde_nombre(nombre):
+def patron_codigo_unico(nombre, marca, categoria, modelo):
     """
-    Extrae una variante/modelo relevante del nombre del producto (ej: 10m, 500ml, 2L, 500W, 220V, 1HP, 1/2", 16mm, 10'', etc.)
-    Si no encuentra, retorna 'GEN'.
+    Prefijo {CAT}-{MARCA}-{MODELO}-{YYYYMM} del código único (sin el correlativo)
     """
-    patrones = [
-        r"(\d+\s?(m|ml|l|kg|g|cm|mm|pcs|un|lt|mts|mt|x\d+))",  # Medidas y cantidades
-        r"(\d+\s?(w|kw|hp|v|ah|hz|rpm|bar|psi|amp|a|kva|kcal|btu))",  # Potencias, voltajes, energía
-        r"(\d+/\d+\s?\"|\d+\s?\"|\d+/\d+\s?''|\d+\s?'')",  # Fracciones y pulgadas (doble y simple)
-        r"(\d+\s?mm|\d+\s?cm|\d+\s?m)",  # Milímetros, centímetros, metros
-        r"(rojo|azul|verde|negro|blanco|amarillo|gris|naranja|madera|inox|cobre|plata|dorado|transparente|beige|marrón|morado|celeste|turquesa|ocre|pino|nogal|grafito|acero|galvanizado|zinc)",  # Colores y materiales
-        r"(grande|pequeño|mediano|extra|mini|maxi|compacto|industrial|profesional|hogar|básico|premium)",  # Tamaños y calidades
-        r"(\d+\s?kg|\d+\s?g|\d+\s?lb|\d+\s?ton)",  # Pesos
-        r"(\d+\s?ml|\d+\s?l|\d+\s?cc)",  # Volúmenes
-        r"(\d+\s?panel|\d+\s?placa|\d+\s?rollo|\d+\s?bolsa|\d+\s?caja|\d+\s?bulto|\d+\s?barril|\d+\s?galón)",  # Unidades de empaque
-    ]
-    for patron in patrones:
-        match = re.search(patron, nombre, re.IGNORECASE)
-        if match:
-            return match.group(0).replace(' ', '').upper()
-    return 'GEN'
+    categoria_prefijo = categoria[:4].upper() if categoria else 'GEN'
+    marca_prefijo = marca[:4].upper() if marca else 'GEN'
+    if not modelo or modelo.strip() == '':
+        modelo_prefijo = extraer_modelo_desde_nombre(nombre)
+    else:
+        modelo_prefijo = modelo[:4].upper()
+    fecha_actual = timezone.now().strftime('%Y%m')
+    return f'{categoria_prefijo}-{marca_prefijo}-{modelo_prefijo}-{fecha_actual}'
 
 def generate_codigo_unico(nombre, marca, categoria, modelo, bodega=None, sucursal=None):
     """
     Genera un código único basado en características del producto
     Formato: {CAT}-{MARCA}-{MODELO}-{YYYYMM}-{NNN}
     Ejemplo: FERR-STAN-500W-202406-001
-    El correlativo NNN es único por bodega/sucursal, categoría, marca y modelo
+    El correlativo NNN es único por categoría, marca, modelo y mes en todas las ubicaciones (como
+    codigo_interno), y se toma del contador del patrón (reservar_codigos), seguro ante ingresos concurrentes
     """
     try:
-        categoria_prefijo = categoria[:4].upper() if categoria else 'GEN'
-        marca_prefijo = marca[:4].upper() if marca else 'GEN'
-        if not modelo or modelo.strip() == '':
-            modelo_prefijo = extraer_modelo_desde_nombre(nombre)
-        else:
-            modelo_prefijo = modelo[:4].upper()
-        fecha_actual = timezone.now().strftime('%Y%m')
-        patron = f'{categoria_prefijo}-{marca_prefijo}-{modelo_prefijo}-{fecha_actual}'
-        # Filtro por bodega o sucursal
-        filtro_ubicacion = {}
-        if bodega:
-            filtro_ubicacion['bodega_fk'] = bodega
-        if sucursal:
-            filtro_ubicacion['sucursal_fk'] = sucursal
-        # Buscar último número para esta combinación en la ubicación
-        ultimo_producto = Productos.objects.filter(
-            codigo_interno__startswith=patron,
-            categoria_fk__nombre__iexact=categoria,
-            marca_fk__nombre_mprod__iexact=marca,
-            **filtro_ubicacion
-        ).order_by('-codigo_interno').first()
-        if ultimo_producto:
-            try:
-                ultimo_numero = int(ultimo_producto.codigo_interno.split('-')[-1])
-                nuevo_numero = ultimo_numero + 1
-            except (ValueError, IndexError):
-                nuevo_numero = 1
-        else:
-            nuevo_numero = 1
-        codigo = f'{patron}-{nuevo_numero:03d}'
+        patron = patron_codigo_unico(nombre, marca, categoria, modelo)
+        codigo = reservar_codigos([patron])[0]
         logger.info(f"Código único generado para {nombre}: {codigo}")
         return codigo
     except Exception as e:
         logger.error(f"Error generando código único para {nombre}: {str(e)}")
         return f'PROD-{int(timezone.now().timestamp())}'
 
-def buscar_producto_por_codigo(codigo_interno, bodega):
+def variante_codigo_unico(nombre, marca, categoria, modelo):
     """
-    Busca un producto por su código interno único
+    Tramo {CAT}-{MARCA}-{MODELO} del código único: identifica el modelo de un producto en el
+    índice del catálogo (Productos no guarda el modelo en una columna propia)
+    """
+    return patron_codigo_unico(nombre, marca, categoria, modelo).rsplit('-', 1)[0]
+
+def buscar_producto_en_catalogo(nombre, marca, categoria, variante=None, bodega_id=None, sucursal_id=None):
+    """
+    Busca en el índice en memoria del catálogo el producto activo de la ubicación con el mismo
+    nombre, marca y categoría (y variante, si se indica). Retorna el producto o None.
+    """
+    producto_id = indice_catalogo.buscar(nombre, marca, categoria, variante, bodega_id=bodega_id, sucursal_id=sucursal_id)
+    if producto_id is None:
+        return None
+    producto = Productos.objects.select_related('marca_fk', 'categoria_fk').filter(id_prodc=producto_id, activo=True).first()
+    if producto is None or clave_producto(producto) != clave_catalogo(nombre, marca, categoria):
+        # Escritura revertida o producto modificado por otro proceso
+        indice_catalogo.olvidar(producto_id)
+        return None
+    return producto
+
+def generar_codigos_unicos_en_bloque(lineas, bodega):
+    """
+    Genera los códigos únicos de varios productos nuevos de una misma bodega reservando en bloque
+    los correlativos de cada patrón (dos líneas con el mismo patrón reciben correlativos consecutivos).
+    Cada línea es un dict con nombre, marca, categoria y modelo. Retorna la lista de códigos.
+    """
+    patrones = [
+        patron_codigo_unico(linea['nombre'], linea['marca'], linea['categoria'], linea['modelo'])
+        for linea in lineas
+    ]
+    return reservar_codigos(patrones)
+
+def cantidad_linea_ingreso(valor):
+    """
+    Cantidad de una línea de ingreso como Decimal; acepta números y textos numéricos ("5", "2.5")
+    como los que envían clientes JSON o la extracción PDF. Retorna None si no es un número finito.
     """
     try:
-        producto = Productos.objects.get(
-            codigo_interno=codigo_interno,
-            bodega_fk=bodega
-        )
-        return producto
-    except Productos.DoesNotExist:
+        cantidad = Decimal(str(valor).strip())
+    except (InvalidOperation, ValueError):
         return None
+    return cantidad if cantidad.is_finite() else None
 
-def procesar_producto_ingreso(producto_data, bodega, proveedor, request):
-    nombre = producto_data.get('nombre', '')
-    marca_nombre = producto_data.get('marca', '')
-    categoria_nombre = producto_data.get('categoria', '')
-    modelo = producto_data.get('modelo', '')  # Nuevo campo
-    cantidad = producto_data.get('cantidad', 0)
-    es_producto_existente = producto_data.get('es_producto_existente', False)
-    producto_id_existente = producto_data.get('id')  # ID del producto existente seleccionado
-    codigo_interno = producto_data.get('codigo_interno')
-
-    # Nueva validación diferenciada
-    if es_producto_existente:
-        if not producto_id_existente or cantidad <= 0:
-            raise ValueError("Datos incompletos para producto existente: id y cantidad requeridos")
-        # Cargar el producto existente por ID:
-        try:
-            producto = Productos.objects.get(id_prodc=producto_id_existente, activo=True)
-        except Productos.DoesNotExist:
-            raise ValueError(f"Producto existente con ID {producto_id_existente} no encontrado")
-        # Sumar stock en la bodega correspondiente
-        stock_obj, _ = Stock.objects.get_or_create(
-            productos_fk=producto,
-            bodega_fk=bodega.id_bdg,
-            defaults={
-                'stock': 0,
-                'stock_minimo': 5,
-                'stock_maximo': 100,
-                'sucursal_fk': None,
-                'proveedor_fk': None
-            }
-        )
-        stock_obj.stock += cantidad
-        stock_obj.save()
-        # Registrar movimiento de inventario
-        MovInventario.objects.create(
-            cantidad=cantidad,
-            fecha=timezone.now(),
-            productos_fk=producto,
-            usuario_fk=request.user,
-            stock_fk=stock_obj,
-            motivo=f'Ingreso por pedido de proveedor{f" - {proveedor.nombres_provd}" if proveedor else ""}'
-        )
-        return {
-            'producto': producto.nombre_prodc,
-            'codigo_interno': producto.codigo_interno,
-            'cantidad': float(cantidad),
-            'stock_actual': float(stock_obj.stock),
-            'marca': producto.marca_fk.nombre_mprod,
-            'categoria': producto.categoria_fk.nombre,
-            'modelo': modelo,
-            'es_nuevo': False
+def procesar_ingreso_en_bloque(productos_data, bodega, proveedor, usuario, pedido):
+    """
+    Registra en el inventario de la bodega los productos de una guía completa.
+
+    Resuelve marcas, categorías y productos de todas las líneas con consultas por
+    conjunto (los productos nuevos ya registrados en la bodega se detectan con el índice del
+    catálogo), crea los faltantes con bulk_create y registra stock, movimientos, historial
+    (si hay proveedor) y detalles del pedido en bloque.
+    Las líneas inválidas se registran en el log y se omiten.
+    Retorna la lista de productos agregados (producto, codigo_interno, cantidad, stock_actual,
+    marca, categoria, modelo y es_nuevo).
+    """
+    motivo_existente = f'Ingreso por pedido de proveedor{f" - {proveedor.nombres_provd}" if proveedor else ""}'
+
+    # --- Validar y separar líneas de productos existentes y nuevos ---
+    existentes, nuevas = [], []
+    for indice, producto_info in enumerate(productos_data):
+        cantidad = cantidad_linea_ingreso(producto_info.get('cantidad', 0))
+        if cantidad is None:
+            logger.error(f"Error procesando producto {producto_info.get('nombre', '')}: cantidad inválida: {producto_info.get('cantidad')!r}")
+            continue
+        linea = {
+            'indice': indice,
+            'info': producto_info,
+            'nombre': producto_info.get('nombre', ''),
+            'marca': producto_info.get('marca', ''),
+            'categoria': producto_info.get('categoria', ''),
+            'modelo': producto_info.get('modelo', ''),
+            'cantidad': cantidad,
         }
-    else:
-        if not nombre or not marca_nombre or not categoria_nombre or cantidad <= 0:
-            raise ValueError(f"Datos incompletos para producto: {nombre}")
-
-        # Buscar o crear marca
-        marca, created = Marca.objects.get_or_create(
-            nombre_mprod=marca_nombre,
-            defaults={'descripcion_mprod': f'Marca {marca_nombre}'}
-        )
+        if producto_info.get('es_producto_existente', False):
+            try:
+                linea['id'] = int(producto_info.get('id'))
+            except (TypeError, ValueError):
+                linea['id'] = None
+            if not linea['id'] or cantidad <= 0:
+                logger.error(f"Error procesando producto {linea['nombre']}: Datos incompletos para producto existente: id y cantidad requeridos")
+                continue
+            existentes.append(linea)
+        else:
+            if not linea['nombre'] or not linea['marca'] or not linea['categoria'] or cantidad <= 0:
+                logger.error(f"Error procesando producto {linea['nombre']}: Datos incompletos para producto: {linea['nombre']}")
+                continue
+            nuevas.append(linea)
 
-        # Buscar o crear categoría
-        categoria, created = Categoria.objects.get_or_create(
-            nombre=categoria_nombre,
-            defaults={'descripcion': f'Categoría {categoria_nombre}'}
+    # --- Productos existentes: una consulta ---
+    if existentes:
+        encontrados = Productos.objects.select_related('marca_fk', 'categoria_fk').in_bulk(
+            {linea['id'] for linea in existentes}
         )
-
-        # Generar código único
-        codigo_unico = generate_codigo_unico(nombre, marca_nombre, categoria_nombre, modelo, bodega)
-
-        # Verificar si ya existe un producto con este código
-        producto_existente = buscar_producto_por_codigo(codigo_unico, bodega)
-
-        if producto_existente:
-            # Producto existe, solo actualizar stock
-            producto = producto_existente
-        else:
-            # Crear nuevo producto con código único
-            producto = Productos.objects.create(
-                nombre_prodc=nombre,
-                marca_fk=marca,
-                categoria_fk=categoria,
+        for linea in list(existentes):
+            producto = encontrados.get(linea['id'])
+            if producto is None or not producto.activo:
+                logger.error(f"Error procesando producto {linea['nombre']}: Producto existente con ID {linea['id']} no encontrado")
+                existentes.remove(linea)
+                continue
+            linea['producto'] = producto
+            linea['motivo'] = motivo_existente
+            linea['es_nuevo'] = False
+
+    # --- Productos nuevos: primero los ya registrados en la bodega (índice del catálogo) ---
+    a_crear, por_clave = [], {}
+    if nuevas:
+        for linea in nuevas:
+            linea['motivo'] = 'Ingreso por pedido'
+            linea['variante'] = variante_codigo_unico(linea['nombre'], linea['marca'], linea['categoria'], linea['modelo'])
+            linea['id_catalogo'] = indice_catalogo.buscar(
+                linea['nombre'], linea['marca'], linea['categoria'], linea['variante'], bodega_id=bodega.id_bdg
+            )
+        ids_catalogo = {linea['id_catalogo'] for linea in nuevas if linea['id_catalogo']}
+        en_catalogo = Productos.objects.select_related('marca_fk', 'categoria_fk').filter(activo=True).in_bulk(ids_catalogo) if ids_catalogo else {}
+        # Las líneas repetidas dentro de la guía comparten un solo producto nuevo
+        for linea in nuevas:
+            clave = clave_catalogo(linea['nombre'], linea['marca'], linea['categoria'])
+            producto = en_catalogo.get(linea['id_catalogo'])
+            if linea['id_catalogo'] and (producto is None or clave_producto(producto) != clave):
+                # Escritura revertida o producto modificado por otro proceso
+                indice_catalogo.olvidar(linea['id_catalogo'])
+                producto = None
+            linea['producto'] = producto
+            linea['es_nuevo'] = producto is None
+            if linea['es_nuevo']:
+                por_clave.setdefault(clave + (linea['variante'],), []).append(linea)
+        a_crear = [grupo[0] for grupo in por_clave.values()]
+
+    # --- Marcas y categorías por conjunto, productos con bulk_create ---
+    if a_crear:
+        nombres_marca = {linea['marca'] for linea in a_crear}
+        marcas = {}
+        for marca in Marca.objects.filter(nombre_mprod__in=nombres_marca).order_by('id_mprod'):
+            marcas.setdefault(marca.nombre_mprod, marca)
+        for marca in Marca.objects.bulk_create([
+            Marca(nombre_mprod=nombre, descripcion_mprod=f'Marca {nombre}')
+            for nombre in nombres_marca if nombre not in marcas
+        ]):
+            marcas[marca.nombre_mprod] = marca
+
+        nombres_categoria = {linea['categoria'] for linea in a_crear}
+        categorias = {}
+        for categoria in Categoria.objects.filter(nombre__in=nombres_categoria).order_by('pk'):
+            categorias.setdefault(categoria.nombre, categoria)
+        for categoria in Categoria.objects.bulk_create([
+            Categoria(nombre=nombre, descripcion=f'Categoría {nombre}')
+            for nombre in nombres_categoria if nombre not in categorias
+        ]):
+            categorias[categoria.nombre] = categoria
+
+        codigos = generar_codigos_unicos_en_bloque(a_crear, bodega)
+        # Si el código generado ya existe en la bodega se reutiliza ese producto
+        ya_existentes = Productos.objects.select_related('marca_fk', 'categoria_fk').filter(
+            codigo_interno__in=codigos, bodega_fk=bodega
+        ).in_bulk(field_name='codigo_interno')
+        por_crear = []
+        for linea, codigo in zip(a_crear, codigos):
+            if codigo in ya_existentes:
+                linea['producto'] = ya_existentes[codigo]
+                continue
+            linea['producto'] = Productos(
+                nombre_prodc=linea['nombre'],
+                marca_fk=marcas[linea['marca']],
+                categoria_fk=categorias[linea['categoria']],
                 bodega_fk=bodega,
-                descripcion_prodc=f'{nombre} - {marca_nombre} - {categoria_nombre} - {modelo}',
-                codigo_interno=codigo_unico,
+                descripcion_prodc=f"{linea['nombre']} - {linea['marca']} - {linea['categoria']} - {linea['modelo']}",
+                codigo_interno=codigo,
                 fecha_creacion=timezone.now(),
                 sucursal_fk=None
             )
+            por_crear.append(linea['producto'])
+        Productos.objects.bulk_create(por_crear)
+        # bulk_create no pasa por Productos.save(): se agregan al índice aquí
+        for producto in por_crear:
+            indice_catalogo.registrar(producto)
+        for grupo in por_clave.values():
+            for linea in grupo[1:]:
+                linea['producto'] = grupo[0]['producto']
+
+    lineas = sorted(existentes + nuevas, key=lambda linea: linea['indice'])
+    if not lineas:
+        return []
 
-        # Buscar o crear el stock para este producto en la bodega
-        stock_obj, _ = Stock.objects.get_or_create(
-            productos_fk=producto,
-            bodega_fk=bodega.id_bdg,
-            defaults={
-                'stock': 0,
-                'stock_minimo': 5,
-                'stock_maximo': 100,
-                'sucursal_fk': None,
-                'proveedor_fk': None
+    # --- Stock, movimientos e historial en bloque ---
+    resultados = aplicar_ingresos_stock(
+        [
+            {
+                'producto': linea['producto'],
+                'cantidad': linea['cantidad'],
+                'clave': f"ingreso:{pedido.id_p}:{linea['indice']}",
+                'motivo': linea['motivo'],
             }
+            for linea in lineas
+        ],
+        usuario=usuario,
+        motivo='Ingreso por pedido',
+        bodega_id=bodega.id_bdg,
+        pedido=pedido if proveedor else None,
+        defaults_stock={'stock_minimo': 5, 'stock_maximo': 100}
+    )
+    DetallePedido.objects.bulk_create([
+        DetallePedido(
+            cantidad=linea['cantidad'],
+            descripcion=f"Producto de ingreso: {linea['nombre']}",
+            productos_pedido_fk=linea['producto'],
+            pedidos_fk=pedido
         )
+        for linea in lineas
+    ])
 
-        # Agregar la cantidad al stock existente
-        stock_obj.stock += cantidad
-        stock_obj.save()
-
-        # Registrar movimiento de inventario
-        MovInventario.objects.create(
-            cantidad=cantidad,
-            fecha=timezone.now(),
-            productos_fk=producto,
-            usuario_fk=request.user,
-            motivo='Ingreso por pedido',
-            stock_fk=stock_obj
-        )
-
-        return {
+    productos_agregados = []
+    for linea, resultado in zip(lineas, resultados):
+        producto = linea['producto']
+        productos_agregados.append({
             'producto': producto.nombre_prodc,
             'codigo_interno': producto.codigo_interno,
-            'cantidad': float(cantidad),
-            'stock_actual': float(stock_obj.stock),
+            'cantidad': float(linea['cantidad']),
+            'stock_actual': float(resultado['stock_despues']),
             'marca': producto.marca_fk.nombre_mprod,
             'categoria': producto.categoria_fk.nombre,
-            'modelo': modelo,
-            'es_nuevo': not es_producto_existente
-        }
+            'modelo': linea['modelo'],
+            'es_nuevo': linea['es_nuevo']
+        })
+    return productos_agregados
 
 # Reemplazar la función anterior
 def generate_codigo_interno(producto, bodega):
@@ -2524,74 +2654,20 @@ def generar_codigo_automatico(request):
 def producto_por_codigo_unico(request, codigo_interno):
     """Endpoint para obtener producto por código interno único"""
     try:
-        # Limpiar el código interno
+        # Limpiar el código interno de espacios y caracteres especiales
         codigo_limpio = codigo_interno.strip().upper()
+        bodega_id, sucursal_id = ubicacion_escaneo(request)
         
-        # Buscar producto por código interno
-        producto = Productos.objects.get(codigo_interno=codigo_limpio, activo=True)
-        
-        # Obtener stock actual
-        stock_actual = 0
-        stock_minimo = 0
-        stock_maximo = 0
-        ubicacion = None
-        
-        try:
-            stock_obj = Stock.objects.get(productos_fk=producto)
-            stock_actual = float(stock_obj.stock)
-            stock_minimo = float(stock_obj.stock_minimo) if stock_obj.stock_minimo else 0
-            stock_maximo = float(stock_obj.stock_maximo) if stock_obj.stock_maximo else 0
-            
-            # Determinar ubicación
-            if stock_obj.bodega_fk:
-                try:
-                    bodega = BodegaCentral.objects.get(id_bdg=stock_obj.bodega_fk)
-                    ubicacion = f"Bodega: {bodega.nombre_bdg}"
-                except BodegaCentral.DoesNotExist:
-                    ubicacion = "Bodega Central"
-            elif stock_obj.sucursal_fk:
-                try:
-                    sucursal = Sucursal.objects.get(id=stock_obj.sucursal_fk)
-                    ubicacion = f"Sucursal: {sucursal.nombre_sucursal}"
-                except Sucursal.DoesNotExist:
-                    ubicacion = "Sucursal"
-        except Stock.DoesNotExist:
-            ubicacion = "Sin ubicación asignada"
-        
-        # Determinar estado del stock
-        if stock_actual <= 0:
-            estado_stock = 'SIN_STOCK'
-            color_estado = '#ff4444'
-        elif stock_actual <= stock_minimo:
-            estado_stock = 'CRÍTICO'
-            color_estado = '#ff8800'
-        elif stock_actual <= stock_minimo * 1.5:
-            estado_stock = 'BAJO'
-            color_estado = '#ffaa00'
-        elif stock_maximo and stock_actual > stock_maximo:
-            estado_stock = 'SOBRE_STOCK'
-            color_estado = '#4caf50'
-        else:
-            estado_stock = 'NORMAL'
-            color_estado = '#00aa00'
+        # Producto, marca, categoría y stock por ubicación en una sola consulta (o desde el cache de escaneo)
+        filas = cache_escaneo.obtener(codigo_limpio, consultar_producto_escaneo)
+        if not filas:
+            raise Productos.DoesNotExist
         
         return Response({
-            'producto': {
-                'id': producto.id_prodc,
-                'nombre': producto.nombre_prodc,
-                'codigo_interno': producto.codigo_interno,
-                'descripcion': producto.descripcion_prodc,
-                'marca': producto.marca_fk.nombre_mprod,
-                'categoria': producto.categoria_fk.nombre,
-                'stock_actual': stock_actual,
-                'stock_minimo': stock_minimo,
-                'stock_maximo': stock_maximo,
-                'estado_stock': estado_stock,
-                'color_estado': color_estado,
-                'ubicacion': ubicacion,
-                'fecha_creacion': producto.fecha_creacion.isoformat() if producto.fecha_creacion else None
-            }
+            'producto': armar_payload_escaneo(filas, bodega_id, sucursal_id, con_maximo=True)
         })
+    except ValueError:
+        return Response({'error': 'bodega_id y sucursal_id deben ser numéricos'}, status=status.HTTP_400_BAD_REQUEST)
     except Productos.DoesNotExist:
         return Response({
             'error': 'Producto no encontrado',
@@ -2604,111 +2680,65 @@ def producto_por_codigo_unico(request, codigo_interno):
             'detalle': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# Columnas de cada candidato: producto, marca, categoría y stock de la bodega (anotar_stock)
+COLUMNAS_SIMILARES = COLUMNAS_BUSQUEDA + ('marca_fk', 'categoria_fk', 'bodega_fk', 'stock_actual', 'stock_minimo', 'stock_maximo')
+COLUMNAS_SIMILARES_SUCURSAL = COLUMNAS_BUSQUEDA + ('marca_fk', 'categoria_fk', 'sucursal_fk', 'stock_actual')
+
 def buscar_productos_similares(nombre, marca, categoria, bodega, codigo_interno=None, modelo=None):
     """
     Busca productos similares con prioridad correcta:
     1. Coincidencia exacta por código interno (máxima prioridad)
     2. Coincidencia exacta por nombre (alta prioridad)
-    3. Coincidencia por nombre, marca y categoría (baja prioridad)
+    3. Búsqueda aproximada por trigramas sobre nombre, código, marca y categoría (baja prioridad),
+       ordenada por similitud
+    Las prioridades 1 y 2 se resuelven en una consulta y la 3 en otra; cada una trae marca,
+    categoría y stock de la bodega. Retorna dicts con COLUMNAS_SIMILARES (y 'similitud' en la 3).
     """
     try:
-        queryset = Productos.objects.filter(bodega_fk=bodega, activo=True)
-        productos_con_stock = []
-        
-        # 1. PRIORIDAD MÁXIMA: Buscar por código interno exacto si se proporciona
+        queryset = anotar_stock(Productos.objects.filter(bodega_fk=bodega, activo=True), bodega_id=bodega.id_bdg)
+
+        # 1 y 2. El código interno es único: si coincide queda primero y se retorna solo
+        filtro = models.Q(nombre_prodc__iexact=nombre.strip())
         if codigo_interno:
-            productos_similares = queryset.filter(codigo_interno=codigo_interno)
-            if productos_similares.exists():
-                for producto in productos_similares[:10]:
-                    try:
-                        stock_obj = Stock.objects.get(productos_fk=producto, bodega_fk=bodega.id_bdg)
-                        stock_actual = float(stock_obj.stock)
-                        stock_minimo = float(stock_obj.stock_minimo) if stock_obj.stock_minimo else 0
-                        stock_maximo = float(stock_obj.stock_maximo) if stock_obj.stock_maximo else 0
-                    except Stock.DoesNotExist:
-                        stock_actual = 0
-                        stock_minimo = 0
-                        stock_maximo = 0
-                    productos_con_stock.append({
-                        'id': producto.id_prodc,
-                        'nombre': producto.nombre_prodc,
-                        'codigo_interno': producto.codigo_interno,
-                        'marca': producto.marca_fk.nombre_mprod,
-                        'categoria': producto.categoria_fk.nombre,
-                        'descripcion': producto.descripcion_prodc,
-                        'stock_actual': stock_actual,
-                        'stock_minimo': stock_minimo,
-                        'stock_maximo': stock_maximo,
-                        'fecha_creacion': producto.fecha_creacion.isoformat() if producto.fecha_creacion else None
-                    })
-                return productos_con_stock
-        
-        # 2. PRIORIDAD ALTA: Coincidencia exacta por nombre (sin importar marca/categoría)
-        nombre_normalizado = nombre.strip().lower()
-        productos_similares = queryset.filter(
-            nombre_prodc__iexact=nombre_normalizado
+            filtro |= models.Q(codigo_interno=codigo_interno)
+        exactos = list(
+            queryset.filter(filtro).alias(
+                por_codigo=models.ExpressionWrapper(models.Q(codigo_interno=codigo_interno or ''), output_field=models.BooleanField())
+            ).order_by('-por_codigo', 'id_prodc').values(*COLUMNAS_SIMILARES)[:11]
         )
-        
-        # Si encontramos productos con el mismo nombre, los retornamos
-        if productos_similares.exists():
-            for producto in productos_similares[:10]:
-                try:
-                    stock_obj = Stock.objects.get(productos_fk=producto, bodega_fk=bodega.id_bdg)
-                    stock_actual = float(stock_obj.stock)
-                    stock_minimo = float(stock_obj.stock_minimo) if stock_obj.stock_minimo else 0
-                    stock_maximo = float(stock_obj.stock_maximo) if stock_obj.stock_maximo else 0
-                except Stock.DoesNotExist:
-                    stock_actual = 0
-                    stock_minimo = 0
-                    stock_maximo = 0
-                productos_con_stock.append({
-                    'id': producto.id_prodc,
-                    'nombre': producto.nombre_prodc,
-                    'codigo_interno': producto.codigo_interno,
-                    'marca': producto.marca_fk.nombre_mprod,
-                    'categoria': producto.categoria_fk.nombre,
-                    'descripcion': producto.descripcion_prodc,
-                    'stock_actual': stock_actual,
-                    'stock_minimo': stock_minimo,
-                    'stock_maximo': stock_maximo,
-                    'fecha_creacion': producto.fecha_creacion.isoformat() if producto.fecha_creacion else None
-                })
-            return productos_con_stock
-        
-        # 3. PRIORIDAD BAJA: Solo si no encontramos por nombre, buscar por marca y categoría
-        if marca and categoria:
-            productos_similares = queryset.filter(
-                marca_fk__nombre_mprod__iexact=marca.strip().lower(),
-                categoria_fk__nombre__iexact=categoria.strip().lower()
-            )
-            for producto in productos_similares[:10]:
-                try:
-                    stock_obj = Stock.objects.get(productos_fk=producto, bodega_fk=bodega.id_bdg)
-                    stock_actual = float(stock_obj.stock)
-                    stock_minimo = float(stock_obj.stock_minimo) if stock_obj.stock_minimo else 0
-                    stock_maximo = float(stock_obj.stock_maximo) if stock_obj.stock_maximo else 0
-                except Stock.DoesNotExist:
-                    stock_actual = 0
-                    stock_minimo = 0
-                    stock_maximo = 0
-                productos_con_stock.append({
-                    'id': producto.id_prodc,
-                    'nombre': producto.nombre_prodc,
-                    'codigo_interno': producto.codigo_interno,
-                    'marca': producto.marca_fk.nombre_mprod,
-                    'categoria': producto.categoria_fk.nombre,
-                    'descripcion': producto.descripcion_prodc,
-                    'stock_actual': stock_actual,
-                    'stock_minimo': stock_minimo,
-                    'stock_maximo': stock_maximo,
-                    'fecha_creacion': producto.fecha_creacion.isoformat() if producto.fecha_creacion else None
-                })
-        
-        return productos_con_stock
+        if codigo_interno and exactos and exactos[0]['codigo_interno'] == codigo_interno:
+            return exactos[:1]
+        if exactos:
+            return exactos[:10]
+
+        # 3. PRIORIDAD BAJA: búsqueda aproximada (ej. "Taladro Bosch 500W" ~ "taladro bosch 500 w")
+        return buscar_productos_rankeados(queryset, nombre, marca, categoria, codigo_interno, columnas=COLUMNAS_SIMILARES)
     except Exception as e:
         logger.error(f"Error buscando productos similares: {str(e)}")
         return []
 
+def serializar_producto_similar(fila, ubicacion='bodega_fk'):
+    """
+    Mismo formato que ProductoBodegaSerializer (o ProductoSucursalSerializer con ubicacion='sucursal_fk')
+    a partir de una fila con stock anotado, sin volver a consultar producto ni stock
+    """
+    producto = {
+        'id_prodc': fila['id_prodc'],
+        'nombre_prodc': fila['nombre_prodc'],
+        'descripcion_prodc': fila['descripcion_prodc'],
+        'codigo_interno': fila['codigo_interno'],
+        'marca_fk': fila['marca_fk'],
+        'marca_nombre': fila['marca_fk__nombre_mprod'],
+        'categoria_fk': fila['categoria_fk'],
+        'categoria_nombre': fila['categoria_fk__nombre'],
+        ubicacion: fila[ubicacion],
+        'stock': float(fila['stock_actual']) if fila['stock_actual'] is not None else 0,
+        'fecha_creacion': fila['fecha_creacion'],
+    }
+    if 'similitud' in fila:
+        producto['similitud'] = fila['similitud']
+    return producto
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def buscar_productos_similares_endpoint(request):
@@ -2732,11 +2762,11 @@ def buscar_productos_similares_endpoint(request):
             return Response({
                 'error': 'Bodega no encontrada'
             }, status=status.HTTP_404_NOT_FOUND)
-        productos_similares_ids = buscar_productos_similares(nombre, marca, categoria, bodega, codigo_interno, modelo)
-        # Obtener los productos por ID
-        productos_queryset = Productos.objects.filter(codigo_interno__in=[p['codigo_interno'] for p in productos_similares_ids])
-        serializer = ProductoBodegaSerializer(productos_queryset, many=True, context={'request': request})
-        productos_serializados = serializer.data
+        # Se serializa directamente el resultado de la búsqueda, en el orden de prioridad/similitud
+        productos_serializados = [
+            serializar_producto_similar(fila)
+            for fila in buscar_productos_similares(nombre, marca, categoria, bodega, codigo_interno, modelo)
+        ]
         return Response({
             'productos_similares': productos_serializados,
             'total_encontrados': len(productos_serializados)
@@ -2757,6 +2787,11 @@ def buscar_productos_similares_endpoint(request):
 def movimientos_inventario(request):
     """
     Lista los movimientos de inventario con filtros avanzados y estadísticas.
+
+    Paginación:
+      - offset/limit (por defecto).
+      - cursor: enviar paginacion=cursor en la primera página y luego el valor de
+        'siguiente_cursor' en el parámetro cursor (orden estable por fecha, id_mvin).
     """
     # Filtros básicos
     bodega_id = request.GET.get('bodega')
@@ -2772,8 +2807,15 @@ def movimientos_inventario(request):
     cantidad_max = request.GET.get('cantidad_max')
     
     # Paginación
-    limit = int(request.GET.get('limit', 200))
-    offset = int(request.GET.get('offset', 0))
+    try:
+        limit = int(request.GET.get('limit', 200))
+        offset = int(request.GET.get('offset', 0))
+    except (ValueError, TypeError):
+        return Response({'error': 'limit y offset deben ser numéricos'}, status=status.HTTP_400_BAD_REQUEST)
+    if limit < 1 or offset < 0:
+        return Response({'error': 'limit debe ser al menos 1 y offset no puede ser negativo'}, status=status.HTTP_400_BAD_REQUEST)
+    cursor = request.GET.get('cursor')
+    modo_cursor = bool(cursor) or request.GET.get('paginacion') == 'cursor'
 
     queryset = MovInventario.objects.all().select_related(
         'productos_fk', 'usuario_fk', 'productos_fk__bodega_fk', 'productos_fk__sucursal_fk'
@@ -2807,29 +2849,33 @@ def movimientos_inventario(request):
         elif tipo_movimiento == "AJUSTE":
             queryset = queryset.filter(cantidad=0)
 
-    # --- Calcula estadísticas ANTES del slicing ---
-    total_movimientos = queryset.count()
-    total_entradas = queryset.filter(cantidad__gt=0).count()
-    total_salidas = queryset.filter(cantidad__lt=0).count()
-    total_ajustes = queryset.filter(cantidad=0).count()
-    suma_entradas = queryset.filter(cantidad__gt=0).aggregate(
-        total=models.Sum('cantidad')
-    )['total'] or 0
-    suma_salidas = abs(queryset.filter(cantidad__lt=0).aggregate(
-        total=models.Sum('cantidad')
-    )['total'] or 0)
-
-    # --- FILTRAR DUPLICADOS: dejar solo el movimiento más antiguo por grupo clave ---
-    # Agrupar por producto, cantidad, fecha (día), usuario y motivo, y obtener el id_mvin más bajo (más antiguo)
-    ids_unicos = queryset.values(
-        'productos_fk', 'cantidad', 'fecha', 'usuario_fk', 'motivo'
-    ).annotate(
-        min_id=Min('id_mvin')
-    ).values_list('min_id', flat=True)
-    queryset = queryset.filter(id_mvin__in=ids_unicos)
+    # --- Calcula estadísticas ANTES del slicing (una sola consulta) ---
+    estadisticas = estadisticas_movimientos_cacheadas(queryset, {
+        'bodega': bodega_id,
+        'sucursal': sucursal_id,
+        'producto': producto_id,
+        'usuario': usuario_id,
+        'tipo_movimiento': tipo_movimiento,
+        'fecha_inicio': fecha_inicio,
+        'fecha_fin': fecha_fin,
+        'cantidad_min': cantidad_min,
+        'cantidad_max': cantidad_max,
+    })
+    suma_entradas = estadisticas['suma_entradas']
+    suma_salidas = estadisticas['suma_salidas']
+
+    # Los duplicados se evitan al escribir (clave_idempotencia); los históricos se eliminan con
+    # el comando depurar_movimientos_duplicados, por lo que aquí no se agrupa.
 
     # --- Solo aquí aplica el slicing para la respuesta ---
-    queryset = queryset.order_by('-fecha')[offset:offset + limit]
+    siguiente_cursor = None
+    if modo_cursor:
+        try:
+            queryset, siguiente_cursor = paginar_movimientos_por_cursor(queryset, cursor, limit)
+        except CursorInvalido as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        queryset = queryset.order_by('-fecha', '-id_mvin')[offset:offset + limit]
 
     serializer = MovInventarioSerializer(queryset, many=True)
     
@@ -2837,17 +2883,17 @@ def movimientos_inventario(request):
     response_data = {
         'movimientos': serializer.data,
         'estadisticas': {
-            'total_movimientos': total_movimientos,
+            'total_movimientos': estadisticas['total_movimientos'],
             'entradas': {
-                'cantidad': total_entradas,
+                'cantidad': estadisticas['entradas'],
                 'unidades': suma_entradas
             },
             'salidas': {
-                'cantidad': total_salidas,
+                'cantidad': estadisticas['salidas'],
                 'unidades': suma_salidas
             },
             'ajustes': {
-                'cantidad': total_ajustes,
+                'cantidad': estadisticas['ajustes'],
                 'unidades': 0
             },
             'balance': suma_entradas - suma_salidas
@@ -2862,6 +2908,9 @@ def movimientos_inventario(request):
             'offset': offset
         }
     }
+    if modo_cursor:
+        response_data['siguiente_cursor'] = siguiente_cursor
+        response_data['hay_mas'] = siguiente_cursor is not None
     
     return Response(response_data)
 
@@ -2933,16 +2982,14 @@ class BuscarProductosSimilaresSucursalView(APIView):
                 serializer = ProductoSucursalSerializer(productos_similares, many=True, context={'request': request})
                 return Response({'productos_similares': serializer.data}, status=status.HTTP_200_OK)
 
-        # PRIORIDAD 4: Marca y categoría (icontains)
-        if marca and categoria:
-            productos_similares = queryset.filter(
-                marca_fk__nombre_mprod__icontains=marca,
-                categoria_fk__nombre__icontains=categoria
-            )
-            serializer = ProductoSucursalSerializer(productos_similares, many=True, context={'request': request})
-            return Response({'productos_similares': serializer.data}, status=status.HTTP_200_OK)
-
-        return Response({'productos_similares': []}, status=status.HTTP_200_OK)
+        # PRIORIDAD 4: Búsqueda aproximada por trigramas (nombre, código, marca y categoría), top-k por similitud,
+        # con el stock de la sucursal en la misma consulta
+        candidatos = buscar_productos_rankeados(
+            anotar_stock(queryset, sucursal_id=sucursal_id), nombre, marca, categoria, codigo_interno,
+            columnas=COLUMNAS_SIMILARES_SUCURSAL
+        )
+        productos_similares = [serializar_producto_similar(fila, 'sucursal_fk') for fila in candidatos]
+        return Response({'productos_similares': productos_similares}, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -2986,13 +3033,14 @@ def historial_producto(request, producto_id):
 
         movimientos_serializer = MovInventarioSerializer(movimientos, many=True)
 
-        # Calcular estadísticas SOLO de esa ubicación
-        total_movimientos = movimientos.count()
-        entradas = movimientos.filter(cantidad__gt=0).count()
-        salidas = movimientos.filter(cantidad__lt=0).count()
-        ajustes = movimientos.filter(cantidad=0).count()
-        suma_entradas = movimientos.filter(cantidad__gt=0).aggregate(total=models.Sum('cantidad'))['total'] or 0
-        suma_salidas = abs(movimientos.filter(cantidad__lt=0).aggregate(total=models.Sum('cantidad'))['total'] or 0)
+        # Calcular estadísticas SOLO de esa ubicación (una sola consulta)
+        estadisticas = calcular_estadisticas_movimientos(movimientos)
+        total_movimientos = estadisticas['total_movimientos']
+        entradas = estadisticas['entradas']
+        salidas = estadisticas['salidas']
+        ajustes = estadisticas['ajustes']
+        suma_entradas = estadisticas['suma_entradas']
+        suma_salidas = estadisticas['suma_salidas']
 
         # Stock actual de la ubicación
         stock_actual = float(stock_obj.stock)
@@ -131,6 +131,56 @@ REST_FRAMEWORK = {
     'MAX_PAGE_SIZE': 1000, 
 }
 
+# Segundos que se reutilizan las estadísticas de movimientos-inventario para los mismos filtros (0 = sin cache)
+ESTADISTICAS_MOVIMIENTOS_CACHE_SEGUNDOS = 0
+
+# Notificaciones de stock crítico/máximo: se despachan por lotes en un hilo en segundo plano.
+# Con False quedan en la cola local hasta llamar a despachador_alertas_stock.procesar_pendientes()
+NOTIFICACIONES_STOCK_ASINCRONO = True
+NOTIFICACIONES_STOCK_TAMANO_LOTE = 200
+NOTIFICACIONES_STOCK_ESPERA_SEGUNDOS = 0.5
+
+# Extracción asíncrona de guías PDF (modo=async): procesos del pool y tiempo máximo por trabajo
+PDF_EXTRACCION_PROCESOS = 2
+PDF_EXTRACCION_TIMEOUT_SEGUNDOS = 60
+
+# Cache en disco de guías PDF ya procesadas (clave: SHA-256 del archivo). 0 desactiva el cache;
+# al superar el tamaño máximo se eliminan primero los resultados usados hace más tiempo
+PDF_CACHE_DIR = BASE_DIR / 'cache' / 'pdf_guias'
+PDF_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# Imágenes QR de productos ya generadas (clave: código interno). None desactiva el cache en disco
+QR_CACHE_DIR = BASE_DIR / 'cache' / 'qr'
+# Hilos que preparan las imágenes al exportar etiquetas QR (PDF/ZIP)
+QR_EXPORTACION_HILOS = 4
+# Máximo de productos por solicitud en productos-qr/lote/
+QR_LOTE_MAXIMO = 500
+
+# Máximo de líneas por solicitud en inventario/conteo/
+CONTEO_INVENTARIO_MAXIMO_LINEAS = 2000
+
+# Cache de códigos escaneados (producto_por_codigo, validar_codigo_producto, producto_por_codigo_unico):
+# máximo de códigos en memoria por proceso (0 lo desactiva), vigencia de cada entrada y alias
+# opcional de CACHES compartido entre workers (None = solo memoria del proceso)
+ESCANEO_CACHE_TAMANO = 1000
+ESCANEO_CACHE_SEGUNDOS = 60
+ESCANEO_CACHE_BACKEND = None
+
+# Búsqueda aproximada de productos similares: pg_trgm en PostgreSQL (False fuerza el cálculo en memoria),
+# similitud mínima de nombre o código para ser candidato y cantidad de candidatos retornados
+BUSQUEDA_PG_TRGM = True
+BUSQUEDA_SIMILITUD_MINIMA = 0.3
+BUSQUEDA_SIMILARES_LIMITE = 10
+
+# Índice en memoria del catálogo por bodega/sucursal (detección de duplicados al ingresar productos):
+# segundos tras los que se recarga una ubicación, para ver productos creados por otros workers
+CATALOGO_INDICE_SEGUNDOS = 300
+
+# Clasificador de marca/categoría de la extracción PDF: True agrega las marcas y categorías
+# de la BD (se reconstruye cada PDF_CLASIFICADOR_SEGUNDOS)
+PDF_CLASIFICADOR_DESDE_BD = False
+PDF_CLASIFICADOR_SEGUNDOS = 300
+
 CORS_ALLOW_METHODS = [
     'DELETE',
     'GET',